@@ -0,0 +1,79 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+# Modules the headless paths (export, convert, import, scripts using the
+# model) load
+MODULES = (
+    'desmoscurves.classes.bezier_curve',
+    'desmoscurves.export',
+    'desmoscurves.convert',
+    'desmoscurves.importer',
+)
+# Backends that must only load once the editor or clipboard is used
+LAZY = ('pygame', 'pyperclip')
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [name for name in {lazy!r} if name in sys.modules]]))
+'''
+
+
+def cold_import(module: str) -> Tuple[float, List[str]]:
+    # A fresh interpreter per run so nothing is already in sys.modules
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module, lazy=LAZY)],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    elapsed, loaded = json.loads(output)
+    return elapsed, loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Check cold import time of the non-GUI modules'
+    )
+    parser.add_argument(
+        '--budget',
+        type=float,
+        default=0.5,
+        help='seconds allowed per module import (default 0.5)',
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='runs per module; the fastest is kept (default 5)',
+    )
+    args = parser.parse_args()
+
+    failed = False
+    start = time.perf_counter()
+    for module in MODULES:
+        runs = [cold_import(module) for _ in range(args.repeat)]
+        elapsed = min(elapsed for elapsed, _ in runs)
+        loaded = sorted({name for _, names in runs for name in names})
+        status = 'ok'
+        if elapsed > args.budget:
+            status = f'over budget of {args.budget:.3f}s'
+            failed = True
+        if loaded:
+            status = 'loaded ' + ', '.join(loaded)
+            failed = True
+        print(f'{module:<40} {elapsed * 1000:8.1f} ms  {status}')
+    print(f'Total benchmark time: {time.perf_counter() - start:.1f}s')
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
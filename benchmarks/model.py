@@ -0,0 +1,318 @@
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from typing import Callable, Dict, List, Tuple
+from unittest import mock
+
+import numpy as np
+
+from desmoscurves.classes.bezier_curve import BezierCurve
+from desmoscurves.classes.enums import ClickType
+from desmoscurves.classes.history import HISTORY_FORMATS
+from desmoscurves.classes.position import Position
+from desmoscurves.constant import SIZE
+
+SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+# Clicks per interact run, cycling through these click types
+CLICKS = 100
+CLICK_TYPES = (
+    ClickType.MOUSE,
+    ClickType.GHOST,
+    ClickType.SHARP,
+    ClickType.ADD,
+    ClickType.REMOVE,
+)
+# Changes smaller than these never count as regressions, whatever the ratio
+MIN_SECONDS = 0.001
+MIN_BYTES = 1 << 20
+
+# (operation, anchors) -> seconds and peak bytes
+Results = Dict[Tuple[str, int], Dict[str, float]]
+
+
+def drawing(anchors: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    # A wandering smooth curve over the canvas, like a long hand drawing:
+    # every 10th anchor sharp and every 50th segment a ghost
+    rng = np.random.default_rng(seed)
+    angles = np.cumsum(rng.normal(0, 0.5, anchors))
+    steps = np.stack((np.cos(angles), np.sin(angles)), axis=1) * 20
+    points = np.cumsum(steps, axis=0) + np.divide(SIZE, 2)
+    # Fold the walk back onto the canvas
+    points = np.abs((points + SIZE) % np.multiply(SIZE, 2) - SIZE)
+    handles = steps * rng.uniform(0.2, 0.5, (anchors, 1))
+    handles[::10] = 0
+    positions = np.stack((points - handles, points, points + handles), axis=1)
+    ghosts = np.zeros(anchors, dtype=bool)
+    ghosts[50::50] = True
+    return positions, ghosts
+
+
+def curve_for(
+    name: str, anchors: int, save_format: str
+) -> Tuple[BezierCurve, np.ndarray, np.ndarray]:
+    curve = BezierCurve(name, array_backed=True, save_format=save_format)
+    positions, ghosts = drawing(anchors)
+    curve.set_arrays(positions, ghosts)
+    return curve, positions, ghosts
+
+
+def interact(curve: BezierCurve, points: np.ndarray) -> None:
+    # Clicks on existing points, with each left click that grabs an anchor
+    # dragged a little and released like in the editor
+    for clicked, click_type in zip(
+        points.tolist(), CLICK_TYPES * (len(points) // len(CLICK_TYPES) + 1)
+    ):
+        mouse = Position(*clicked)
+        curve.interact(mouse, click_type)
+        if curve.dragging is not None:
+            curve.motion(Position(mouse.x + 3, mouse.y + 2))
+            curve.end_drag()
+
+
+def operations(
+    directory: str, anchors: int, save_format: str
+) -> Dict[str, Tuple[Callable[[], Callable[[], object]], str]]:
+    # Each operation is a setup returning the call to time, so nothing
+    # built for a run is counted in it
+    name = os.path.join(directory, f'bench{anchors}')
+
+    def interact_setup() -> Callable[[], object]:
+        curve, positions, _ = curve_for(name, anchors, save_format)
+        rng = np.random.default_rng(1)
+        rows = rng.integers(0, anchors, CLICKS)
+        return lambda: interact(curve, positions[rows, 1])
+
+    def quadruplets_setup() -> Callable[[], object]:
+        curve, _, _ = curve_for(name, anchors, save_format)
+        return lambda: list(curve.quadruplets())
+
+    def formula_setup() -> Callable[[], object]:
+        curve, _, _ = curve_for(name, anchors, save_format)
+        return lambda: curve.curve_to_formula().save()
+
+    def cached_formula_setup() -> Callable[[], object]:
+        curve, _, _ = curve_for(name, anchors, save_format)
+        cache = {'DESMOSCURVES_CACHE': os.path.join(directory, 'cache')}
+        with mock.patch.dict(os.environ, cache):
+            curve.curve_to_formula()
+
+        def run() -> None:
+            with mock.patch.dict(os.environ, cache):
+                curve.curve_to_formula().save()
+
+        return run
+
+    def save_setup() -> Callable[[], object]:
+        curve, _, _ = curve_for(name, anchors, save_format)
+        remove(name)
+        return curve.save_progress
+
+    def save_edit_setup() -> Callable[[], object]:
+        curve, positions, ghosts = curve_for(name, anchors, save_format)
+        remove(name)
+        curve.save_progress()
+        positions[anchors // 2] += 5
+        curve.set_arrays(positions, ghosts)
+        return curve.save_progress
+
+    def load_setup() -> Callable[[], object]:
+        curve, _, _ = curve_for(name, anchors, save_format)
+        remove(name)
+        curve.save_progress()
+        loaded = BezierCurve(name, array_backed=True, save_format=save_format)
+        return lambda: loaded.load_drawing(1)
+
+    return {
+        'interact': (interact_setup, f'{CLICKS} clicks'),
+        'quadruplets': (quadruplets_setup, 'all segments'),
+        'curve_to_formula': (formula_setup, 'default answers'),
+        'curve_to_formula_cached': (cached_formula_setup, 'cache hit'),
+        'save_progress': (save_setup, 'new project'),
+        'save_progress_edit': (save_edit_setup, 'one anchor moved'),
+        'load_drawing': (load_setup, 'last save'),
+    }
+
+
+def remove(name: str) -> None:
+    for entry in os.listdir(os.path.dirname(name)):
+        if entry.startswith(os.path.basename(name) + '.'):
+            os.remove(os.path.join(os.path.dirname(name), entry))
+
+
+@contextlib.contextmanager
+def headless():
+    # Default answers to every export question, a clipboard that goes
+    # nowhere, no export cache unless an operation sets one and no
+    # printing, so runs need no terminal or display
+    clipboard = types.ModuleType('pyperclip')
+    clipboard.copy = lambda text: None
+    with mock.patch.object(
+        builtins, 'input', return_value=''
+    ), mock.patch.dict(sys.modules, pyperclip=clipboard), mock.patch.dict(
+        os.environ, DESMOSCURVES_CACHE=''
+    ), contextlib.redirect_stdout(
+        io.StringIO()
+    ):
+        yield
+
+
+def measure(
+    setup: Callable[[], Callable[[], object]], repeat: int
+) -> Dict[str, float]:
+    # Fastest of repeat timed runs, then one more run under tracemalloc
+    # for the peak memory, since tracing slows everything down
+    seconds = []
+    for _ in range(repeat):
+        run = setup()
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    run = setup()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(seconds), 'peak_bytes': peak}
+
+
+def compare(
+    results: Results, baseline: Results, tolerance: float
+) -> List[str]:
+    # Descriptions of everything slower or bigger than the baseline by
+    # more than tolerance, as a fraction
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric, floor in (
+            ('seconds', MIN_SECONDS),
+            ('peak_bytes', MIN_BYTES),
+        ):
+            now, before = result[metric], baseline[key][metric]
+            if now > before * (1 + tolerance) and now - before > floor:
+                regressions.append(
+                    f'{key[0]} with {key[1]} anchors: {metric} '
+                    f'{before:.4g} -> {now:.4g} ({now / before - 1:+.0%})'
+                )
+    return regressions
+
+
+def to_json(results: Results) -> List[Dict[str, object]]:
+    return [
+        {'operation': operation, 'anchors': anchors, **result}
+        for (operation, anchors), result in results.items()
+    ]
+
+
+def from_json(records: List[Dict[str, object]]) -> Results:
+    return {
+        (record['operation'], record['anchors']): {
+            'seconds': record['seconds'],
+            'peak_bytes': record['peak_bytes'],
+        }
+        for record in records
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Time the curve model, saving, loading and export on '
+        'synthetic drawings'
+    )
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=SIZES,
+        help='anchor counts of the drawings (default '
+        + ' '.join(map(str, SIZES))
+        + ')',
+    )
+    parser.add_argument(
+        '--operations',
+        nargs='+',
+        help='only run these operations (default all)',
+    )
+    parser.add_argument(
+        '--save-format',
+        choices=HISTORY_FORMATS,
+        default='journal',
+        help='file format for the saves (default journal)',
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='timed runs per operation; the fastest is kept (default 3)',
+    )
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument(
+        '--baseline',
+        help='JSON file from an earlier --output to compare against',
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.25,
+        help='fraction slower or bigger than the baseline counted as a '
+        'regression (default 0.25)',
+    )
+    args = parser.parse_args()
+
+    results: Results = {}
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        for anchors in args.sizes:
+            for operation, (setup, workload) in operations(
+                directory, anchors, args.save_format
+            ).items():
+                if args.operations and operation not in args.operations:
+                    continue
+                with headless():
+                    result = measure(setup, args.repeat)
+                results[operation, anchors] = result
+                print(
+                    f'{operation:<23} {anchors:>8} anchors '
+                    f'{result["seconds"] * 1000:10.1f} ms '
+                    f'{result["peak_bytes"] / (1 << 20):9.1f} MB  '
+                    f'{workload}'
+                )
+    print(f'Total benchmark time: {time.perf_counter() - start:.1f}s')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(
+                {
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'save_format': args.save_format,
+                    'results': to_json(results),
+                },
+                file,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = from_json(json.load(file)['results'])
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+import math
+from typing import Iterable, List, MutableSequence, Tuple, overload
+
+import numpy as np
+
+from .anchor import Anchor
+from .enums import PointType
+from .position import Position
+
+
+def column(point_type: PointType) -> int:
+    # Columns of position arrays follow PointType: reverse handle, point,
+    # handle
+    return point_type.value - 1
+
+
+def pack(anchors: Iterable[Anchor]) -> Tuple[np.ndarray, np.ndarray]:
+    # (n, 3, 2) positions with NaN for missing handles and (n,) ghost flags
+    values: List[float] = []
+    ghosts: List[bool] = []
+    nan = float('nan')
+    for anchor in anchors:
+        for position in (anchor.reverse_handle, anchor.point, anchor.handle):
+            if position is None:
+                values += nan, nan
+            else:
+                values += position.x, position.y
+        ghosts.append(anchor.ghost)
+    positions = np.array(values, dtype=np.float64).reshape(-1, 3, 2)
+    return positions, np.array(ghosts, dtype=bool)
+
+
+def unpack(positions: np.ndarray, ghosts: np.ndarray) -> List[Anchor]:
+    anchors = []
+    for row, ghost in zip(positions.tolist(), ghosts.tolist()):
+        reverse_handle, point, handle = (
+            None if math.isnan(x) else Position(x, y) for x, y in row
+        )
+        anchors.append(Anchor(reverse_handle, point, handle, ghost))
+    return anchors
+
+
+def assign(anchors: Iterable[Anchor], positions: np.ndarray) -> None:
+    # Writes (n, 3, 2) positions back into the existing positions of plain
+    # anchors, the reverse of pack; missing handles stay missing
+    for anchor, row in zip(anchors, positions.tolist()):
+        for position, (x, y) in zip(
+            (anchor.reverse_handle, anchor.point, anchor.handle), row
+        ):
+            if position is not None:
+                position.x = x
+                position.y = y
+
+
+class PositionView(Position):
+    # Position whose coordinates live in an AnchorArray
+    def __init__(self, anchor: 'AnchorView', column: int) -> None:
+        self._anchor = anchor
+        self._column = column
+
+    @property
+    def x(self) -> float:
+        anchor = self._anchor
+        return float(anchor._store._positions[anchor._slot, self._column, 0])
+
+    @x.setter
+    def x(self, value: float) -> None:
+        anchor = self._anchor
+        anchor._store._positions[anchor._slot, self._column, 0] = value
+
+    @property
+    def y(self) -> float:
+        anchor = self._anchor
+        return float(anchor._store._positions[anchor._slot, self._column, 1])
+
+    @y.setter
+    def y(self, value: float) -> None:
+        anchor = self._anchor
+        anchor._store._positions[anchor._slot, self._column, 1] = value
+
+
+class AnchorView(Anchor):
+    # Anchor backed by one slot of an AnchorArray
+    def __init__(self, store: 'AnchorArray', slot: int) -> None:
+        self._store = store
+        self._slot = slot
+
+    def _get(self, point_type: PointType) -> Position | None:
+        index = column(point_type)
+        if np.isnan(self._store._positions[self._slot, index, 0]):
+            return None
+        return PositionView(self, index)
+
+    def _set(self, point_type: PointType, position: Position | None) -> None:
+        values = (np.nan, np.nan) if position is None else position.tup
+        self._store._positions[self._slot, column(point_type)] = values
+
+    @property
+    def reverse_handle(self) -> Position | None:
+        return self._get(PointType.REVERSE_HANDLE)
+
+    @reverse_handle.setter
+    def reverse_handle(self, position: Position | None) -> None:
+        self._set(PointType.REVERSE_HANDLE, position)
+
+    @property
+    def point(self) -> Position | None:
+        return self._get(PointType.POINT)
+
+    @point.setter
+    def point(self, position: Position | None) -> None:
+        self._set(PointType.POINT, position)
+
+    @property
+    def handle(self) -> Position | None:
+        return self._get(PointType.HANDLE)
+
+    @handle.setter
+    def handle(self, position: Position | None) -> None:
+        self._set(PointType.HANDLE, position)
+
+    @property
+    def ghost(self) -> bool:
+        return bool(self._store._ghosts[self._slot])
+
+    @ghost.setter
+    def ghost(self, ghost: bool) -> None:
+        self._store._ghosts[self._slot] = ghost
+
+
+class AnchorArray(MutableSequence[Anchor]):
+    # Struct-of-arrays anchor storage. Anchors live in slots of contiguous
+    # float64/bool arrays and are handed out as views, so the list API of
+    # BezierCurve.anchors keeps working. Slots never move while an anchor is
+    # in the array; curve order is kept separately in _order.
+    def __init__(self, anchors: Iterable[Anchor] = ()) -> None:
+        self._positions, self._ghosts = pack(anchors)
+        self._order = np.arange(len(self._ghosts), dtype=np.intp)
+        self._views: List[AnchorView | None] = [None] * len(self._ghosts)
+        self._free: List[int] = []
+
+    @classmethod
+    def from_arrays(
+        cls, positions: np.ndarray, ghosts: np.ndarray
+    ) -> 'AnchorArray':
+        store = cls()
+        store._positions = np.array(positions, dtype=np.float64)
+        store._ghosts = np.array(ghosts, dtype=bool)
+        store._order = np.arange(len(store._ghosts), dtype=np.intp)
+        store._views = [None] * len(store._ghosts)
+        return store
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    @overload
+    def __getitem__(self, index: int) -> Anchor: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Anchor]: ...
+
+    def __getitem__(self, index: int | slice) -> Anchor | List[Anchor]:
+        if isinstance(index, slice):
+            return [self.view(slot) for slot in self._order[index].tolist()]
+        return self.view(int(self._order[index]))
+
+    def __setitem__(self, index: int, anchor: Anchor) -> None:
+        slot = self._allocate(anchor)
+        self._release(int(self._order[index]))
+        self._order[index] = slot
+
+    def __delitem__(self, index: int) -> None:
+        self._release(int(self._order[index]))
+        self._order = np.delete(self._order, index)
+
+    def insert(self, index: int, anchor: Anchor) -> None:
+        # Match list.insert clamping for out of range indexes
+        index = min(
+            max(index + len(self) if index < 0 else index, 0), len(self)
+        )
+        self._order = np.insert(self._order, index, self._allocate(anchor))
+
+    def index(
+        self, anchor: Anchor, start: int = 0, stop: int | None = None
+    ) -> int:
+        if not isinstance(anchor, AnchorView) or anchor._store is not self:
+            return super().index(
+                anchor, start, len(self) if stop is None else stop
+            )
+        matches = np.flatnonzero(self._order[start:stop] == anchor._slot)
+        if len(matches) == 0:
+            raise ValueError('Anchor is not in array')
+        return int(matches[0]) + start
+
+    def clear(self) -> None:
+        for slot in self._order.tolist():
+            self._detach(slot)
+        self._positions = np.empty((0, 3, 2), dtype=np.float64)
+        self._ghosts = np.empty(0, dtype=bool)
+        self._order = np.empty(0, dtype=np.intp)
+        self._views = []
+        self._free = []
+
+    @property
+    def positions(self) -> np.ndarray:
+        # (n, 3, 2) copy in curve order; NaN where a handle is missing
+        return self._positions[self._order]
+
+    @property
+    def ghosts(self) -> np.ndarray:
+        return self._ghosts[self._order]
+
+    def take(self, indexes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Positions and ghost flags of the anchors at these curve indexes
+        slots = self._order[indexes]
+        return self._positions[slots], self._ghosts[slots]
+
+    def slots(self, anchors: Iterable[Anchor]) -> np.ndarray:
+        slots = []
+        for anchor in anchors:
+            if not isinstance(anchor, AnchorView) or anchor._store is not self:
+                raise ValueError('Anchor is not in array')
+            slots.append(anchor._slot)
+        return np.array(slots, dtype=np.intp)
+
+    def gather(self, slots: np.ndarray) -> np.ndarray:
+        # (k, 3, 2) positions of the anchors in slots
+        return self._positions[slots]
+
+    def scatter(self, slots: np.ndarray, positions: np.ndarray) -> None:
+        self._positions[slots] = positions
+
+    def mask(self, slots: np.ndarray) -> np.ndarray:
+        # (n,) flags in curve order of the anchors in slots
+        return np.isin(self._order, slots)
+
+    def view(self, slot: int) -> AnchorView:
+        view = self._views[slot]
+        if view is None:
+            view = self._views[slot] = AnchorView(self, slot)
+        return view
+
+    def _allocate(self, anchor: Anchor) -> int:
+        if not self._free:
+            capacity = len(self._ghosts)
+            grow = max(capacity, 16)
+            self._positions = np.concatenate(
+                (self._positions, np.full((grow, 3, 2), np.nan))
+            )
+            self._ghosts = np.concatenate(
+                (self._ghosts, np.zeros(grow, dtype=bool))
+            )
+            self._views += [None] * grow
+            self._free = list(range(capacity + grow - 1, capacity - 1, -1))
+        slot = self._free.pop()
+        positions, ghosts = pack((anchor,))
+        self._positions[slot] = positions[0]
+        self._ghosts[slot] = ghosts[0]
+        return slot
+
+    def _release(self, slot: int) -> None:
+        self._detach(slot)
+        self._positions[slot] = np.nan
+        self._ghosts[slot] = False
+        self._free.append(slot)
+
+    def _detach(self, slot: int) -> None:
+        # A removed anchor keeps working on its own copy of the data, like an
+        # anchor removed from a list, instead of aliasing a reused slot
+        view = self._views[slot]
+        if view is None:
+            return
+        self._views[slot] = None
+        store = AnchorArray()
+        store._positions = self._positions[slot : slot + 1].copy()
+        store._ghosts = self._ghosts[slot : slot + 1].copy()
+        store._order = np.zeros(1, dtype=np.intp)
+        store._views = [view]
+        view._store = store
+        view._slot = 0
@@ -0,0 +1,70 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Tuple
+
+from .project import Project, ProjectSnapshot, SaveState
+
+
+class BackgroundSaver:
+    # Runs every history read and write of a project on one worker thread,
+    # in the order they were asked for, so the editor never waits on the
+    # disk. Saves hand the worker the arrays of the changed layers taken at
+    # the time of the save.
+    def __init__(self, project: Project) -> None:
+        self.project = project
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='desmoscurves-saver'
+        )
+        self.prefetched: Dict[int, Future] = {}
+        self.pending: Future | None = None
+
+    def save(self) -> Future:
+        # Layers only count as saved once the worker has written them, so a
+        # failed save leaves them dirty for the next one
+        self.finish()
+        state = self.project.capture()
+        revisions = self.project.revisions()
+        # Lookbehinds count from the newest save, so prefetches go stale
+        self.prefetched.clear()
+        self.pending = self.executor.submit(self._save, state, revisions)
+        return self.pending
+
+    def finish(self) -> bool:
+        # Waits for the last save and reports it if it failed; False then
+        pending, self.pending = self.pending, None
+        if pending is None:
+            return True
+        try:
+            pending.result()
+        except OSError as error:
+            print(f'Could not save progress: {error}')
+            return False
+        return True
+
+    def load(self, lookbehind: int) -> bool:
+        # Same results as BezierCurve.load_drawing. The next lookbehind is
+        # read in the background so repeated loads come back immediately.
+        future = self.prefetched.pop(lookbehind, None)
+        if future is None:
+            future = self.executor.submit(self._load, lookbehind)
+        exists, snapshot = future.result()
+        if not exists:
+            return False
+        self.prefetched[lookbehind + 1] = self.executor.submit(
+            self._load, lookbehind + 1
+        )
+        return self.project.restore(lookbehind, snapshot)
+
+    def close(self) -> None:
+        self.finish()
+        self.prefetched.clear()
+        self.executor.shutdown(wait=True)
+
+    def _save(self, state: SaveState, revisions: Dict[int, int]) -> bool:
+        saved = self.project.write(state)
+        self.project.mark_saved(revisions)
+        print('Saved progress' if saved else 'Nothing new to save')
+        return saved
+
+    def _load(self, lookbehind: int) -> Tuple[bool, ProjectSnapshot | None]:
+        project = self.project
+        return project.exists(), project.load(lookbehind)
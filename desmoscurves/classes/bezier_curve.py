@@ -1,90 +1,158 @@
 import dataclasses
-import json
+import hashlib
 import math
-import os
-from typing import Any, Dict, Generator, List, Tuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    MutableSequence,
+    TextIO,
+    Tuple,
+)
 
-import dacite
+import numpy as np
 
 from ..constant import (
-    BEZIER_EQUATION,
-    BEZIER_PARAMETRIC,
-    BEZIER_SUM_EQUATION,
+    ARC_LENGTH_EQUATIONS,
+    ARC_LENGTH_MAX_SEGMENTS,
+    ARC_LENGTH_TOLERANCE,
+    BEZIER_FLATNESS,
     DRAG_TOLERANCE,
-    GHOST_EQUATION,
+    FORMULA_CHUNK_SIZE,
+    FORMULA_MAX_SEGMENTS,
+    FORMULA_MODES,
     HANDLE_RADIUS,
-    MAX_SAVES,
     NEW_HANDLE_RADIUS,
     POINT_RADIUS,
     SIZE,
-    STEP_EQUATION,
     UNSHARP_OFFSET,
+    WARP,
+    WARP_TABLE,
 )
 from .anchor import Anchor
+from .anchor_array import AnchorArray, assign, pack, unpack
+from .commands import (
+    Command,
+    CommandLog,
+    Edit,
+    Move,
+    copy_anchor,
+    restore_anchor,
+)
 from .enums import ClickType, PointType
+from .export_cache import ExportOptions, cached_formula
 from .formula import Formula
+from .history import History, Snapshot, open_history
 from .position import Position
+from .sampling import (
+    Polyline,
+    arc_length_tables,
+    flatness_steps,
+    sample_segments,
+    segment_arc_lengths,
+)
+from .selection import Selection, rotation
+from .simplify import simplify
+from .spatial_index import SpatialIndex
 
 
 class BezierCurve:
-    def __init__(self, name: str) -> None:
-        self.anchors: List[Anchor] = []
+    def __init__(
+        self,
+        name: str,
+        array_backed: bool = False,
+        save_format: str = 'journal',
+    ) -> None:
+        self.array_backed = array_backed
+        self.save_format = save_format
+        self._history: History | None = None
+        self.anchors: MutableSequence[Anchor] = (
+            AnchorArray() if array_backed else []
+        )
         self.dragging: Tuple[Anchor, PointType] | None = None
+        # Row of the dragged anchor, found once when the drag starts
+        self.drag_index: int | None = None
+        # The dragged anchor as it was when the drag started
+        self.drag_before: Anchor | None = None
         self.name = name
+        self.index = SpatialIndex()
+        # Rows of list-backed anchors by identity, known below _rows_known.
+        # Inserts and deletes only forget the rows from where they happen.
+        self._rows: Dict[int, int] = {}
+        self._rows_known = 0
+        self.selection = Selection()
+        self.commands = CommandLog()
+        # Counts edits, so views of the curve can tell when it changed. A
+        # drag counts once, when it ends; until then only the dragged
+        # anchor moves.
+        self.revision = 0
+        # Segments last measured, their lengths and the tolerance used
+        self._lengths: Tuple[np.ndarray, np.ndarray, float] | None = None
 
     def interact(
         self, mouse: Position, click_type: ClickType, zoom: float | int = 1
     ) -> None:
-        for anchor in self.anchors:
-            if (
-                anchor.point
-                and math.dist(mouse.tup, anchor.point.tup)
-                <= (POINT_RADIUS + DRAG_TOLERANCE) / zoom
-            ):
-                point_type = PointType.POINT
-                break
-            elif (
-                anchor.reverse_handle
-                and math.dist(mouse.tup, anchor.reverse_handle.tup)
-                <= (HANDLE_RADIUS + DRAG_TOLERANCE) / zoom
-            ):
-                point_type = PointType.REVERSE_HANDLE
-                break
-            elif (
-                anchor.handle
-                and math.dist(mouse.tup, anchor.handle.tup)
-                <= (HANDLE_RADIUS + DRAG_TOLERANCE) / zoom
-            ):
-                point_type = PointType.HANDLE
-                break
-        else:
+        hit = self.index.hit_test(
+            mouse,
+            (POINT_RADIUS + DRAG_TOLERANCE) / zoom,
+            (HANDLE_RADIUS + DRAG_TOLERANCE) / zoom,
+        )
+        if hit is None:
             if click_type == ClickType.MOUSE:
                 self.add_anchor(mouse)
             return
+        anchor, point_type = hit
 
         if click_type == ClickType.MOUSE:
             if anchor.handle is None or anchor.reverse_handle is None:
+                before = copy_anchor(anchor)
                 anchor.reverse_handle = anchor.point.copy()
                 anchor.handle = anchor.point.copy()
+                self.index.update(anchor)
+                self.record_edit(self.anchor_index(anchor), before)
             else:
                 self.dragging = anchor, point_type
+                self.drag_index = self.anchor_index(anchor)
+                self.drag_before = copy_anchor(anchor)
         if click_type == ClickType.REMOVE:
-            self.anchors.remove(anchor)
+            anchor_index = self.anchor_index(anchor)
+            self.commands.record(Edit(anchor_index, copy_anchor(anchor), None))
+            self.revision += 1
+            del self.anchors[anchor_index]
+            self.rows_moved(anchor_index)
+            self.index.remove(anchor)
+            self.selection.discard(anchor)
+            if self.dragging is not None and self.dragging[0] is anchor:
+                self.dragging = None
+                self.drag_index = None
+                self.drag_before = None
+            elif (
+                self.drag_index is not None
+                and anchor_index < self.drag_index
+            ):
+                self.drag_index -= 1
         elif click_type == ClickType.GHOST:
+            before = copy_anchor(anchor)
             anchor.ghost = not anchor.ghost
+            self.record_edit(self.anchor_index(anchor), before)
         elif (
             click_type == ClickType.SHARP
             and anchor.reverse_handle is not None
             and anchor.handle is not None
         ):
+            before = copy_anchor(anchor)
             if math.dist(anchor.point.tup, anchor.handle.tup) > 1:
                 anchor.handle.convert(anchor.point)
             else:
                 anchor.handle.x = anchor.point.x + UNSHARP_OFFSET[0]
                 anchor.handle.y = anchor.point.y + UNSHARP_OFFSET[1]
             anchor.reverse_handle.convert(anchor.point.flip(anchor.handle))
+            self.index.update(anchor)
+            self.record_edit(self.anchor_index(anchor), before)
         elif click_type == ClickType.ADD:
-            anchor_index = self.anchors.index(anchor)
+            anchor_index = self.anchor_index(anchor)
             if anchor_index == len(self.anchors) - 1:
                 return
             next_anchor = self.anchors[anchor_index + 1]
@@ -101,26 +169,71 @@ class BezierCurve:
                 ),
             )
             self.anchors.insert(anchor_index + 1, new_anchor)
+            self.rows_moved(anchor_index + 1)
+            if self.drag_index is not None and anchor_index < self.drag_index:
+                self.drag_index += 1
+            self.index.insert(self.anchors[anchor_index + 1])
+            self.record_edit(anchor_index + 1, None)
+
+    def anchor_index(self, anchor: Anchor) -> int:
+        if isinstance(self.anchors, AnchorArray):
+            return self.anchors.index(anchor)
+        # Anchors compare by value, so look up by identity
+        row = self._rows.get(id(anchor))
+        if row is None or row >= self._rows_known:
+            known = self._rows_known
+            if known == 0:
+                self._rows.clear()
+            rows = range(known, len(self.anchors))
+            self._rows.update(zip(map(id, self.anchors[known:]), rows))
+            self._rows_known = len(self.anchors)
+            row = self._rows.get(id(anchor))
+        if row is None or self.anchors[row] is not anchor:
+            raise ValueError('Anchor is not part of this curve')
+        return row
+
+    def rows_moved(self, index: int) -> None:
+        # Anchors from index on were inserted, deleted or shifted
+        self._rows_known = min(self._rows_known, index)
 
     def add_anchor(self, point: Position) -> None:
+        before = None
         if len(self.anchors) == 0:
             # Nothing yet; add anchor with point with no handles
             self.anchors.append(Anchor(None, point, None))
         elif len(self.anchors) == 1 and self.anchors[0].handle is None:
             # One point with no handles; set handle to mouse and reverse
             # handle to flipped
+            before = copy_anchor(self.anchors[0])
             self.anchors[0].handle = point
             self.anchors[0].reverse_handle = self.anchors[0].point.flip(point)
+            self.index.update(self.anchors[0])
+            self.record_edit(0, before)
+            return
         elif self.anchors[-1].handle is not None:
             # Last anchor is complete; add new anchor with point
             self.anchors.append(Anchor(None, point, None))
         else:
             # Last anchor has point with no handles; set handle to mouse
             # and reverse handle to flipped
+            before = copy_anchor(self.anchors[-1])
             self.anchors[-1].handle = point
             self.anchors[-1].reverse_handle = self.anchors[-1].point.flip(
                 point
             )
+        self.index.update(self.anchors[-1])
+        self.record_edit(len(self.anchors) - 1, before)
+
+    def clear(self) -> None:
+        self.dragging = None
+        self.drag_index = None
+        self.drag_before = None
+        self.selection.clear()
+        self.commands.clear()
+        self.anchors.clear()
+        self.rows_moved(0)
+        self.index.rebuild(self.anchors)
+        self.revision += 1
 
     def motion(self, mouse: Position) -> None:
         if self.dragging is None:
@@ -142,6 +255,134 @@ class BezierCurve:
         elif point_type == PointType.REVERSE_HANDLE:
             anchor.reverse_handle.convert(mouse)
             anchor.handle.convert(anchor.point.flip(mouse))
+        self.index.update(anchor)
+
+    def end_drag(self) -> None:
+        # Records the whole drag as one edit, however many motions it took
+        if self.dragging is not None and self.drag_index is not None:
+            anchor = self.dragging[0]
+            if copy_anchor(anchor) != self.drag_before:
+                self.record_edit(self.drag_index, self.drag_before)
+        if self.dragging is not None:
+            self.revision += 1
+        self.dragging = None
+        self.drag_index = None
+        self.drag_before = None
+
+    def record_edit(self, index: int, before: Anchor | None) -> None:
+        # Logs the change from before to the anchor now at index
+        self.commands.record(
+            Edit(index, before, copy_anchor(self.anchors[index]))
+        )
+        self.revision += 1
+
+    def undo(self) -> bool:
+        # Returns False if there is nothing to undo
+        command = self.commands.undo()
+        if command is None:
+            return False
+        self.apply(command, reverse=True)
+        return True
+
+    def redo(self) -> bool:
+        command = self.commands.redo()
+        if command is None:
+            return False
+        self.apply(command)
+        return True
+
+    def apply(self, command: Command, reverse: bool = False) -> None:
+        # Moves the curve from the state before a command to the state after
+        # it, or back when reversing. Only the anchors in the command are
+        # touched, so an edit costs the same however long the curve is.
+        self.dragging = None
+        self.drag_index = None
+        self.drag_before = None
+        self.revision += 1
+        if isinstance(command, Move):
+            before, after = command.before, command.after
+            if reverse:
+                before, after = after, before
+            anchors = [
+                self.anchors[index] for index in command.indexes.tolist()
+            ]
+            self.move(anchors, before, after)
+            return
+
+        before, after = command.before, command.after
+        if reverse:
+            before, after = after, before
+        if before is None:
+            self.anchors.insert(command.index, copy_anchor(after))
+            self.rows_moved(command.index)
+            self.index.insert(self.anchors[command.index])
+        elif after is None:
+            anchor = self.anchors[command.index]
+            del self.anchors[command.index]
+            self.rows_moved(command.index)
+            self.index.remove(anchor)
+            self.selection.discard(anchor)
+        else:
+            anchor = self.anchors[command.index]
+            restore_anchor(anchor, after)
+            self.index.update(anchor)
+
+    def selected_mask(self) -> np.ndarray:
+        # (n,) flags in curve order of the selected anchors
+        if isinstance(self.anchors, AnchorArray):
+            return self.anchors.mask(self.anchors.slots(self.selection))
+        return np.array(
+            [anchor in self.selection for anchor in self.anchors], dtype=bool
+        )
+
+    def transform_selection(
+        self,
+        matrix: np.ndarray,
+        offset: Tuple[float, float] = (0, 0),
+    ) -> None:
+        # Moves every point, handle and reverse handle of the selection to
+        # matrix (p - center) + center + offset in one step, where center is
+        # the mean of the selected points
+        indexes = np.flatnonzero(self.selected_mask())
+        if not len(indexes):
+            return
+        anchors = [self.anchors[index] for index in indexes.tolist()]
+        if isinstance(self.anchors, AnchorArray):
+            previous = self.anchors.gather(self.anchors.slots(anchors))
+        else:
+            previous, _ = pack(anchors)
+        center = np.nanmean(previous[:, 1], axis=0)
+        positions = (previous - center) @ np.asarray(matrix).T
+        positions += center + offset
+        self.move(anchors, previous, positions)
+        self.commands.record(Move(indexes, previous, positions))
+
+    def move(
+        self,
+        anchors: List[Anchor],
+        previous: np.ndarray,
+        positions: np.ndarray,
+    ) -> None:
+        # Writes (k, 3, 2) positions into anchors that were at previous
+        if isinstance(self.anchors, AnchorArray):
+            self.anchors.scatter(self.anchors.slots(anchors), positions)
+        else:
+            assign(anchors, positions)
+        self.index.update_many(anchors, positions, previous)
+        self.revision += 1
+
+    def translate_selection(self, x: float, y: float) -> None:
+        self.transform_selection(np.identity(2), (x, y))
+
+    def scale_selection(self, factor: float) -> None:
+        self.transform_selection(np.identity(2) * factor)
+
+    def rotate_selection(self, degrees: float) -> None:
+        self.transform_selection(rotation(degrees))
+
+    def mirror_selection(self, horizontal: bool = True) -> None:
+        # Horizontal swaps left and right, otherwise top and bottom
+        self.transform_selection(np.diag((-1, 1) if horizontal else (1, -1)))
 
     def quadruplets(
         self,
@@ -155,151 +396,503 @@ class BezierCurve:
         if center is None:
             center = Position(0, 0)
 
-        last: Anchor = self.anchors[0]
-        for anchor in self.anchors[1:]:
-            incomplete = None in (
-                anchor.reverse_handle,
-                anchor.point,
-                anchor.handle,
-            )
-            if incomplete and last_point is None:
-                return
+        positions, ghosts, incomplete = self.screen_arrays(
+            center, zoom, last_point
+        )
+        segments, ghosts = self.segments(positions, ghosts)
+        for quadruplet, ghost, tentative in zip(
+            segments.tolist(), ghosts.tolist(), incomplete[1:].tolist()
+        ):
+            quadruplet = [tuple(position) for position in quadruplet]
+            yield quadruplet, ghost, tentative
 
-            quadruplet = [
-                (position.x, position.y)
-                for position in (
-                    last.point.centered(center, zoom),
-                    last.handle.centered(center, zoom),
-                    anchor.point.flip(last_point).centered(center, zoom)
-                    if incomplete
-                    else anchor.reverse_handle.centered(center, zoom),
-                    anchor.point.centered(center, zoom),
-                )
-            ]
-            yield quadruplet, anchor.ghost, incomplete
-            last = anchor
+    def screen_arrays(
+        self,
+        center: Position | None = None,
+        zoom: float | int = 1,
+        mouse: Position | None = None,
+        rows: np.ndarray | None = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # arrays(rows) mapped to the screen in one pass, with the handles of
+        # incomplete anchors following the (unmapped) mouse, plus the mask
+        # of those incomplete anchors
+        positions, ghosts = self.arrays(rows)
+        incomplete = np.isnan(positions).any(axis=(1, 2))
+        if mouse is not None and incomplete.any():
+            positions[incomplete, 0] = 2 * positions[incomplete, 1] - mouse.tup
+            positions[incomplete, 2] = mouse.tup
+        if center is not None:
+            Position.centered_array(positions, center, zoom, out=positions)
+        return positions, ghosts, incomplete
 
-    def curve_to_formula(self) -> Formula | None:
-        if len(self.anchors) < 2 or not self.anchors[-1].handle:
-            return
+    def arrays(
+        self, rows: np.ndarray | None = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # (n, 3, 2) reverse handle/point/handle positions with NaN for
+        # missing handles, and (n,) ghost flags, in curve order, or only
+        # those of the anchors at the indexes in rows
+        if isinstance(self.anchors, AnchorArray):
+            if rows is not None:
+                return self.anchors.take(rows)
+            return self.anchors.positions, self.anchors.ghosts
+        if rows is not None:
+            return pack(self.anchors[row] for row in rows.tolist())
+        return pack(self.anchors)
 
-        formula = (
-            STEP_EQUATION
-            + '\n'
-            + BEZIER_EQUATION
-            + '\n'
-            + BEZIER_SUM_EQUATION
-            + '\n'
-            + GHOST_EQUATION
-            + '\n'
+    def segments(
+        self,
+        positions: np.ndarray | None = None,
+        ghosts: np.ndarray | None = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # (m, 4, 2) control points and (m,) ghost flags of the complete
+        # segments, stopping at the first incomplete anchor
+        if positions is None or ghosts is None:
+            positions, ghosts = self.arrays()
+        count = self.segment_count(positions)
+        segments = np.stack(
+            (
+                positions[:count, 1],
+                positions[:count, 2],
+                positions[1 : count + 1, 0],
+                positions[1 : count + 1, 1],
+            ),
+            axis=1,
         )
+        return segments, ghosts[1 : count + 1]
 
-        include_response = (
-            input('Include setup formulae? (Y/N, default Y) ').strip().lower()
-        )
-        if include_response == 'n':
-            formula = ''
+    def sample(
+        self, steps: int | None = None, flatness: float = BEZIER_FLATNESS
+    ) -> Polyline:
+        # Points along every complete segment, either steps + 1 per segment
+        # or as few as keep the polyline within flatness of the curve
+        segments, ghosts = self.segments()
+        counts = flatness_steps(segments, flatness) if steps is None else steps
+        return sample_segments(segments, counts, ghosts)
+
+    def segment_lengths(
+        self, tolerance: float = ARC_LENGTH_TOLERANCE
+    ) -> np.ndarray:
+        # (m,) lengths in pixels of the complete segments, each within
+        # about tolerance pixels
+        segments, _ = self.segments()
+        return self.measured_lengths(segments, tolerance).copy()
+
+    def length(self, tolerance: float = ARC_LENGTH_TOLERANCE) -> float:
+        # Drawn length in pixels, leaving out ghost segments
+        segments, ghosts = self.segments()
+        return float(self.measured_lengths(segments, tolerance)[~ghosts].sum())
+
+    def measured_lengths(
+        self, segments: np.ndarray, tolerance: float
+    ) -> np.ndarray:
+        # Lengths of these segments, measuring only those that differ from
+        # the segments last measured at the same tolerance. With as many
+        # segments as then they are compared one by one; otherwise anchors
+        # were added or removed, and the segments before and after the
+        # first and last difference keep their lengths.
+        lengths = np.empty(len(segments))
+        measure = np.ones(len(segments), dtype=bool)
+        if self._lengths is not None and self._lengths[2] == tolerance:
+            before, measured, _ = self._lengths
+            if len(before) == len(segments):
+                measure = (before != segments).any(axis=(1, 2))
+                lengths[~measure] = measured[~measure]
+            else:
+                count = min(len(before), len(segments))
+                same = (before[:count] == segments[:count]).all(axis=(1, 2))
+                first = count if same.all() else int(np.argmin(same))
+                same = (
+                    before[len(before) - count :]
+                    == segments[len(segments) - count :]
+                ).all(axis=(1, 2))[::-1]
+                last = count if same.all() else int(np.argmin(same))
+                last = min(last, count - first)
+                lengths[:first] = measured[:first]
+                lengths[len(segments) - last :] = measured[
+                    len(before) - last :
+                ]
+                measure[:first] = False
+                measure[len(segments) - last :] = False
+        lengths[measure] = segment_arc_lengths(segments[measure], tolerance)
+        self._lengths = segments, lengths, tolerance
+        return lengths
 
-        round_response = input('Round values to? (default 5) ').strip()
-        round_places = int(round_response) if round_response.isdigit() else 5
+    @staticmethod
+    def segment_count(positions: np.ndarray) -> int:
+        # Segments before the first incomplete anchor
+        incomplete = np.flatnonzero(np.isnan(positions[1:]).any(axis=(1, 2)))
+        count = incomplete[0] if len(incomplete) else len(positions) - 1
+        return max(int(count), 0)
 
-        height_response = input(
-            'Height of screen in Desmos units? (default 10.0) '
-        ).strip()
-        height = (
-            float(height_response) if height_response.isdecimal() else 10.0
+    def can_export(self) -> bool:
+        return len(self.anchors) >= 2 and self.anchors[-1].handle is not None
+
+    def simplified(self, tolerance: float) -> 'BezierCurve':
+        # Copy of the curve with smooth anchors merged away while it stays
+        # within tolerance pixels of this one; trailing incomplete anchors
+        # are left as they are
+        positions, ghosts = self.arrays()
+        end = self.segment_count(positions) + 1
+        head_positions, head_ghosts = simplify(
+            positions[:end], ghosts[:end], tolerance
+        )
+        curve = BezierCurve(self.name, self.array_backed, self.save_format)
+        curve.set_arrays(
+            np.concatenate((head_positions, positions[end:])),
+            np.concatenate((head_ghosts, ghosts[end:])),
         )
+        return curve
 
-        quadruplets = list(self.quadruplets())
-        x_values, y_values = zip(
-            *(
-                position
-                for quadruplet, _, _ in quadruplets
-                for position in quadruplet[:-1]
-            )
+    def size_report(
+        self,
+        other: 'BezierCurve',
+        round_places: int = 5,
+        height: float = 10.0,
+        mode: str = 'sum',
+    ) -> str:
+        # How much smaller the formula of other is than this curve's
+        before = self.formula_length(False, round_places, height, mode)
+        after = other.formula_length(False, round_places, height, mode)
+        saved = 1 - after / before if before else 0
+        return (
+            f'{len(self.anchors)} -> {len(other.anchors)} anchors, '
+            f'formula {before} -> {after} characters ({saved:.0%} smaller)'
         )
-        ghosts = [
-            str(index)
-            for index, (_, ghost, _) in enumerate(quadruplets, 1)
-            if ghost
-        ]
 
-        formula += (
-            BEZIER_PARAMETRIC[0]
-            + str(len(self.anchors) - 1)
-            + BEZIER_PARAMETRIC[1]
-            + ', '.join(ghosts)
-            + BEZIER_PARAMETRIC[2]
-            + str(len(self.anchors) - 1)
-            + BEZIER_PARAMETRIC[3]
-            + ', '.join(
-                str(
-                    round(
-                        (value - SIZE[0] / 2) / SIZE[1] * height,
-                        round_places,
-                    )
+    def curve_to_formula(self) -> Formula | None:
+        if not self.can_export():
+            return
+
+        options = export_options()
+        (
+            include_setup,
+            round_places,
+            height,
+            mode,
+            max_segments,
+            tolerance,
+            arc_length,
+        ) = options
+
+        def make() -> Tuple[Formula | None, str]:
+            curve, report = self, ''
+            if tolerance > 0:
+                curve = self.simplified(tolerance)
+                report = 'Simplified: ' + self.size_report(
+                    curve, round_places, height, mode
                 )
-                for value in x_values + (self.anchors[-1].point.x,)
-            )
-            + BEZIER_PARAMETRIC[4]
-            + str(len(self.anchors) - 1)
-            + BEZIER_PARAMETRIC[5]
-            + ', '.join(
-                str(round((0.5 - value / SIZE[1]) * height, round_places))
-                for value in y_values + (self.anchors[-1].point.y,)
+            formula = curve.to_formula(
+                include_setup,
+                round_places,
+                height,
+                mode,
+                max_segments,
+                arc_length,
             )
-            + BEZIER_PARAMETRIC[6]
-        )
-        return Formula(formula)
+            return formula, report
 
-    def save_progress(self) -> None:
-        file_path = self.name + '.json'
-        if not os.path.exists(file_path):
-            with open(file_path, 'w') as file:
-                json.dump([], file)
-
-        with open(file_path, 'r') as file:
-            saves: List[List[Dict[str, float]]] = json.load(file)
-
-        save = [dataclasses.asdict(anchor) for anchor in self.anchors]
-
-        if (
-            saves
-            and len(save) == len(saves[-1])
-            and all(
-                anchor_dict == last_save_dict
-                for anchor_dict, last_save_dict in zip(
-                    save, saves[-1], strict=True
+        # Exporting the same anchors the same way again reads the cache
+        return cached_formula([self.arrays()], options, make)
+
+    def to_formula(
+        self,
+        include_setup: bool = True,
+        round_places: int = 5,
+        height: float = 10.0,
+        mode: str = 'sum',
+        max_segments: int = FORMULA_MAX_SEGMENTS,
+        arc_length: bool = False,
+    ) -> Formula | None:
+        if not self.can_export():
+            return
+        return Formula(
+            ''.join(
+                self.formula_chunks(
+                    include_setup,
+                    round_places,
+                    height,
+                    mode,
+                    max_segments,
+                    arc_length,
                 )
             )
+        )
+
+    def write_formula(
+        self,
+        sink: TextIO,
+        include_setup: bool = True,
+        round_places: int = 5,
+        height: float = 10.0,
+        mode: str = 'sum',
+        max_segments: int = FORMULA_MAX_SEGMENTS,
+        arc_length: bool = False,
+    ) -> bool:
+        # Streams the formula into anything with a write method; False if
+        # there is no complete curve to write
+        written = False
+        for chunk in self.formula_chunks(
+            include_setup,
+            round_places,
+            height,
+            mode,
+            max_segments,
+            arc_length,
         ):
-            print('Nothing new to save')
+            sink.write(chunk)
+            written = True
+        return written
+
+    def formula_length(
+        self,
+        include_setup: bool = True,
+        round_places: int = 5,
+        height: float = 10.0,
+        mode: str = 'sum',
+    ) -> int:
+        return sum(
+            map(
+                len,
+                self.formula_chunks(include_setup, round_places, height, mode),
+            )
+        )
+
+    def formula_chunks(
+        self,
+        include_setup: bool = True,
+        round_places: int = 5,
+        height: float = 10.0,
+        mode: str = 'sum',
+        max_segments: int = FORMULA_MAX_SEGMENTS,
+        arc_length: bool = False,
+    ) -> Generator[str, Any, None]:
+        # The formula in pieces of at most FORMULA_CHUNK_SIZE values, so
+        # its text never has to exist in memory all at once. Mode is a key
+        # of FORMULA_MODES: 'sum' lists ghost segment numbers, 'piecewise'
+        # gives every segment a mask value, 0 for ghosts. Curves longer
+        # than max_segments are written as several expressions, one per
+        # line (see expression_ranges). With arc_length, t is warped so
+        # that Desmos samples each expression evenly along its length
+        # instead of evenly per segment, through a table defined on the
+        # line before it (see ARC_LENGTH_EQUATIONS).
+        if not self.can_export():
             return
 
-        saves.append(save)
-        saves = saves[-MAX_SAVES:]
+        positions, ghosts = self.arrays()
+        # Point, handle, reverse handle, point, ... of the segments is the
+        # flattened anchor positions without the first reverse handle and
+        # the last handle
+        flat = positions.reshape(-1, 2)
+
+        def ghost_text(indexes: np.ndarray) -> str:
+            return ', '.join(map(str, (indexes + 1).tolist()))
+
+        def mask_text(block: np.ndarray) -> str:
+            return ', '.join(['1', '0'][ghost] for ghost in block.tolist())
+
+        def x_text(block: np.ndarray) -> str:
+            x_values = block[:, 0] - SIZE[0] / 2
+            x_values /= SIZE[1]
+            x_values *= height
+            return ', '.join(
+                str(round(value, round_places)) for value in x_values.tolist()
+            )
+
+        def y_text(block: np.ndarray) -> str:
+            y_values = 0.5 - block[:, 1] / SIZE[1]
+            y_values *= height
+            return ', '.join(
+                str(round(value, round_places)) for value in y_values.tolist()
+            )
+
+        def table_text(block: np.ndarray) -> str:
+            return ', '.join(
+                str(round(value, round_places)) for value in block.tolist()
+            )
+
+        _, parametric = FORMULA_MODES[mode]
+        if include_setup:
+            for equation in self.setup_equations(mode, arc_length):
+                yield equation + '\n'
+        count = self.segment_count(positions)
+        if arc_length:
+            # The tables would outgrow a Desmos list beyond this, so such
+            # expressions are split even when max_segments is 0
+            max_segments = min(
+                max_segments or ARC_LENGTH_MAX_SEGMENTS,
+                ARC_LENGTH_MAX_SEGMENTS,
+            )
+        ranges = self.expression_ranges(ghosts, count, max_segments)
+        if arc_length:
+            tables = arc_length_tables(
+                *self.segments(positions, ghosts), ranges
+            )
+        for number, (first, last) in enumerate(ranges):
+            values = flat[3 * first + 1 : 3 * last + 2]
+            if number:
+                yield '\n'
+            parameter = f'{last - first}t'
+            if arc_length:
+                table = tables[number]
+                name = table_name(values, ghosts[first + 1 : last + 1], table)
+                yield WARP_TABLE[0].format(name=name)
+                yield from self.join_chunks(table, table_text)
+                yield WARP_TABLE[1] + '\n'
+                parameter = WARP.format(name=name)
+            yield parametric[0] + parameter + parametric[1]
+            if mode == 'piecewise':
+                yield from self.join_chunks(
+                    ghosts[first + 1 : last + 1], mask_text
+                )
+            else:
+                yield from self.join_chunks(
+                    np.flatnonzero(ghosts[first + 1 : last + 1]), ghost_text
+                )
+            yield parametric[2] + parameter + parametric[3]
+            yield from self.join_chunks(values, x_text)
+            yield parametric[4] + parameter + parametric[5]
+            yield from self.join_chunks(values, y_text)
+            yield parametric[6]
+
+    @staticmethod
+    def setup_equations(
+        mode: str = 'sum', arc_length: bool = False
+    ) -> Tuple[str, ...]:
+        setup, _ = FORMULA_MODES[mode]
+        return setup + ARC_LENGTH_EQUATIONS if arc_length else setup
+
+    @staticmethod
+    def expression_ranges(
+        ghosts: np.ndarray, count: int, max_segments: int
+    ) -> List[Tuple[int, int]]:
+        # (first, last) segment ranges to write as separate expressions.
+        # Curves of up to max_segments segments (or any curve if it is 0)
+        # stay one expression. Longer ones are cut around their ghost
+        # segments, which draw nothing and so are left out, and then into
+        # pieces of at most max_segments segments.
+        if not max_segments or count <= max_segments:
+            return [(0, count)]
+        shown = np.concatenate(([False], ~ghosts[1 : count + 1], [False]))
+        edges = np.flatnonzero(shown[1:] != shown[:-1]).tolist()
+        return [
+            (first, min(first + max_segments, end))
+            for start, end in zip(edges[::2], edges[1::2])
+            for first in range(start, end, max_segments)
+        ]
+
+    @staticmethod
+    def join_chunks(
+        values: np.ndarray, to_text: Callable[[np.ndarray], str]
+    ) -> Generator[str, Any, None]:
+        for start in range(0, len(values), FORMULA_CHUNK_SIZE):
+            text = to_text(values[start : start + FORMULA_CHUNK_SIZE])
+            yield ', ' + text if start else text
+
+    def set_arrays(self, positions: np.ndarray, ghosts: np.ndarray) -> None:
+        self.anchors = (
+            AnchorArray.from_arrays(positions, ghosts)
+            if self.array_backed
+            else unpack(positions, ghosts)
+        )
+        self.rows_moved(0)
+        self.selection.clear()
+        self.commands.clear()
+        self.index.rebuild(self.anchors)
+        self.revision += 1
 
-        with open(file_path, 'w') as file:
-            json.dump(saves, file, indent=4)
-        print('Saved progress')
+    @property
+    def history(self) -> History:
+        if self._history is None:
+            self._history = open_history(self.name, self.save_format)
+        return self._history
+
+    def save_progress(self) -> None:
+        if self.history.append(*self.arrays()):
+            print('Saved progress')
+        else:
+            print('Nothing new to save')
 
     def load_drawing(self, lookbehind: int) -> bool:
-        file_path = self.name + '.json'
-        if not os.path.exists(file_path):
+        if not self.history.exists():
             return
+        return self.restore(lookbehind, self.history.load(lookbehind))
 
+    def restore(self, lookbehind: int, snapshot: Snapshot | None) -> bool:
         print(
             'Previous drawing: ',
             [dataclasses.asdict(anchor) for anchor in self.anchors],
         )
-        with open(file_path, 'r') as file:
-            saves = json.load(file)
-        if lookbehind > len(saves) or lookbehind < 1:
+        if snapshot is None:
             print(f'Could not look behind {lookbehind} saves')
             return True
-        last_save = saves[-lookbehind]
-        self.anchors = [
-            dacite.from_dict(Anchor, anchor) for anchor in last_save
-        ]
+        self.set_arrays(*snapshot)
         print('Loaded drawing')
         return False
+
+
+def table_name(
+    values: np.ndarray, ghosts: np.ndarray, table: np.ndarray
+) -> str:
+    # Subscript of an expression's warp table, from its control points,
+    # ghosts and table, so expressions drawing different things never share
+    # a name
+    hashed = hashlib.blake2b(digest_size=5)
+    for array in (values, ghosts, table):
+        hashed.update(np.ascontiguousarray(array).tobytes())
+    return hashed.hexdigest()
+
+
+def export_options() -> ExportOptions:
+    # Asks for the export settings in the terminal: include setup, round
+    # places, height, formula mode, segments per expression, simplify
+    # tolerance and even spacing
+    include_response = (
+        input('Include setup formulae? (Y/N, default Y) ').strip().lower()
+    )
+    include_setup = include_response != 'n'
+
+    round_response = input('Round values to? (default 5) ').strip()
+    round_places = int(round_response) if round_response.isdigit() else 5
+
+    height_response = input(
+        'Height of screen in Desmos units? (default 10.0) '
+    ).strip()
+    height = float(height_response) if height_response.isdecimal() else 10.0
+
+    mode = input('Formula mode? (sum/piecewise, default sum) ').strip()
+    mode = mode.lower() if mode.lower() in FORMULA_MODES else 'sum'
+
+    segments_response = input(
+        'Segments per expression? (default '
+        f'{FORMULA_MAX_SEGMENTS}, 0 for one expression) '
+    ).strip()
+    max_segments = (
+        int(segments_response)
+        if segments_response.isdigit()
+        else FORMULA_MAX_SEGMENTS
+    )
+
+    tolerance_response = input(
+        'Simplify within how many pixels? (default 0, off) '
+    ).strip()
+    tolerance = (
+        float(tolerance_response)
+        if tolerance_response.replace('.', '', 1).isdigit()
+        else 0.0
+    )
+
+    arc_length_response = (
+        input('Space samples evenly along the curve? (Y/N, default N) ')
+        .strip()
+        .lower()
+    )
+    arc_length = arc_length_response == 'y'
+    return (
+        include_setup,
+        round_places,
+        height,
+        mode,
+        max_segments,
+        tolerance,
+        arc_length,
+    )
@@ -0,0 +1,106 @@
+import collections
+import dataclasses
+from typing import Deque, List
+
+import numpy as np
+
+from ..constant import UNDO_LIMIT
+from .anchor import Anchor
+
+
+def copy_anchor(anchor: Anchor) -> Anchor:
+    # Plain anchor with its own positions, detached from any curve or array
+    return Anchor(
+        *(
+            None if position is None else position.copy()
+            for position in (
+                anchor.reverse_handle,
+                anchor.point,
+                anchor.handle,
+            )
+        ),
+        anchor.ghost,
+    )
+
+
+def restore_anchor(anchor: Anchor, state: Anchor) -> None:
+    # Copies the positions and ghost flag of state into anchor
+    anchor.reverse_handle, anchor.point, anchor.handle = (
+        None if position is None else position.copy()
+        for position in (state.reverse_handle, state.point, state.handle)
+    )
+    anchor.ghost = state.ghost
+
+
+@dataclasses.dataclass
+class Edit:
+    # The anchor at index in curve order before and after a change. Before
+    # is None for an added anchor and after is None for a removed one.
+    index: int
+    before: Anchor | None
+    after: Anchor | None
+
+    @property
+    def size(self) -> int:
+        return 1
+
+
+@dataclasses.dataclass
+class Move:
+    # (k, 3, 2) positions of the anchors at indexes in curve order before
+    # and after a selection transform
+    indexes: np.ndarray
+    before: np.ndarray
+    after: np.ndarray
+
+    @property
+    def size(self) -> int:
+        return len(self.indexes)
+
+
+Command = Edit | Move
+
+
+class CommandLog:
+    # Undo and redo stacks of reversible commands. The undo stack holds at
+    # most UNDO_LIMIT anchor states and drops the oldest commands past that;
+    # recording a new command forgets everything that was undone.
+    def __init__(self, limit: int = UNDO_LIMIT) -> None:
+        self.limit = limit
+        self.undo_stack: Deque[Command] = collections.deque()
+        self.redo_stack: List[Command] = []
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.undo_stack)
+
+    def record(self, command: Command) -> None:
+        self.redo_stack.clear()
+        self._push(command)
+
+    def undo(self) -> Command | None:
+        if not self.undo_stack:
+            return None
+        command = self.undo_stack.pop()
+        self.size -= command.size
+        self.redo_stack.append(command)
+        return command
+
+    def redo(self) -> Command | None:
+        if not self.redo_stack:
+            return None
+        command = self.redo_stack.pop()
+        self._push(command)
+        return command
+
+    def clear(self) -> None:
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.size = 0
+
+    def _push(self, command: Command) -> None:
+        self.undo_stack.append(command)
+        self.size += command.size
+        # Always keep the newest command, however large
+        while self.size > self.limit and len(self.undo_stack) > 1:
+            self.size -= self.undo_stack.popleft().size
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Callable, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from ..constant import (
+    ARC_LENGTH_EQUATIONS,
+    ARC_LENGTH_ITERATIONS,
+    ARC_LENGTH_MAX_SEGMENTS,
+    ARC_LENGTH_MIN_TABLE,
+    ARC_LENGTH_ORDER,
+    ARC_LENGTH_PIECES,
+    EXPORT_CACHE_BYTES,
+    EXPORT_CACHE_VERSION,
+    FORMULA_MODES,
+    SIMPLIFY_FLATNESS,
+    SIMPLIFY_ITERATIONS,
+    SIMPLIFY_MAX_SPAN,
+    SIMPLIFY_REACH,
+    SIMPLIFY_SAMPLES,
+    SIZE,
+    WARP,
+    WARP_TABLE,
+)
+from .formula import Formula
+from .history import Snapshot, to_rows
+
+# Include setup, round places, height, formula mode, segments per
+# expression, simplify tolerance and even spacing
+ExportOptions = Tuple[bool, int, float, str, int, float, bool]
+# Whatever else the exported text depends on
+FORMAT_CONSTANTS: List[Any] = [
+    SIZE,
+    ARC_LENGTH_EQUATIONS,
+    WARP,
+    WARP_TABLE,
+    ARC_LENGTH_ORDER,
+    ARC_LENGTH_PIECES,
+    ARC_LENGTH_MIN_TABLE,
+    ARC_LENGTH_MAX_SEGMENTS,
+    ARC_LENGTH_ITERATIONS,
+    SIMPLIFY_SAMPLES,
+    SIMPLIFY_FLATNESS,
+    SIMPLIFY_ITERATIONS,
+    SIMPLIFY_MAX_SPAN,
+    SIMPLIFY_REACH,
+]
+
+
+def options_text(options: ExportOptions) -> str:
+    # Numbers are normalised so 10 and 10.0 share entries; the formula
+    # templates of the mode and the other constants the text depends on are
+    # part of it, so editing them never brings back stale text
+    (
+        include_setup,
+        round_places,
+        height,
+        mode,
+        max_segments,
+        tolerance,
+        arc_length,
+    ) = options
+    return json.dumps(
+        [
+            EXPORT_CACHE_VERSION,
+            bool(include_setup),
+            int(round_places),
+            float(height),
+            mode,
+            int(max_segments),
+            float(tolerance),
+            bool(arc_length),
+            FORMULA_MODES[mode],
+            FORMAT_CONSTANTS,
+        ]
+    )
+
+
+def content_key(snapshots: Iterable[Snapshot], options: ExportOptions) -> str:
+    # Hash of the anchors of every exported curve and the options
+    hashed = hashlib.sha256(options_text(options).encode())
+    for positions, ghosts in snapshots:
+        rows = to_rows(positions, ghosts)
+        # Every NaN hashes the same whatever its bits
+        rows[np.isnan(rows)] = np.nan
+        hashed.update(len(rows).to_bytes(8, 'little'))
+        hashed.update(rows.tobytes())
+    return hashed.hexdigest()
+
+
+def source_key(paths: Iterable[str], options: ExportOptions) -> str:
+    # Hash of where, how big and how new some save files are, for finding
+    # the export of an unchanged project without loading it
+    hashed = hashlib.sha256(options_text(options).encode())
+    for path in paths:
+        stat = os.stat(path)
+        hashed.update(
+            f'{os.path.abspath(path)} {stat.st_ino} {stat.st_size} '
+            f'{stat.st_mtime_ns}\n'.encode()
+        )
+    return hashed.hexdigest()
+
+
+def default_directory() -> str | None:
+    # DESMOSCURVES_CACHE sets the cache directory; empty turns it off
+    directory = os.environ.get('DESMOSCURVES_CACHE')
+    if directory is not None:
+        return directory or None
+    return os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'desmoscurves',
+    )
+
+
+class ExportCache:
+    # Formula text on disk, one <key>.txt file per content key, with a
+    # <key>.log file holding what making it reported, if anything. Source
+    # keys are <key>.ref files holding the content key they last led to.
+    # Reading an entry touches it, and evict deletes the least recently
+    # used files until they fit in max_bytes. Files are replaced in one
+    # rename, so export processes can share a cache.
+    def __init__(
+        self, directory: str, max_bytes: int = EXPORT_CACHE_BYTES
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str, suffix: str = '.txt') -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key: str) -> str | None:
+        # Path of the cached text, or None
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def read(self, key: str) -> str | None:
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path) as file:
+                return file.read()
+        except FileNotFoundError:
+            # Evicted by another process in between
+            return None
+
+    def report(self, key: str) -> str:
+        # What making the text of key reported, or '' if nothing
+        try:
+            with open(self.path(key, '.log')) as file:
+                return file.read()
+        except FileNotFoundError:
+            return ''
+
+    def resolve(self, source: str) -> str | None:
+        # Content key a source key led to, if its text is still cached
+        path = self.path(source, '.ref')
+        try:
+            with open(path) as file:
+                key = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return key if self.get(key) is not None else None
+
+    def put(self, key: str, text: str, report: str = '') -> None:
+        if report:
+            self.write(self.path(key, '.log'), lambda file: file.write(report))
+        self.write(self.path(key), lambda file: file.write(text))
+
+    def put_file(self, key: str, file_path: str, report: str = '') -> None:
+        def copy(file: Any) -> None:
+            with open(file_path) as source:
+                shutil.copyfileobj(source, file)
+
+        if report:
+            self.write(self.path(key, '.log'), lambda file: file.write(report))
+        self.write(self.path(key), copy)
+
+    def link(self, source: str, key: str) -> None:
+        self.write(self.path(source, '.ref'), lambda file: file.write(key))
+
+    def write(self, path: str, fill: Callable[[Any], object]) -> None:
+        descriptor, temporary = tempfile.mkstemp(
+            dir=self.directory, suffix='.tmp'
+        )
+        try:
+            with os.fdopen(descriptor, 'w') as file:
+                fill(file)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(('.txt', '.ref', '.log')):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def open_cache(directory: str | None = None) -> ExportCache | None:
+    # The cache in directory, by default default_directory(), or None when
+    # caching is off; an empty directory turns it off too
+    if directory is None:
+        directory = default_directory()
+    return ExportCache(directory) if directory else None
+
+
+def cached_formula(
+    snapshots: Sequence[Snapshot],
+    options: ExportOptions,
+    make: Callable[[], Tuple[Formula | None, str]],
+) -> Formula | None:
+    # make's formula, or the one it made for the same anchors and options
+    # before. make also returns its report, such as how much simplifying
+    # saved, which is printed whichever way the formula came, followed by
+    # where the cache is.
+    cache = open_cache()
+    if cache is None:
+        formula, report = make()
+    else:
+        key = content_key(snapshots, options)
+        text = cache.read(key)
+        if text is not None:
+            formula, report = Formula(text), cache.report(key)
+            note = 'Reused the export cached in'
+        else:
+            formula, report = make()
+            note = 'Cached the export in'
+            if formula is not None:
+                cache.put(key, formula.formula, report)
+                cache.evict()
+        if formula is not None:
+            note = (
+                f'{note} {cache.directory}; set DESMOSCURVES_CACHE to an '
+                'empty value to turn caching off'
+            )
+            report = f'{report}\n{note}' if report else note
+    if report:
+        print(report)
+    return formula
@@ -1,13 +1,14 @@
 import dataclasses
 
-import pyperclip
-
 
 @dataclasses.dataclass
 class Formula:
     formula: str
 
     def save(self) -> None:
+        # Imported here so the model loads without a clipboard backend
+        import pyperclip
+
         pyperclip.copy(self.formula)
         print()
         print(self.formula)
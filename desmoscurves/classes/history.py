@@ -0,0 +1,534 @@
+import abc
+import dataclasses
+import difflib
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import Any, BinaryIO, Dict, Generator, List, Tuple, Type
+
+import dacite
+import numpy as np
+
+from ..constant import CHECKPOINT_INTERVAL, DIFF_LIMIT, MAX_SAVES
+from .anchor import Anchor
+from .anchor_array import pack, unpack
+
+# (n, 3, 2) positions with NaN for missing handles and (n,) ghost flags
+Snapshot = Tuple[np.ndarray, np.ndarray]
+
+
+def to_rows(positions: np.ndarray, ghosts: np.ndarray) -> np.ndarray:
+    # One (n, 7) float array: six coordinates then the ghost flag
+    return np.concatenate(
+        (positions.reshape(-1, 6), ghosts.reshape(-1, 1)), axis=1
+    )
+
+
+def from_rows(rows: np.ndarray) -> Snapshot:
+    rows = np.asarray(rows, dtype=np.float64).reshape(-1, 7)
+    return rows[:, :6].reshape(-1, 3, 2).copy(), rows[:, 6] != 0
+
+
+def same_rows(rows_a: np.ndarray, rows_b: np.ndarray) -> np.ndarray:
+    both_nan = np.isnan(rows_a) & np.isnan(rows_b)
+    return ((rows_a == rows_b) | both_nan).all(axis=1)
+
+
+def write_file(path: str, data: bytes) -> None:
+    # Replace the file in one rename so a crash never leaves half of it
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+class History(abc.ABC):
+    # A file holding at least the last MAX_SAVES snapshots of a curve
+    SUFFIX = ''
+
+    def __init__(self, name: str) -> None:
+        self.path = name + self.SUFFIX
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def modified(self) -> int:
+        # When the file was last written, in nanoseconds
+        return os.stat(self.path).st_mtime_ns
+
+    @abc.abstractmethod
+    def append(self, positions: np.ndarray, ghosts: np.ndarray) -> bool:
+        # Returns False if the snapshot matches the last one
+        ...
+
+    @abc.abstractmethod
+    def load(self, lookbehind: int) -> Snapshot | None:
+        # Snapshot lookbehind saves back, 1 being the last one
+        ...
+
+    @abc.abstractmethod
+    def versions(self) -> Generator[Snapshot, Any, None]:
+        # Every stored snapshot, oldest first
+        ...
+
+    def write(self, data: bytes) -> None:
+        write_file(self.path, data)
+
+    def complete_size(self, file: BinaryIO) -> int:
+        # Bytes of the file that hold whole saves
+        return file.seek(0, os.SEEK_END)
+
+    def repair(self) -> None:
+        # Cut off the end of a save that was interrupted halfway, so the
+        # next one starts on a clean boundary
+        if not self.exists():
+            return
+        with open(self.path, 'rb+') as file:
+            end = self.complete_size(file)
+            if end < file.seek(0, os.SEEK_END):
+                file.truncate(end)
+
+    def drop_before(self, offset: int) -> None:
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+        self.write(data)
+
+
+class JsonHistory(History):
+    # Original format: a JSON list of saves rewritten on every save
+    SUFFIX = '.json'
+
+    def read(self) -> List[List[Dict[str, Any]]]:
+        if not self.exists():
+            return []
+        with open(self.path, 'r') as file:
+            return json.load(file)
+
+    def append(self, positions: np.ndarray, ghosts: np.ndarray) -> bool:
+        saves = self.read()
+        save = [
+            dataclasses.asdict(anchor) for anchor in unpack(positions, ghosts)
+        ]
+        if saves and save == saves[-1]:
+            return False
+
+        saves.append(save)
+        saves = saves[-MAX_SAVES:]
+
+        self.write(json.dumps(saves, indent=4).encode())
+        return True
+
+    def load(self, lookbehind: int) -> Snapshot | None:
+        saves = self.read()
+        if lookbehind > len(saves) or lookbehind < 1:
+            return None
+        return self.parse(saves[-lookbehind])
+
+    def versions(self) -> Generator[Snapshot, Any, None]:
+        for save in self.read():
+            yield self.parse(save)
+
+    @staticmethod
+    def parse(save: List[Dict[str, Any]]) -> Snapshot:
+        return pack(dacite.from_dict(Anchor, anchor) for anchor in save)
+
+
+class Journal(History):
+    # Append-only JSON lines. Each line is either a checkpoint holding every
+    # anchor row or a delta of ops against the line before it. A checkpoint
+    # is written every CHECKPOINT_INTERVAL saves, so loading only reads the
+    # file backwards to the checkpoint before the wanted save.
+    SUFFIX = '.journal'
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        # Rows of the last line and the number of deltas after the last
+        # checkpoint, known once the file has been read or written
+        self.head: np.ndarray | None = None
+        self.since_checkpoint = 0
+
+    def append(self, positions: np.ndarray, ghosts: np.ndarray) -> bool:
+        rows = to_rows(positions, ghosts)
+        self.repair()
+        if self.head is None and self.exists():
+            self.load(1)
+        if (
+            self.head is not None
+            and len(self.head) == len(rows)
+            and same_rows(self.head, rows).all()
+        ):
+            return False
+
+        record: Dict[str, Any] | None = None
+        if (
+            self.head is not None
+            and self.since_checkpoint + 1 < CHECKPOINT_INTERVAL
+        ):
+            ops = self.delta(self.head, rows)
+            # Fall back to a checkpoint when most of the curve changed
+            if sum(len(op[-1]) for op in ops) <= len(rows) // 2:
+                record = {'ops': ops}
+        if record is None:
+            record = {'checkpoint': rows.tolist()}
+
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+        self.head = rows
+        if 'checkpoint' in record:
+            self.since_checkpoint = 0
+            self.trim()
+        else:
+            self.since_checkpoint += 1
+        return True
+
+    def load(self, lookbehind: int) -> Snapshot | None:
+        if lookbehind < 1 or not self.exists():
+            return None
+
+        # Newest first, back to the checkpoint at or before the wanted save
+        records = []
+        since_checkpoint = None
+        for _, line in self.reversed_lines():
+            record = json.loads(line)
+            if 'checkpoint' in record and since_checkpoint is None:
+                since_checkpoint = len(records)
+            records.append(record)
+            if 'checkpoint' in record and len(records) >= lookbehind:
+                break
+        if not records or 'checkpoint' not in records[-1]:
+            return None
+
+        rows = self.apply(np.zeros((0, 7)), records[-1])
+        states = [rows]
+        for record in reversed(records[:-1]):
+            rows = self.apply(rows, record)
+            states.append(rows)
+        self.head = rows
+        self.since_checkpoint = since_checkpoint
+
+        if lookbehind > len(states):
+            return None
+        return from_rows(states[-lookbehind])
+
+    def versions(self) -> Generator[Snapshot, Any, None]:
+        if not self.exists():
+            return
+        rows = np.zeros((0, 7))
+        with open(self.path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    # Left by an interrupted save
+                    break
+                rows = self.apply(rows, json.loads(line))
+                yield from_rows(rows)
+
+    def complete_size(self, file: BinaryIO, block_size: int = 1 << 16) -> int:
+        # Every record ends in a newline, so anything after the last one is
+        # a line an interrupted save did not finish
+        end = file.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - block_size, 0)
+            file.seek(start)
+            newline = file.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+        return 0
+
+    def reversed_lines(
+        self, block_size: int = 1 << 16
+    ) -> Generator[Tuple[int, bytes], Any, None]:
+        # (offset, line) pairs from the end of the whole lines of the file
+        with open(self.path, 'rb') as file:
+            end = self.complete_size(file, block_size)
+            # Blocks of the line being read, last first. Only joined once
+            # its start is found, so a long checkpoint line is not copied
+            # and split again for every block.
+            partial: List[bytes] = []
+            while end > 0:
+                start = max(end - block_size, 0)
+                file.seek(start)
+                block = file.read(end - start)
+                end = start
+                if b'\n' not in block:
+                    partial.append(block)
+                    continue
+                lines = block.split(b'\n')
+                lines[-1] = b''.join([lines[-1], *reversed(partial)])
+                # The first piece may continue in the previous block
+                partial = [lines.pop(0)]
+                offset = end + len(partial[0]) + 1
+                pieces = []
+                for line in lines:
+                    pieces.append((offset, line))
+                    offset += len(line) + 1
+                for offset, line in reversed(pieces):
+                    if line.strip():
+                        yield offset, line
+            line = b''.join(reversed(partial))
+            if line.strip():
+                yield 0, line
+
+    def trim(self) -> None:
+        # Drop lines before the newest checkpoint that still keeps the last
+        # MAX_SAVES saves, so every format keeps at least that many
+        count = 0
+        for offset, line in self.reversed_lines():
+            count += 1
+            if count >= MAX_SAVES and line.startswith(b'{"checkpoint"'):
+                if offset:
+                    self.drop_before(offset)
+                return
+
+    @staticmethod
+    def delta(old: np.ndarray, new: np.ndarray) -> List[List[Any]]:
+        if len(old) == len(new):
+            changed = np.flatnonzero(~same_rows(old, new))
+            return [['set', changed.tolist(), new[changed].tolist()]]
+
+        # Only diff what lies between the common prefix and suffix
+        shared = min(len(old), len(new))
+        matches = same_rows(old[:shared], new[:shared])
+        prefix = shared if matches.all() else int(np.argmin(matches))
+        shared -= prefix
+        matches = same_rows(old[len(old) - shared :], new[len(new) - shared :])
+        mismatches = np.flatnonzero(~matches)
+        suffix = shared - 1 - mismatches[-1] if len(mismatches) else shared
+        old_middle = old[prefix : len(old) - suffix]
+        new_middle = new[prefix : len(new) - suffix]
+
+        if len(old_middle) * len(new_middle) > DIFF_LIMIT:
+            opcodes = [('replace', 0, len(old_middle), 0, len(new_middle))]
+        else:
+            matcher = difflib.SequenceMatcher(
+                None,
+                [row.tobytes() for row in old_middle],
+                [row.tobytes() for row in new_middle],
+                autojunk=False,
+            )
+            opcodes = matcher.get_opcodes()
+
+        # Splice from the back so earlier indexes stay valid
+        return [
+            [
+                'splice',
+                prefix + old_start,
+                prefix + old_end,
+                new_middle[new_start:new_end].tolist(),
+            ]
+            for tag, old_start, old_end, new_start, new_end in reversed(
+                opcodes
+            )
+            if tag != 'equal'
+        ]
+
+    @staticmethod
+    def apply(rows: np.ndarray, record: Dict[str, Any]) -> np.ndarray:
+        if 'checkpoint' in record:
+            return np.array(record['checkpoint'], dtype=np.float64).reshape(
+                -1, 7
+            )
+        rows = rows.copy()
+        for op in record['ops']:
+            values = np.array(op[-1], dtype=np.float64).reshape(-1, 7)
+            if op[0] == 'set':
+                rows[op[1]] = values
+            elif op[0] == 'splice':
+                rows = np.concatenate((rows[: op[1]], values, rows[op[2] :]))
+        return rows
+
+
+class BinaryHistory(History):
+    # Snapshots appended as fixed-width blocks:
+    #   header   magic, format version, reserved, anchor count
+    #   records  (count, 3, 2) little-endian float64, NaN for missing
+    #   flags    one byte per anchor: bit 0 ghost, bits 1-3 set when the
+    #            reverse handle, point and handle are present
+    #   padding  to a multiple of 8 bytes
+    #   trailer  block size and end magic, so blocks can be walked
+    #            backwards from the end of the file
+    # Loading memory-maps the file and copies the wanted block straight
+    # into arrays.
+    SUFFIX = '.dcb'
+    MAGIC = b'DCRV'
+    END_MAGIC = b'DCRVEND\0'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHHQ')
+    TRAILER = struct.Struct('<Q8s')
+
+    def append(self, positions: np.ndarray, ghosts: np.ndarray) -> bool:
+        self.repair()
+        last = self.load(1)
+        if last is not None:
+            last_rows, rows = to_rows(*last), to_rows(positions, ghosts)
+            if (
+                len(last_rows) == len(rows)
+                and same_rows(last_rows, rows).all()
+            ):
+                return False
+
+        count = len(ghosts)
+        present = ~np.isnan(positions[:, :, 0])
+        flags = ghosts.astype(np.uint8) | (
+            present.astype(np.uint8) << np.array([1, 2, 3], dtype=np.uint8)
+        ).sum(axis=1, dtype=np.uint8)
+        padding = -count % 8
+
+        with open(self.path, 'ab') as file:
+            file.write(self.HEADER.pack(self.MAGIC, self.VERSION, 0, count))
+            file.write(positions.astype('<f8').tobytes())
+            file.write(flags.tobytes())
+            file.write(bytes(padding))
+            file.write(
+                self.TRAILER.pack(self.block_size(count), self.END_MAGIC)
+            )
+
+        offsets = self.block_offsets(2 * MAX_SAVES + 1)
+        if len(offsets) > 2 * MAX_SAVES:
+            self.drop_before(offsets[MAX_SAVES - 1])
+        return True
+
+    def load(self, lookbehind: int) -> Snapshot | None:
+        if lookbehind < 1 or not self.exists():
+            return None
+        offsets = self.block_offsets(lookbehind)
+        if len(offsets) < lookbehind:
+            return None
+        with open(self.path, 'rb') as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            return self.read_block(data, offsets[-1])
+
+    def versions(self) -> Generator[Snapshot, Any, None]:
+        if not self.exists() or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb') as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            end = self.complete_size(file)
+            offset = 0
+            while offset < end:
+                yield self.read_block(data, offset)
+                count = self.HEADER.unpack_from(data, offset)[3]
+                offset += self.block_size(count)
+
+    def block_size(self, count: int) -> int:
+        return self.HEADER.size + 49 * count + -count % 8 + self.TRAILER.size
+
+    def complete_size(self, file: BinaryIO) -> int:
+        # A file that does not end in a trailer was cut off by an
+        # interrupted save; its whole blocks are found walking forwards
+        end = file.seek(0, os.SEEK_END)
+        if end >= self.TRAILER.size:
+            file.seek(end - self.TRAILER.size)
+            if file.read(self.TRAILER.size)[-8:] == self.END_MAGIC:
+                return end
+        offset = 0
+        while offset + self.HEADER.size <= end:
+            file.seek(offset)
+            count = self.HEADER.unpack(file.read(self.HEADER.size))[3]
+            size = self.block_size(count)
+            if offset + size > end:
+                break
+            file.seek(offset + size - self.TRAILER.size)
+            if self.TRAILER.unpack(file.read(self.TRAILER.size))[1] != (
+                self.END_MAGIC
+            ):
+                break
+            offset += size
+        return offset
+
+    def block_offsets(self, limit: int) -> List[int]:
+        # Start offsets of up to limit blocks, newest first
+        offsets: List[int] = []
+        with open(self.path, 'rb') as file:
+            end = self.complete_size(file)
+            while end > 0 and len(offsets) < limit:
+                file.seek(end - self.TRAILER.size)
+                size, magic = self.TRAILER.unpack(file.read(self.TRAILER.size))
+                if magic != self.END_MAGIC:
+                    raise ValueError(f'{self.path} is not a binary save')
+                end -= size
+                offsets.append(end)
+        return offsets
+
+    def read_block(self, data: mmap.mmap, offset: int) -> Snapshot:
+        magic, version, _, count = self.HEADER.unpack_from(data, offset)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f'Unsupported binary save in {self.path}')
+        offset += self.HEADER.size
+        positions = np.frombuffer(
+            data, dtype='<f8', count=6 * count, offset=offset
+        ).reshape(count, 3, 2)
+        flags = np.frombuffer(
+            data, dtype=np.uint8, count=count, offset=offset + 48 * count
+        )
+        positions = positions.astype(np.float64)
+        present = (flags[:, None] >> np.array([1, 2, 3])) & 1
+        positions[present == 0] = np.nan
+        return positions, (flags & 1).astype(bool)
+
+
+# In order of preference between histories of a project last written at
+# the same time
+HISTORY_FORMATS: Dict[str, Type[History]] = {
+    'journal': Journal,
+    'binary': BinaryHistory,
+    'json': JsonHistory,
+}
+
+
+def snapshot_digest(positions: np.ndarray, ghosts: np.ndarray) -> bytes:
+    rows = to_rows(positions, ghosts)
+    # Every NaN hashes the same whatever its bits
+    rows[np.isnan(rows)] = np.nan
+    return hashlib.sha256(rows.tobytes()).digest()
+
+
+def convert(source: History, target: History) -> None:
+    # Appends the saves of source after the last one target also holds, or
+    # all of them if it holds none, so bringing a history up to date from
+    # another format adds only what was saved there since
+    known = {snapshot_digest(*snapshot) for snapshot in target.versions()}
+    start = 0
+    for index, snapshot in enumerate(source.versions()):
+        if snapshot_digest(*snapshot) in known:
+            start = index + 1
+    for index, (positions, ghosts) in enumerate(source.versions()):
+        if index >= start:
+            target.append(positions, ghosts)
+
+
+def open_history(name: str, save_format: str = 'journal') -> History:
+    # A history saved in another format since this one was last written,
+    # such as the .json file an older version keeps saving to, has its new
+    # saves carried over, so the latest save is never left behind
+    history = HISTORY_FORMATS[save_format](name)
+    other = find_history(name)
+    if other is None or type(other) is type(history):
+        return history
+    if not history.exists() or other.modified() > history.modified():
+        convert(other, history)
+        if history.exists():
+            # Up to date now, even if there was nothing to append
+            os.utime(history.path)
+    return history
+
+
+def find_history(name: str) -> History | None:
+    # The existing history of a project, without converting anything. A
+    # project saved in several formats, such as after saving with another
+    # --save-format, goes by the one written last, so the others being
+    # out of date never matters; ties go by HISTORY_FORMATS.
+    histories = [
+        history_format(name) for history_format in HISTORY_FORMATS.values()
+    ]
+    histories = [history for history in histories if history.exists()]
+    if not histories:
+        return None
+    return max(histories, key=History.modified)
@@ -1,8 +1,12 @@
 import dataclasses
 from typing import Tuple
 
+import numpy as np
+
 from ..constant import SIZE
 
+HALF_SIZE = SIZE[0] / 2, SIZE[1] / 2
+
 
 @dataclasses.dataclass
 class Position:
@@ -54,3 +58,24 @@ class Position:
                 (self.x + center.x - (SIZE[0] / 2)) * zoom + SIZE[0] / 2,
                 (self.y + center.y - (SIZE[1] / 2)) * zoom + SIZE[1] / 2,
             )
+
+    @staticmethod
+    def centered_array(
+        values: np.ndarray,
+        center: 'Position',
+        zoom: float | int,
+        reverse: bool = False,
+        out: np.ndarray | None = None,
+    ) -> np.ndarray:
+        # Same mapping as centered for any array with x, y in the last axis;
+        # pass out=values to transform in place without allocating
+        if reverse:
+            out = np.subtract(values, HALF_SIZE, out=out)
+            out /= zoom
+            out -= center.tup
+        else:
+            out = np.add(values, center.tup, out=out)
+            out -= HALF_SIZE
+            out *= zoom
+        out += HALF_SIZE
+        return out
@@ -0,0 +1,151 @@
+import collections
+import functools
+import json
+import time
+from typing import Any, Callable, Deque, Dict, List, TextIO, Tuple
+
+from ..constant import PROFILE_WINDOW
+
+# BezierCurve methods the editor calls while handling events and drawing
+CURVE_METHODS = (
+    'interact',
+    'motion',
+    'end_drag',
+    'undo',
+    'redo',
+    'transform_selection',
+    'screen_arrays',
+    'segments',
+    'selected_mask',
+)
+
+
+class Profiler:
+    # Wall time spent in each phase of every editor frame, averaged over the
+    # last PROFILE_WINDOW frames for the overlay and, with a trace file,
+    # written as one JSON line of milliseconds per frame. Phases are laps
+    # one after another; watched methods are timed on their own, so their
+    # time is also part of the lap they ran in. While profiling is off a lap
+    # is one check and watched methods are not wrapped at all.
+    def __init__(
+        self, trace: TextIO | None = None, window: int = PROFILE_WINDOW
+    ) -> None:
+        self.trace = trace
+        self.overlay = False
+        self.frames: Deque[Dict[str, float]] = collections.deque(maxlen=window)
+        self.current: Dict[str, float] = {}
+        self.frame_start = self.last_lap = time.perf_counter()
+        self.count = 0
+        self.watched: List[Tuple[object, Tuple[str, ...]]] = []
+        self.wrapped = self.enabled
+
+    @property
+    def enabled(self) -> bool:
+        return self.overlay or self.trace is not None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.current[name] = self.current.get(name, 0) + seconds
+
+    def start_frame(self) -> None:
+        self.frame_start = self.last_lap = time.perf_counter()
+        self.current = {}
+
+    def lap(self, name: str) -> None:
+        # Counts the time since the frame started or the last lap as a phase
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.add(name, now - self.last_lap)
+        self.last_lap = now
+
+    def end_frame(self) -> None:
+        if not self.enabled:
+            return
+        self.current['total'] = time.perf_counter() - self.frame_start
+        self.frames.append(self.current)
+        if self.trace is not None:
+            self.trace.write(
+                json.dumps(
+                    {
+                        'frame': self.count,
+                        'start': self.frame_start,
+                        **{
+                            name: round(seconds * 1000, 3)
+                            for name, seconds in self.current.items()
+                        },
+                    }
+                )
+                + '\n'
+            )
+        self.count += 1
+
+    def close(self) -> None:
+        if self.trace is not None:
+            self.trace.close()
+
+    def averages(self) -> Dict[str, float]:
+        # Mean milliseconds per frame of every phase seen in the window, in
+        # the order they first ran
+        totals: Dict[str, float] = {}
+        for frame in self.frames:
+            for name, seconds in frame.items():
+                totals[name] = totals.get(name, 0) + seconds
+        return {
+            name: total * 1000 / len(self.frames)
+            for name, total in totals.items()
+        }
+
+    def report(self) -> List[str]:
+        # Overlay lines: frame rate first, then each phase
+        averages = self.averages()
+        total = averages.pop('total', 0)
+        lines = [
+            f'{1000 / total if total else 0:5.1f} FPS {total:7.2f} ms/frame'
+        ]
+        lines += [f'{name:<28}{ms:7.2f} ms' for name, ms in averages.items()]
+        return lines
+
+    def watch(self, target: object, names: Tuple[str, ...]) -> None:
+        # Times these methods of target as phases while profiling; watching
+        # the same target again does nothing
+        if any(watched is target for watched, _ in self.watched):
+            return
+        self.watched.append((target, names))
+        if self.wrapped:
+            self.wrap(target, names)
+
+    def toggle_overlay(self) -> None:
+        self.overlay = not self.overlay
+        self.frames.clear()
+        if self.enabled == self.wrapped:
+            return
+        self.wrapped = self.enabled
+        for target, names in self.watched:
+            if self.wrapped:
+                self.wrap(target, names)
+            else:
+                # Deleting the wrappers set on the instance brings back the
+                # class methods
+                for name in names:
+                    delattr(target, name)
+
+    def wrap(self, target: object, names: Tuple[str, ...]) -> None:
+        for name in names:
+            setattr(
+                target,
+                name,
+                self.timed(
+                    f'{type(target).__name__}.{name}', getattr(target, name)
+                ),
+            )
+
+    def timed(self, name: str, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+
+        return wrapper
@@ -0,0 +1,423 @@
+import dataclasses
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from ..constant import (
+    FORMULA_MAX_SEGMENTS,
+    LAYERS_SUFFIX,
+    MAX_SAVES,
+)
+from .anchor_array import pack
+from .bezier_curve import BezierCurve, export_options
+from .export_cache import cached_formula
+from .formula import Formula
+from .history import History, Snapshot, open_history, write_file
+
+# Number, name, visibility and arrays of each layer, in drawing order
+ProjectSnapshot = List[Tuple[int, str, bool, Snapshot]]
+# What a save hands the worker: each layer's number, name and visibility,
+# with its arrays if it changed since the last save
+SaveState = List[Tuple[int, str, bool, Snapshot | None]]
+
+
+def same_arrays(a: Snapshot, b: Snapshot) -> bool:
+    return np.array_equal(a[1], b[1]) and np.array_equal(
+        a[0], b[0], equal_nan=True
+    )
+
+
+class Layer:
+    # One independent curve of a project. Its segments and formulas are
+    # cached until the curve changes, counted by revision. Only the layer
+    # being edited can change, so refresh is only needed on that one.
+    def __init__(
+        self, number: int, name: str, curve: BezierCurve, visible: bool = True
+    ) -> None:
+        self.number = number
+        self.name = name
+        self.curve = curve
+        self.visible = visible
+        self.revision = 0
+        # Revision last written by a save; a new layer has never been saved
+        self.saved_revision = -1
+        self.arrays: Snapshot = curve.arrays()
+        self._segments: Snapshot | None = None
+        self._formulas: Dict[Tuple[Any, ...], Tuple[str | None, str]] = {}
+
+    @property
+    def dirty(self) -> bool:
+        return self.revision != self.saved_revision
+
+    def refresh(self) -> bool:
+        # Drops the caches if the curve no longer matches them; True if it
+        # changed
+        arrays = self.curve.arrays()
+        if same_arrays(arrays, self.arrays):
+            return False
+        self.arrays = arrays
+        self.revision += 1
+        self._segments = None
+        self._formulas.clear()
+        return True
+
+    def segments(self) -> Snapshot:
+        # Canvas control points and ghost flags of the complete segments
+        if self._segments is None:
+            self._segments = self.curve.segments(*self.arrays)
+        return self._segments
+
+    def formula(
+        self,
+        round_places: int = 5,
+        height: float = 10.0,
+        mode: str = 'sum',
+        max_segments: int = FORMULA_MAX_SEGMENTS,
+        tolerance: float = 0.0,
+        arc_length: bool = False,
+    ) -> Tuple[str | None, str]:
+        # Expressions of the layer without setup formulae, or None if it
+        # has no complete curve, and how much simplifying it saved
+        options = (
+            round_places,
+            height,
+            mode,
+            max_segments,
+            tolerance,
+            arc_length,
+        )
+        if options not in self._formulas:
+            curve, report = self.curve, ''
+            if tolerance > 0 and curve.can_export():
+                curve = curve.simplified(tolerance)
+                report = f'Simplified {self.name}: ' + self.curve.size_report(
+                    curve, round_places, height, mode
+                )
+            formula = curve.to_formula(
+                False, round_places, height, mode, max_segments, arc_length
+            )
+            self._formulas[options] = (
+                None if formula is None else formula.formula,
+                report,
+            )
+        return self._formulas[options]
+
+
+class Project:
+    # The layers of a drawing, saved together. The first layer keeps the
+    # project's own history, so projects from before layers open as one
+    # layer; the others are saved to <name>.layers/<number>. A save only
+    # appends the layers that changed and adds a line to the manifest with
+    # every layer's name, visibility and number of saves, which is what
+    # loading a whole save back goes by.
+    def __init__(
+        self,
+        name: str,
+        array_backed: bool = True,
+        save_format: str = 'journal',
+    ) -> None:
+        self.name = name
+        self.array_backed = array_backed
+        self.save_format = save_format
+        self.directory = name + LAYERS_SUFFIX
+        self.manifest = os.path.join(self.directory, 'manifest.jsonl')
+        self.layers = [self.new_layer(0, 'layer 1')]
+        self.active = 0
+        # Only touched by whichever thread does the saving and loading
+        self.histories: Dict[int, History] = {}
+        self.versions: Dict[int, int] | None = None
+
+    @property
+    def layer(self) -> Layer:
+        return self.layers[self.active]
+
+    @property
+    def curve(self) -> BezierCurve:
+        return self.layer.curve
+
+    def layer_name(self, number: int) -> str:
+        # Name the layer's curve and history go by
+        if number == 0:
+            return self.name
+        return os.path.join(self.directory, str(number))
+
+    def new_layer(self, number: int, name: str) -> Layer:
+        return Layer(
+            number,
+            name,
+            BezierCurve(
+                self.layer_name(number), self.array_backed, self.save_format
+            ),
+        )
+
+    def add_layer(self) -> Layer:
+        # New empty layer after the active one, which it becomes
+        number = max(layer.number for layer in self.layers) + 1
+        layer = self.new_layer(number, f'layer {number + 1}')
+        self.select(self.active + 1, layer)
+        return layer
+
+    def select(self, index: int, new: Layer | None = None) -> None:
+        # Leaving a layer is when its edits reach the cache
+        self.layer.refresh()
+        if new is not None:
+            self.layers.insert(index, new)
+        self.active = index % len(self.layers)
+
+    def others(self) -> List[Layer]:
+        # Visible layers other than the active one, for drawing
+        return [
+            layer
+            for index, layer in enumerate(self.layers)
+            if layer.visible and index != self.active
+        ]
+
+    def status(self) -> str:
+        return ', '.join(
+            ('*' if index == self.active else '')
+            + layer.name
+            + ('' if layer.visible else ' (hidden)')
+            for index, layer in enumerate(self.layers)
+        )
+
+    def arrays(self) -> ProjectSnapshot:
+        return [
+            (layer.number, layer.name, layer.visible, layer.curve.arrays())
+            for layer in self.layers
+        ]
+
+    def set_layers(self, snapshot: ProjectSnapshot) -> None:
+        # Layers with the same number keep their curve objects
+        layers = {layer.number: layer for layer in self.layers}
+        self.layers = []
+        for number, name, visible, arrays in snapshot:
+            layer = layers.get(number) or self.new_layer(number, name)
+            layer.name = name
+            layer.visible = visible
+            layer.curve.set_arrays(*arrays)
+            layer.refresh()
+            # Saved again in full, as the history may have moved on since
+            layer.saved_revision = -1
+            self.layers.append(layer)
+        self.active = min(self.active, len(self.layers) - 1)
+
+    def capture(self) -> SaveState:
+        # Taken on the editor's thread when saving
+        self.layer.refresh()
+        state: SaveState = []
+        for layer in self.layers:
+            state.append(
+                (
+                    layer.number,
+                    layer.name,
+                    layer.visible,
+                    layer.arrays if layer.dirty else None,
+                )
+            )
+        return state
+
+    def revisions(self) -> Dict[int, int]:
+        # Taken with capture and handed to mark_saved once it is written
+        return {layer.number: layer.revision for layer in self.layers}
+
+    def mark_saved(self, revisions: Dict[int, int]) -> None:
+        # Layers edited since the capture stay dirty
+        for layer in self.layers:
+            if layer.number in revisions:
+                layer.saved_revision = revisions[layer.number]
+
+    def write(self, state: SaveState) -> bool:
+        # Appends the changed layers, then the manifest line if anything
+        # about the layers changed; False if nothing did
+        os.makedirs(self.directory, exist_ok=True)
+        versions = self.read_versions()
+        lines = self.read_manifest()
+        saved = False
+        for number, _, _, arrays in state:
+            if arrays is not None and self.history(number).append(*arrays):
+                versions[number] = versions.get(number, 0) + 1
+                saved = True
+        line = {
+            'layers': [
+                {
+                    'number': number,
+                    'name': name,
+                    'visible': visible,
+                    'version': versions.get(number, 0),
+                }
+                for number, name, visible, _ in state
+            ]
+        }
+        if lines and line == lines[-1]:
+            return saved
+        # Rewritten whole, as the layer histories keep at least as many
+        # saves as the lines kept here
+        lines = lines[-MAX_SAVES + 1 :] + [line]
+        write_file(
+            self.manifest,
+            ''.join(json.dumps(entry) + '\n' for entry in lines).encode(),
+        )
+        return True
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest) or self.history(0).exists()
+
+    def load(self, lookbehind: int) -> ProjectSnapshot | None:
+        # The whole save lookbehind saves back, 1 being the last one
+        lines = self.read_manifest()
+        if not lines:
+            # Saved before layers
+            arrays = self.history(0).load(lookbehind)
+            if arrays is None:
+                return None
+            return [(0, 'layer 1', True, arrays)]
+        if not 1 <= lookbehind <= len(lines):
+            return None
+
+        versions = self.read_versions()
+        snapshot: ProjectSnapshot = []
+        for layer in lines[-lookbehind]['layers']:
+            number = layer['number']
+            if layer['version'] == 0:
+                arrays = pack([])
+            else:
+                arrays = self.history(number).load(
+                    versions.get(number, 0) - layer['version'] + 1
+                )
+                if arrays is None:
+                    return None
+            snapshot.append((number, layer['name'], layer['visible'], arrays))
+        return snapshot
+
+    def restore(
+        self, lookbehind: int, snapshot: ProjectSnapshot | None
+    ) -> bool:
+        # Same printing and result as BezierCurve.restore
+        if snapshot is None:
+            print(f'Could not look behind {lookbehind} saves')
+            return True
+        for layer in self.layers:
+            print(
+                f'Previous drawing of {layer.name}: ',
+                [dataclasses.asdict(anchor) for anchor in layer.curve.anchors],
+            )
+        self.set_layers(snapshot)
+        print(f'Loaded drawing: {self.status()}')
+        return False
+
+    def history(self, number: int) -> History:
+        if number not in self.histories:
+            self.histories[number] = open_history(
+                self.layer_name(number), self.save_format
+            )
+        return self.histories[number]
+
+    def read_manifest(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.manifest):
+            return []
+        lines = []
+        with open(self.manifest) as file:
+            for line in file:
+                if not line.endswith('\n'):
+                    # Left by an interrupted save
+                    break
+                lines.append(json.loads(line))
+        return lines
+
+    def read_versions(self) -> Dict[int, int]:
+        # Saves appended to each layer's history so far, going by the last
+        # manifest line. Only differences between versions matter, so a
+        # project saved before layers starts from its last save.
+        if self.versions is None:
+            lines = self.read_manifest()
+            if lines:
+                self.versions = {
+                    layer['number']: layer['version']
+                    for layer in lines[-1]['layers']
+                }
+            else:
+                self.versions = {0: int(self.history(0).exists())}
+        return self.versions
+
+    def make_formula(
+        self,
+        include_setup: bool = True,
+        round_places: int = 5,
+        height: float = 10.0,
+        mode: str = 'sum',
+        max_segments: int = FORMULA_MAX_SEGMENTS,
+        tolerance: float = 0.0,
+        arc_length: bool = False,
+    ) -> Tuple[Formula | None, str]:
+        # Setup formulae once, then the expressions of every visible layer,
+        # reusing those of layers that have not changed, and a line for
+        # each layer that was simplified
+        self.layer.refresh()
+        formulas = []
+        reports = []
+        for layer in self.layers:
+            if not layer.visible:
+                continue
+            formula, report = layer.formula(
+                round_places,
+                height,
+                mode,
+                max_segments,
+                tolerance,
+                arc_length,
+            )
+            if formula is not None:
+                formulas.append(formula)
+            if report:
+                reports.append(report)
+        if not formulas:
+            return None, ''
+        setup = (
+            BezierCurve.setup_equations(mode, arc_length)
+            if include_setup
+            else ()
+        )
+        return (
+            Formula(
+                ''.join(line + '\n' for line in setup) + '\n'.join(formulas)
+            ),
+            '\n'.join(reports),
+        )
+
+    def to_formula(
+        self,
+        include_setup: bool = True,
+        round_places: int = 5,
+        height: float = 10.0,
+        mode: str = 'sum',
+        max_segments: int = FORMULA_MAX_SEGMENTS,
+        tolerance: float = 0.0,
+        arc_length: bool = False,
+    ) -> Formula | None:
+        formula, report = self.make_formula(
+            include_setup,
+            round_places,
+            height,
+            mode,
+            max_segments,
+            tolerance,
+            arc_length,
+        )
+        if report:
+            print(report)
+        return formula
+
+    def curve_to_formula(self) -> Formula | None:
+        if not any(
+            layer.visible and layer.curve.can_export() for layer in self.layers
+        ):
+            return None
+        options = export_options()
+        self.layer.refresh()
+        return cached_formula(
+            [layer.arrays for layer in self.layers if layer.visible],
+            options,
+            lambda: self.make_formula(*options),
+        )
@@ -0,0 +1,106 @@
+import dataclasses
+import time
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from .project import ProjectSnapshot
+
+
+@dataclasses.dataclass
+class Recording:
+    # Everything the editor loop read in a session and the drawing it
+    # started from: the anchors of every layer one after another, with the
+    # anchor count, name and visibility of each layer. Per frame: times in
+    # seconds from the first frame, and frames rows of mouse x, mouse y,
+    # held modifier keys and whether backspace was held. Events rows are
+    # frame, pygame event type and the button or key (0 for other events),
+    # in the order they came.
+    positions: np.ndarray
+    ghosts: np.ndarray
+    times: np.ndarray
+    frames: np.ndarray
+    events: np.ndarray
+    sizes: np.ndarray
+    names: np.ndarray
+    visible: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def save(self, path: str) -> None:
+        # Through a file object, which keeps numpy from adding .npz
+        with open(path, 'wb') as file:
+            np.savez_compressed(file, **dataclasses.asdict(self))
+
+    @classmethod
+    def load(cls, path: str) -> 'Recording':
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+    def layers(self) -> ProjectSnapshot:
+        bounds = np.concatenate(([0], np.cumsum(self.sizes))).tolist()
+        return [
+            (
+                number,
+                name,
+                visible,
+                (self.positions[start:end], self.ghosts[start:end]),
+            )
+            for number, (name, visible, start, end) in enumerate(
+                zip(
+                    self.names.tolist(),
+                    self.visible.tolist(),
+                    bounds[:-1],
+                    bounds[1:],
+                )
+            )
+        ]
+
+    def frame_events(self) -> List[np.ndarray]:
+        # (type, value) rows of the events of each frame
+        bounds = np.searchsorted(self.events[:, 0], np.arange(len(self) + 1))
+        return [
+            self.events[start:end, 1:]
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+
+
+class Recorder:
+    # Collects the editor's input frame by frame and writes it as a
+    # Recording on close
+    def __init__(self, path: str, layers: ProjectSnapshot) -> None:
+        self.path = path
+        self.layers = layers
+        self.start: float | None = None
+        self.times: List[float] = []
+        self.frames: List[Tuple[int, int, int, int]] = []
+        self.events: List[Tuple[int, int, int]] = []
+
+    def add(
+        self,
+        mouse: Tuple[int, int],
+        events: Sequence[Tuple[int, int]],
+        mods: int,
+        backspace: bool,
+    ) -> None:
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        frame = len(self.times)
+        self.times.append(now - self.start)
+        self.frames.append((*mouse, mods, backspace))
+        self.events.extend((frame, *event) for event in events)
+
+    def close(self) -> None:
+        layers = self.layers
+        Recording(
+            np.concatenate([arrays[0] for *_, arrays in layers]),
+            np.concatenate([arrays[1] for *_, arrays in layers]),
+            np.array(self.times, dtype=np.float64),
+            np.array(self.frames, dtype=np.int64).reshape(-1, 4),
+            np.array(self.events, dtype=np.int64).reshape(-1, 3),
+            np.array([len(arrays[1]) for *_, arrays in layers]),
+            np.array([name for _, name, _, _ in layers]),
+            np.array([visible for _, _, visible, _ in layers]),
+        ).save(self.path)
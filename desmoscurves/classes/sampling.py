@@ -0,0 +1,262 @@
+import dataclasses
+import functools
+from typing import List, Tuple
+
+import numpy as np
+
+from ..constant import (
+    ARC_LENGTH_ITERATIONS,
+    ARC_LENGTH_MAX_PIECES,
+    ARC_LENGTH_MIN_TABLE,
+    ARC_LENGTH_ORDER,
+    ARC_LENGTH_PIECES,
+    ARC_LENGTH_TAME,
+    ARC_LENGTH_TOLERANCE,
+    BEZIER_MAX_STEPS,
+)
+
+
+@dataclasses.dataclass
+class Polyline:
+    # Points sampled along segments, segment by segment. Every segment
+    # contributes its start point, its end point and the points between, so
+    # consecutive points with the same segment number form its polyline.
+    points: np.ndarray  # (k, 2)
+    segments: np.ndarray  # (k,) segment number of each point
+    parameters: np.ndarray  # (k,) t of each point within its segment
+    ghosts: np.ndarray  # (k,) ghost flag of each point's segment
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def lines(self) -> np.ndarray:
+        # Mask of the points that end a line from the previous point
+        same = np.zeros(len(self.points), dtype=bool)
+        same[1:] = self.segments[1:] == self.segments[:-1]
+        return same
+
+
+def flatness_steps(
+    segments: np.ndarray,
+    tolerance: float,
+    max_steps: int = BEZIER_MAX_STEPS,
+) -> np.ndarray:
+    # Fewest equal steps per (m, 4, 2) segment that keep every chord within
+    # tolerance of the curve. A chord over a step of length h strays at
+    # most h^2 / 8 times the largest second derivative, and that is at most
+    # 6 times the larger second difference of the control points.
+    second = np.maximum(
+        np.linalg.norm(
+            segments[:, 0] - 2 * segments[:, 1] + segments[:, 2], axis=1
+        ),
+        np.linalg.norm(
+            segments[:, 1] - 2 * segments[:, 2] + segments[:, 3], axis=1
+        ),
+    )
+    steps = np.ceil(np.sqrt(0.75 * second / tolerance))
+    return np.clip(steps, 1, max_steps).astype(np.intp)
+
+
+def bernstein(t: np.ndarray) -> np.ndarray:
+    # Cubic Bernstein basis at parameters t, in a new last axis
+    s = 1 - t
+    return np.stack((s**3, 3 * t * s**2, 3 * t**2 * s, t**3), axis=-1)
+
+
+def sample_segments(
+    segments: np.ndarray,
+    steps: int | np.ndarray,
+    ghosts: np.ndarray | None = None,
+) -> Polyline:
+    # Evaluates all (m, 4, 2) segments at once, each at steps + 1 equally
+    # spaced parameters; steps is one count for every segment or one per
+    # segment. Segments with the same count share one basis matrix, so the
+    # work is a handful of matrix products however many segments there are.
+    count = len(segments)
+    steps = np.broadcast_to(np.asarray(steps, dtype=np.intp), (count,))
+    if ghosts is None:
+        ghosts = np.zeros(count, dtype=bool)
+
+    sizes = steps + 1
+    starts = np.cumsum(sizes) - sizes
+    owners = np.repeat(np.arange(count), sizes)
+    counts = np.unique(steps).tolist()
+    if len(counts) == 1:
+        # Every segment has the same count; no scattering needed
+        t = np.linspace(0, 1, counts[0] + 1)
+        points = (bernstein(t) @ segments).reshape(-1, 2)
+        parameters = np.tile(t, count)
+    else:
+        points = np.empty((len(owners), 2))
+        parameters = np.empty(len(owners))
+        for step in counts:
+            t = np.linspace(0, 1, step + 1)
+            group = np.flatnonzero(steps == step)
+            where = (starts[group, None] + np.arange(step + 1)).ravel()
+            points[where] = (bernstein(t) @ segments[group]).reshape(-1, 2)
+            parameters[where] = np.tile(t, len(group))
+
+    return Polyline(points, owners, parameters, ghosts[owners])
+
+
+def differences(segments: np.ndarray) -> np.ndarray:
+    # (3, 2, m) differences between the control points of (m, 4, 2)
+    # segments, coordinate by coordinate so each is contiguous
+    return np.ascontiguousarray(np.diff(segments, axis=1).transpose(1, 2, 0))
+
+
+def speeds(deltas: np.ndarray, t: np.ndarray | float) -> np.ndarray:
+    # (m,) speeds at parameters t, one per segment or the same for all, of
+    # the segments with these differences
+    s = 1 - t
+    velocity = s * s * deltas[0]
+    velocity += 2 * s * t * deltas[1]
+    velocity += t * t * deltas[2]
+    return 3 * np.hypot(velocity[0], velocity[1])
+
+
+@functools.lru_cache
+def gauss_legendre(order: int) -> Tuple[List[float], List[float]]:
+    # Nodes and weights on -1..1
+    nodes, weights = np.polynomial.legendre.leggauss(order)
+    return nodes.tolist(), weights.tolist()
+
+
+def partial_lengths(
+    deltas: np.ndarray,
+    start: np.ndarray | float,
+    end: np.ndarray | float,
+    order: int = ARC_LENGTH_ORDER,
+) -> np.ndarray:
+    # (m,) lengths between parameters start and end of the segments with
+    # these differences, by Gauss-Legendre quadrature of the speed. The
+    # speed is the root of a quartic, so a few nodes are exact to well under
+    # a pixel unless the range holds a cusp. One node at a time keeps memory
+    # to a few (m, 2) arrays.
+    half = (np.asarray(end) - start) / 2
+    lengths = np.zeros(deltas.shape[-1])
+    for node, weight in zip(*gauss_legendre(order)):
+        lengths += weight * speeds(deltas, start + half * (node + 1))
+    return lengths * half
+
+
+def arc_lengths(segments: np.ndarray, pieces: int = 1) -> np.ndarray:
+    # (m, pieces) lengths of equal parameter pieces of (m, 4, 2) segments
+    deltas = differences(segments)
+    lengths = np.zeros((len(segments), pieces))
+    for piece in range(pieces):
+        lengths[:, piece] = partial_lengths(
+            deltas, piece / pieces, (piece + 1) / pieces
+        )
+    return lengths
+
+
+def tame(segments: np.ndarray, ratio: float = ARC_LENGTH_TAME) -> np.ndarray:
+    # Mask of the (m, 4, 2) segments whose velocity keeps within a narrow
+    # cone around the chord: every difference of control points but empty
+    # handles leads along the chord by at least ratio times the longest of
+    # them. The velocity blends those differences, so the speed changes
+    # slowly and has no cusp or loop for the quadrature to miss.
+    deltas = np.diff(segments, axis=1)
+    chord = segments[:, 3] - segments[:, 0]
+    along = np.einsum('mkc,mc->mk', deltas, chord)
+    sizes = np.linalg.norm(deltas, axis=2)
+    along[sizes == 0] = np.inf
+    return along.min(axis=1) >= (
+        ratio * sizes.max(axis=1) * np.linalg.norm(chord, axis=1)
+    )
+
+
+def segment_arc_lengths(
+    segments: np.ndarray,
+    tolerance: float = ARC_LENGTH_TOLERANCE,
+    pieces: int = ARC_LENGTH_PIECES,
+) -> np.ndarray:
+    # (m,) lengths of (m, 4, 2) segments. Tame segments are exact to far
+    # below a hundredth of a pixel at the first count of pieces; other
+    # segments whose length still moves by more than tolerance pixels when
+    # their pieces are halved, such as those with cusps or tight loops, are
+    # split further, up to ARC_LENGTH_MAX_PIECES pieces.
+    lengths = arc_lengths(segments, pieces).sum(axis=1)
+    pending = np.flatnonzero(~tame(segments))
+    while len(pending) and pieces < ARC_LENGTH_MAX_PIECES:
+        pieces *= 2
+        finer = arc_lengths(segments[pending], pieces).sum(axis=1)
+        settled = np.abs(finer - lengths[pending]) <= tolerance
+        lengths[pending] = finer
+        pending = pending[~settled]
+    return lengths
+
+
+def arc_length_tables(
+    segments: np.ndarray,
+    ghosts: np.ndarray,
+    ranges: List[Tuple[int, int]],
+    pieces: int = ARC_LENGTH_PIECES,
+    min_entries: int = ARC_LENGTH_MIN_TABLE,
+    iterations: int = ARC_LENGTH_ITERATIONS,
+) -> List[np.ndarray]:
+    # For each (first, last) range of (m, 4, 2) segments, the segment
+    # parameters from 0 to last - first that following at an even pace
+    # moves along those segments at the same speed everywhere. The speed
+    # jumps where segments meet, so every join is an entry: each segment
+    # gets a whole number of entries, at least one and otherwise in
+    # proportion to its length, spread evenly along it. A range gets
+    # pieces entries per segment, or min_entries if that is more. Ghost
+    # segments get an even share, as many as without the table, so Desmos
+    # still lands on them and leaves a gap.
+    lengths = arc_lengths(segments, pieces)
+    totals = lengths.sum(axis=1)
+    entries = np.zeros(len(segments), dtype=int)
+    for first, last in ranges:
+        share = max(pieces, -(-min_entries // (last - first)))
+        entries[first:last] = share
+        drawn = first + np.flatnonzero(~ghosts[first:last])
+        if totals[drawn].sum() > 0:
+            # Largest remainders of the proportional share beyond one each
+            spare = (share - 1) * len(drawn)
+            quotas = spare * totals[drawn] / totals[drawn].sum()
+            extra = np.floor(quotas).astype(int)
+            extra[np.argsort(extra - quotas)[: spare - extra.sum()]] += 1
+            entries[drawn] = 1 + extra
+    segment = np.repeat(np.arange(len(segments)), entries)
+    firsts = np.cumsum(entries) - entries
+    t = (np.arange(len(segment)) - firsts[segment]) / entries[segment]
+
+    # The parameter at each fraction of the length of a drawn segment, in
+    # its piece of equal parameter, by Newton steps on the length from the
+    # start of the piece, falling back to bisection where the speed is too
+    # low for them
+    find = np.flatnonzero(~ghosts[segment] & (totals[segment] > 0))
+    along = t[find] * totals[segment[find]]
+    ends = np.cumsum(lengths, axis=1)[segment[find]]
+    piece = np.minimum((ends <= along[:, None]).sum(axis=1), pieces - 1)
+    rows = np.arange(len(find))
+    remaining = along - (ends[rows, piece] - lengths[segment[find], piece])
+    deltas = differences(segments[segment[find]])
+    start = piece / pieces
+    low, high = start, start + 1 / pieces
+    found = (
+        start
+        + np.clip(remaining / lengths[segment[find], piece], 0, 1) / pieces
+    )
+    for _ in range(iterations):
+        error = partial_lengths(deltas, start, found) - remaining
+        low = np.where(error < 0, found, low)
+        high = np.where(error < 0, high, found)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            found = found - error / speeds(deltas, found)
+        outside = ~((found >= low) & (found <= high))
+        found[outside] = (low[outside] + high[outside]) / 2
+    t[find] = found
+    parameters = segment + t
+    return [
+        np.append(
+            parameters[
+                firsts[first] : firsts[first] + entries[first:last].sum()
+            ]
+            - first,
+            last - first,
+        )
+        for first, last in ranges
+    ]
@@ -0,0 +1,109 @@
+import math
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from .anchor import Anchor
+from .position import Position
+from .spatial_index import SpatialIndex
+
+
+def inside_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    # Even-odd test of (k, 2) points against a closed (p, 2) polygon, one
+    # edge at a time over all points
+    inside = np.zeros(len(points), dtype=bool)
+    x, y = points[:, 0], points[:, 1]
+    for (x1, y1), (x2, y2) in zip(
+        polygon.tolist(), np.roll(polygon, -1, axis=0).tolist()
+    ):
+        if y1 == y2:
+            continue
+        crosses = (y1 > y) != (y2 > y)
+        inside ^= crosses & (x < x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+    return inside
+
+
+def rotation(degrees: float) -> np.ndarray:
+    # Clockwise on screen, since y points down
+    radians = math.radians(degrees)
+    cos, sin = math.cos(radians), math.sin(radians)
+    return np.array([[cos, -sin], [sin, cos]])
+
+
+class Selection:
+    # Anchors picked with a rectangle or lasso, keyed by anchor identity
+    # like SpatialIndex. While the mouse is held, path has the two corners
+    # of the rectangle or every point of the lasso. revision counts the
+    # changes to which anchors are selected.
+    def __init__(self) -> None:
+        self.anchors: Dict[int, Anchor] = {}
+        self.path: List[Position] = []
+        self.lasso = False
+        self.revision = 0
+
+    def __len__(self) -> int:
+        return len(self.anchors)
+
+    def __iter__(self) -> Iterator[Anchor]:
+        return iter(self.anchors.values())
+
+    def __contains__(self, anchor: Anchor) -> bool:
+        return id(anchor) in self.anchors
+
+    @property
+    def selecting(self) -> bool:
+        return len(self.path) > 0
+
+    def clear(self) -> None:
+        self.anchors.clear()
+        self.path.clear()
+        self.revision += 1
+
+    def discard(self, anchor: Anchor) -> None:
+        self.anchors.pop(id(anchor), None)
+        self.revision += 1
+
+    def start(self, mouse: Position, lasso: bool = False) -> None:
+        self.path = [mouse.copy(), mouse.copy()]
+        self.lasso = lasso
+
+    def extend(self, mouse: Position) -> None:
+        if not self.selecting:
+            return
+        if self.lasso:
+            self.path.append(mouse.copy())
+        else:
+            self.path[-1] = mouse.copy()
+
+    def finish(self, index: SpatialIndex) -> None:
+        # Selects the anchors whose points are inside the rectangle or lasso,
+        # replacing the previous selection
+        if not self.selecting:
+            return
+        path = np.array([position.tup for position in self.path])
+        self.path.clear()
+        left, top = path.min(axis=0).tolist()
+        right, bottom = path.max(axis=0).tolist()
+        candidates = [
+            anchor
+            for anchor in index.query(left, top, right, bottom)
+            if anchor.point is not None
+        ]
+        points = np.array(
+            [anchor.point.tup for anchor in candidates], dtype=np.float64
+        ).reshape(-1, 2)
+        if self.lasso:
+            inside = inside_polygon(points, path)
+        else:
+            inside = (
+                (points[:, 0] >= left)
+                & (points[:, 0] <= right)
+                & (points[:, 1] >= top)
+                & (points[:, 1] <= bottom)
+            )
+        self.anchors = {
+            id(anchor): anchor
+            for anchor, selected in zip(candidates, inside.tolist())
+            if selected
+        }
+        self.revision += 1
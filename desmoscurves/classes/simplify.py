@@ -0,0 +1,532 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from ..constant import (
+    SIMPLIFY_FLATNESS,
+    SIMPLIFY_ITERATIONS,
+    SIMPLIFY_MAX_SPAN,
+    SIMPLIFY_REACH,
+    SIMPLIFY_SAMPLES,
+)
+from .sampling import flatness_steps, sample_segments
+
+# Handles closer than this to their point count as a sharp point
+SHARP_LENGTH = 1e-6
+
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    # Unit vectors along the last axis; zero where a vector has no length
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(
+        vectors,
+        lengths,
+        out=np.zeros_like(vectors),
+        where=lengths > SHARP_LENGTH,
+    )
+
+
+def smooth_anchors(positions: np.ndarray) -> np.ndarray:
+    # Anchors whose handles both have length and point in opposite
+    # directions; anything else is a sharp point or corner and is kept
+    reverse = unit(positions[:, 0] - positions[:, 1])
+    forward = unit(positions[:, 2] - positions[:, 1])
+    cross = reverse[:, 0] * forward[:, 1] - reverse[:, 1] * forward[:, 0]
+    dot = (reverse * forward).sum(axis=1)
+    return (np.abs(cross) <= 1e-3) & (dot < -0.5)
+
+
+# Vectors coordinate by coordinate, which keeps every array contiguous
+Vectors = Tuple[np.ndarray, np.ndarray]
+
+
+def split(vectors: np.ndarray) -> Vectors:
+    return vectors[:, 0].copy(), vectors[:, 1].copy()
+
+
+def dot(a: Vectors, b: Vectors) -> np.ndarray:
+    return a[0] * b[0] + a[1] * b[1]
+
+
+def solve_tridiagonal(
+    lower: np.ndarray,
+    diagonal: np.ndarray,
+    upper: np.ndarray,
+    rhs: np.ndarray,
+) -> np.ndarray:
+    # Solves lower[i] x[i - 1] + diagonal[i] x[i] + upper[i] x[i + 1] =
+    # rhs[i] by parallel cyclic reduction: each pass eliminates the
+    # unknowns step rows away from every row at once, so log2 of the size
+    # passes leave one unknown per row. Stable for the symmetric positive
+    # definite systems least squares gives.
+    a = np.array(lower, dtype=np.float64)
+    b = np.array(diagonal, dtype=np.float64)
+    c = np.array(upper, dtype=np.float64)
+    d = np.array(rhs, dtype=np.float64)
+    count = len(b)
+    a[:1] = 0
+    c[-1:] = 0
+    step = 1
+    # Rows only couple within their chain, so the passes can stop once no
+    # row is coupled to another any more
+    while step < count and (a.any() or c.any()):
+        # Multiples of the rows step before and after each row that cancel
+        # its neighbours; rows past the ends count as 0 = 0
+        before = np.zeros(count)
+        after = np.zeros(count)
+        before[step:] = -a[step:] / b[:-step]
+        after[:-step] = -c[:-step] / b[step:]
+        next_a = np.zeros(count)
+        next_c = np.zeros(count)
+        next_a[step:] = before[step:] * a[:-step]
+        next_c[:-step] = after[:-step] * c[step:]
+        b[step:] += before[step:] * c[:-step]
+        b[:-step] += after[:-step] * a[step:]
+        d_before = before[step:] * d[:-step]
+        d[:-step] += after[:-step] * d[step:]
+        d[step:] += d_before
+        a, c = next_a, next_c
+        step *= 2
+    return d / b
+
+
+def chains(firsts: np.ndarray, lasts: np.ndarray, count: int) -> np.ndarray:
+    # Number of the chain each of count unknowns is in, for cubics whose
+    # start handles are the unknowns firsts and end handles lasts (-1 for
+    # a known length). Unknowns are numbered along the curve, so a cubic
+    # with both handles unknown joins unknowns i and i + 1.
+    joined = np.zeros(count, dtype=bool)
+    both = (firsts >= 0) & (lasts >= 0)
+    joined[firsts[both]] = True
+    return np.cumsum(np.concatenate(([True], ~joined[:-1]))) - 1
+
+
+def fit_lengths(
+    points: np.ndarray,
+    forward: np.ndarray,
+    reverse: np.ndarray,
+    lengths: np.ndarray,
+    unknowns: np.ndarray,
+    samples: Vectors,
+    sample_starts: np.ndarray,
+    firsts: np.ndarray,
+    lasts: np.ndarray,
+    tolerance: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # For k cubics between the anchors firsts and lasts, with handles along
+    # the unit tangents forward and reverse, the handle lengths that best
+    # fit the samples of the original segments between them in least
+    # squares. lengths holds the reverse then forward handle length of each
+    # anchor, and unknowns the number each one is solved as or -1 to keep
+    # it. Handles sharing a number, like the two of a smooth anchor, get
+    # the same length, which ties the cubics next to them into chains;
+    # each chain's normal equations are tridiagonal and solved together.
+    # Parameters start from chord lengths and are refined by Newton steps
+    # while a chain has a cubic out of tolerance. Returns the lengths and,
+    # per cubic, the largest distance from a sample to its cubic at the
+    # sample's parameter, which bounds the distance to the cubic, or a
+    # bound on that still within tolerance.
+    count = int(unknowns.max()) + 1
+    start_slots, end_slots = 2 * firsts + 1, 2 * lasts
+    starts, ends = unknowns[start_slots], unknowns[end_slots]
+    has_start, has_end = starts >= 0, ends >= 0
+    chain = chains(starts, ends, count)
+    row_chains = chain[np.where(has_start, starts, ends)]
+    start = points[firsts]
+    # Every vector in the fit is a sum of the two tangents and the chord,
+    # less a sample. The normal equations only need the dot products of
+    # those, once per cubic, and of each sample with them, once per sample.
+    directions = [
+        split(vectors)
+        for vectors in (forward[firsts], reverse[lasts], points[lasts] - start)
+    ]
+    grams = {
+        (i, j): dot(directions[i], directions[j])
+        for i in range(3)
+        for j in range(i, 3)
+    }
+
+    # The samples of all cubics in one run, cubic after cubic, from the
+    # start of their cubic
+    sizes = sample_starts[lasts] - sample_starts[firsts]
+    first_samples = np.cumsum(sizes) - sizes
+    picked = np.arange(sizes.sum()) + np.repeat(
+        sample_starts[firsts] - first_samples, sizes
+    )
+    reaches = (
+        samples[0][picked] - np.repeat(start[:, 0], sizes),
+        samples[1][picked] - np.repeat(start[:, 1], sizes),
+    )
+    del picked
+    steps = [np.diff(reach, prepend=reach[:1]) for reach in reaches]
+    for step, reach in zip(steps, reaches):
+        step[first_samples] = reach[first_samples]
+    distances = np.sqrt(dot(steps, steps))
+    del steps
+    travelled = np.cumsum(distances)
+    lengths_along = np.add.reduceat(distances, first_samples)
+    all_t = (
+        travelled
+        - np.repeat(travelled[first_samples] - distances[first_samples], sizes)
+    ) / np.repeat(np.maximum(lengths_along, SHARP_LENGTH), sizes)
+    projections = [
+        dot(reaches, (np.repeat(x, sizes), np.repeat(y, sizes)))
+        for x, y in directions
+    ]
+
+    def spans(rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # The samples of the cubics rows, the first of each cubic among
+        # them and the one of rows each sample is of
+        row_sizes = sizes[rows]
+        row_firsts = np.cumsum(row_sizes) - row_sizes
+        picked = np.arange(row_sizes.sum()) + np.repeat(
+            first_samples[rows] - row_firsts, row_sizes
+        )
+        return picked, row_firsts, np.repeat(rows, row_sizes)
+
+    def combine(x: tuple, vectors: List[Vectors]) -> Vectors:
+        # Sums of the tangents and chords of cubics with weights x
+        first, second, third = vectors
+        return (
+            x[0] * first[0] + x[1] * second[0] + x[2] * third[0],
+            x[0] * first[1] + x[1] * second[1] + x[2] * third[1],
+        )
+
+    # A handle fit to point backwards is held at a short length
+    shortest = np.full(count, np.inf)
+    np.minimum.at(shortest, starts[has_start], lengths_along[has_start] / 30)
+    np.minimum.at(shortest, ends[has_end], lengths_along[has_end] / 30)
+    shortest[np.isinf(shortest)] = 0
+    # A tiny pull towards the current lengths keeps unknowns that no
+    # sample depends on, like the handles of sharp points, where they are
+    current = np.zeros(count)
+    current[unknowns[unknowns >= 0]] = lengths[unknowns >= 0]
+    known_start, known_end = lengths[start_slots], lengths[end_slots]
+
+    # Sums over the samples of each cubic for its normal equations, which
+    # only change when its parameters do
+    a11, a12, a22, b_start, b_end = np.zeros((5, len(firsts)))
+    stale = np.ones(len(firsts), dtype=bool)
+    # The handle lengths each cubic's error was last measured at. Moving
+    # them by d moves a sample by at most 4/9 d, the largest weight of a
+    # handle, so cubics that stay in tolerance by that need no measuring.
+    measured = np.full((2, len(firsts)), np.nan)
+    solution = current.copy()
+    errors = np.full(len(firsts), np.inf)
+    fitting = np.ones(chain[-1] + 1, dtype=bool)
+    for iteration in range(SIMPLIFY_ITERATIONS):
+        # Only keep refitting the chains that are not good enough yet
+        rows = np.flatnonzero(fitting[row_chains])
+        summing = rows[stale[rows]]
+        picked, row_firsts, cubics = spans(summing)
+        t = all_t[picked]
+        u = 1 - t
+        b1 = 3 * t * u * u
+        b2 = 3 * t * t * u
+        # The part of the cubics the end points fix
+        tail = t * t * (3 - 2 * t)
+        a11[summing] = np.add.reduceat(b1 * b1, row_firsts)
+        a12[summing] = np.add.reduceat(b1 * b2, row_firsts)
+        a22[summing] = np.add.reduceat(b2 * b2, row_firsts)
+        b_start[summing] = np.add.reduceat(
+            b1 * (projections[0][picked] - tail * grams[0, 2][cubics]),
+            row_firsts,
+        )
+        b_end[summing] = np.add.reduceat(
+            b2 * (projections[1][picked] - tail * grams[1, 2][cubics]),
+            row_firsts,
+        )
+        stale[summing] = False
+
+        # Normal equations of the chains being fit, one row per unknown
+        s, e = starts[rows], ends[rows]
+        row_start, row_end = has_start[rows], has_end[rows]
+        cross = a12[rows] * grams[0, 1][rows]
+        diagonal = np.bincount(
+            s[row_start], (a11[rows] * grams[0, 0][rows])[row_start], count
+        ) + np.bincount(
+            e[row_end], (a22[rows] * grams[1, 1][rows])[row_end], count
+        )
+        upper = np.bincount(
+            s[row_start & row_end], cross[row_start & row_end], count
+        )
+        rhs = np.bincount(
+            s[row_start],
+            (b_start[rows] - np.where(row_end, 0, cross * known_end[rows]))[
+                row_start
+            ],
+            count,
+        ) + np.bincount(
+            e[row_end],
+            (b_end[rows] - np.where(row_start, 0, cross * known_start[rows]))[
+                row_end
+            ],
+            count,
+        )
+        pull = 1e-9 * diagonal + 1e-12
+        solving = np.flatnonzero(fitting[chain])
+        solution[solving] = np.maximum(
+            solve_tridiagonal(
+                np.concatenate(([0], upper[:-1]))[solving],
+                (diagonal + pull)[solving],
+                upper[solving],
+                (rhs + pull * current)[solving],
+            ),
+            shortest[solving],
+        )
+
+        handles = np.stack(
+            (
+                np.where(row_start, solution[s], known_start[rows]),
+                np.where(row_end, solution[e], known_end[rows]),
+            )
+        )
+        bound = errors[rows] + 4 / 9 * np.abs(
+            handles - measured[:, rows]
+        ).sum(axis=0)
+        checking = ~(bound <= tolerance)
+        errors[rows[~checking]] = bound[~checking]
+        rows = rows[checking]
+        measured[:, rows] = handles[:, checking]
+        picked, row_firsts, cubics = spans(rows)
+        t = all_t[picked]
+        u = 1 - t
+        # The handles and chord of each sample's cubic, and how far the
+        # sample's point on its cubic misses it
+        alpha, beta = measured[0, cubics], measured[1, cubics]
+        vectors = [(x[cubics], y[cubics]) for x, y in directions]
+        miss = combine(
+            (3 * t * u * u * alpha, 3 * t * t * u * beta, t * t * (3 - 2 * t)),
+            vectors,
+        )
+        miss = miss[0] - reaches[0][picked], miss[1] - reaches[1][picked]
+        squared = dot(miss, miss)
+        error = np.sqrt(
+            np.maximum(np.maximum.reduceat(squared, row_firsts), 0)
+        )
+        errors[rows] = error
+        out = np.zeros(len(firsts), dtype=bool)
+        out[rows[error > tolerance]] = True
+        fitting[:] = False
+        fitting[row_chains[out]] = True
+        if iteration == SIMPLIFY_ITERATIONS - 1 or not fitting.any():
+            break
+
+        # Newton step towards the closest point on the cubic per sample,
+        # only for the cubics out of tolerance
+        stale |= out
+        again = np.flatnonzero(out[cubics])
+        t, u, picked = t[again], u[again], picked[again]
+        alpha, beta = alpha[again], beta[again]
+        vectors = [(x[again], y[again]) for x, y in vectors]
+        miss = miss[0][again], miss[1][again]
+        velocity = combine(
+            (
+                (3 * u * u - 6 * t * u) * alpha,
+                (6 * t * u - 3 * t * t) * beta,
+                6 * t * u,
+            ),
+            vectors,
+        )
+        acceleration = combine(
+            ((6 * t - 12 * u) * alpha, (6 * u - 12 * t) * beta, 6 - 12 * t),
+            vectors,
+        )
+        numerator = dot(miss, velocity)
+        denominator = dot(velocity, velocity) + dot(miss, acceleration)
+        step = np.divide(
+            numerator,
+            denominator,
+            out=np.zeros_like(numerator),
+            where=np.abs(denominator) > SHARP_LENGTH,
+        )
+        all_t[picked] = np.clip(t - step, 0, 1)
+    return solution, errors
+
+
+def simplify(
+    positions: np.ndarray, ghosts: np.ndarray, tolerance: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Removes smooth anchors of a complete curve while each merged segment
+    # stays within tolerance of the original curve. The neighbours keep
+    # their points and handle directions; only the lengths of the handles
+    # facing a removed anchor are refit, and a smooth neighbour's two
+    # handles are given one length so they stay mirrored like the editor
+    # makes them. Ghost boundaries, sharp points and the end anchors are
+    # never removed.
+    #
+    # Works in rounds: every other removable anchor along the curve is
+    # proposed at once, and the handles the proposals share through smooth
+    # neighbours are fit together. Proposals next to a segment out of
+    # tolerance are dropped until their surroundings change, and the
+    # handles near it are fit again while the others keep their new
+    # lengths, until every segment fits; then the round is applied.
+    # Mirrored handles need the segments either side of an anchor to be
+    # about as long, which halving evenly spaced anchors keeps. A merged
+    # segment covers at most SIMPLIFY_MAX_SPAN original segments.
+    positions = np.array(positions, dtype=np.float64)
+    ghosts = np.array(ghosts, dtype=bool)
+    count = len(positions)
+    if count < 3 or tolerance <= 0:
+        return positions, ghosts
+
+    segments = np.stack(
+        (
+            positions[:-1, 1],
+            positions[:-1, 2],
+            positions[1:, 0],
+            positions[1:, 1],
+        ),
+        axis=1,
+    )
+    # Points along every segment close enough together that the segment
+    # strays at most SIMPLIFY_FLATNESS of the tolerance from the lines
+    # between them, without the points where the segments start; those of
+    # segment k start at sample_starts[k]
+    steps = flatness_steps(
+        segments, SIMPLIFY_FLATNESS * tolerance, SIMPLIFY_SAMPLES
+    )
+    polyline = sample_segments(segments, steps)
+    samples = split(polyline.points[polyline.parameters > 0])
+    sample_starts = np.concatenate(([0], np.cumsum(steps)))
+    # Merged segments this close to the points stay within tolerance of
+    # the lines, and so of the segments
+    tolerance = (1 - SIMPLIFY_FLATNESS) * tolerance
+    points = positions[:, 1]
+    forward = unit(positions[:, 2] - points)
+    reverse = unit(positions[:, 0] - points)
+    smooth = smooth_anchors(positions)
+    forward[smooth] = unit(forward[smooth] - reverse[smooth])
+    reverse[smooth] = -forward[smooth]
+    # Handle lengths by slot: reverse handle of anchor k at 2k, forward
+    # handle at 2k + 1
+    lengths = np.linalg.norm(
+        positions[:, [0, 2]] - points[:, None], axis=2
+    ).ravel()
+
+    # Anchor k joins segment k - 1 (ghost flag k) and segment k (flag k + 1)
+    removable = smooth.copy()
+    removable[[0, -1]] = False
+    removable[1:-1] &= ghosts[1:-1] == ghosts[2:]
+
+    previous = np.arange(-1, count - 1)
+    following = np.arange(1, count + 1)
+    kept = np.ones(count, dtype=bool)
+    blocked = np.zeros(count, dtype=bool)
+    refit = np.zeros(count, dtype=bool)
+    while True:
+        candidates = np.flatnonzero(kept & removable & ~blocked)
+        candidates = candidates[
+            following[candidates] - previous[candidates] <= SIMPLIFY_MAX_SPAN
+        ]
+        if not len(candidates):
+            break
+        taken = bytearray(count)
+        for anchor, before in zip(
+            candidates.tolist(), previous[candidates].tolist()
+        ):
+            if not taken[before]:
+                taken[anchor] = True
+        proposed = np.flatnonzero(np.frombuffer(taken, dtype=bool))
+
+        # Lengths tried this round; anchors away from any trouble keep
+        # theirs while the rest of the round refits around the trouble
+        trial = lengths.copy()
+        pinned = np.zeros(count, dtype=bool)
+        while True:
+            starts, ends = previous[proposed], following[proposed]
+            before, after = previous.copy(), following.copy()
+            after[starts] = ends
+            before[ends] = starts
+            touched = np.zeros(count, dtype=bool)
+            touched[starts] = True
+            touched[ends] = True
+            trial = np.where(np.repeat(touched, 2), trial, lengths)
+
+            # Unknown lengths: the handles facing each merged segment, and
+            # the other handle of a smooth neighbour as the same unknown
+            slots = np.zeros(2 * count, dtype=bool)
+            slots[2 * starts + 1] = True
+            slots[2 * ends] = True
+            neighbours = np.flatnonzero(touched & smooth)
+            slots[2 * neighbours] = True
+            slots[2 * neighbours + 1] = True
+            slots &= ~np.repeat(pinned, 2)
+            free = np.flatnonzero(slots)
+            if not len(free):
+                break
+            shared = (free % 2 == 1) & smooth[free // 2]
+            unknowns = np.full(2 * count, -1)
+            unknowns[free] = np.cumsum(~shared) - 1
+
+            # Every segment with an unknown handle once the proposed
+            # anchors are gone
+            firsts = np.union1d(
+                free[free % 2 == 1] // 2, before[free[free % 2 == 0] // 2]
+            )
+            firsts = firsts[(firsts >= 0) & (firsts < count - 1)]
+            lasts = after[firsts]
+            solution, errors = fit_lengths(
+                points,
+                forward,
+                reverse,
+                trial,
+                unknowns,
+                samples,
+                sample_starts,
+                firsts,
+                lasts,
+                tolerance,
+            )
+            trial[free] = solution[unknowns[free]]
+            bad = errors > tolerance
+            if not bad.any():
+                break
+
+            # Drop the proposals whose merged segment is out of tolerance,
+            # or that are next to an unmerged one that is
+            merged = np.zeros(count, dtype=bool)
+            merged[starts] = True
+            plain = bad & ~merged[firsts]
+            marked = np.zeros(count, dtype=bool)
+            marked[firsts[bad & merged[firsts]]] = True
+            marked[np.maximum(before[firsts[plain]], 0)] = True
+            marked[lasts[plain]] = True
+            dropped = marked[starts]
+            blocked[proposed[dropped]] = True
+            proposed = proposed[~dropped]
+
+            # Pin what was just fit, except within SIMPLIFY_REACH anchors of
+            # a segment out of tolerance
+            near = np.zeros(count, dtype=bool)
+            near[firsts[bad]] = True
+            near[lasts[bad]] = True
+            for _ in range(SIMPLIFY_REACH):
+                sides = np.flatnonzero(near)
+                sides = np.concatenate((before[sides], after[sides]))
+                near[sides[(sides >= 0) & (sides < count)]] = True
+            pinned[free // 2] = True
+            pinned &= ~near
+
+        # Apply the proposals left, which all fit
+        starts, ends = previous[proposed], following[proposed]
+        anchors = np.flatnonzero(touched)
+        lengths[2 * anchors] = trial[2 * anchors]
+        lengths[2 * anchors + 1] = trial[2 * anchors + 1]
+        refit[anchors] = True
+        kept[proposed] = False
+        following[starts] = ends
+        previous[ends] = starts
+        changed = np.concatenate(
+            (starts, ends, previous[starts], following[ends])
+        )
+        blocked[changed[(changed >= 0) & (changed < count)]] = False
+
+    anchors = np.flatnonzero(refit)
+    positions[anchors, 0] = (
+        points[anchors] + lengths[2 * anchors, None] * reverse[anchors]
+    )
+    positions[anchors, 2] = (
+        points[anchors] + lengths[2 * anchors + 1, None] * forward[anchors]
+    )
+    return positions[kept], ghosts[kept]
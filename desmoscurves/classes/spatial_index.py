@@ -0,0 +1,164 @@
+import itertools
+import math
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from ..constant import INDEX_CELL_SIZE
+from .anchor import Anchor
+from .enums import PointType
+from .position import Position
+
+Cell = Tuple[int, int]
+
+
+class SpatialIndex:
+    # Uniform grid over the points, handles and reverse handles of anchors,
+    # keyed by anchor identity so hit tests only look at nearby cells
+    def __init__(self, cell_size: float = INDEX_CELL_SIZE) -> None:
+        self.cell_size = cell_size
+        self.cells: Dict[Cell, Dict[int, Anchor]] = {}
+        self.anchor_cells: Dict[int, List[Cell]] = {}
+
+    def __len__(self) -> int:
+        return len(self.anchor_cells)
+
+    def cell(self, x: float, y: float) -> Cell:
+        return (
+            math.floor(x / self.cell_size),
+            math.floor(y / self.cell_size),
+        )
+
+    def insert(self, anchor: Anchor) -> None:
+        self._insert(
+            anchor,
+            [
+                self.cell(position.x, position.y)
+                for position in (
+                    anchor.reverse_handle,
+                    anchor.point,
+                    anchor.handle,
+                )
+                if position is not None
+            ],
+        )
+
+    def _insert(self, anchor: Anchor, cells: Iterable[Cell]) -> None:
+        unique: List[Cell] = []
+        for cell in cells:
+            if cell in unique:
+                continue
+            unique.append(cell)
+            self.cells.setdefault(cell, {})[id(anchor)] = anchor
+        self.anchor_cells[id(anchor)] = unique
+
+    def remove(self, anchor: Anchor) -> None:
+        for cell in self.anchor_cells.pop(id(anchor), ()):
+            bucket = self.cells[cell]
+            del bucket[id(anchor)]
+            if not bucket:
+                del self.cells[cell]
+
+    def update(self, anchor: Anchor) -> None:
+        self.remove(anchor)
+        self.insert(anchor)
+
+    def update_many(
+        self,
+        anchors: Sequence[Anchor],
+        positions: np.ndarray,
+        previous: np.ndarray | None = None,
+    ) -> None:
+        # Same as update for each anchor, with the cells of the (n, 3, 2)
+        # positions of the anchors worked out in one step. Given the
+        # positions they had before, anchors that stay in the same cells, as
+        # most do after a small move, are left alone.
+        cells = np.floor(positions / self.cell_size)
+        rows = np.arange(len(cells))
+        if previous is not None:
+            before = np.floor(previous / self.cell_size)
+            same = (cells == before) | (np.isnan(cells) & np.isnan(before))
+            rows = np.flatnonzero(~same.all(axis=(1, 2)))
+        cells = cells[rows]
+        present = (~np.isnan(cells[..., 0])).tolist()
+        cells = np.nan_to_num(cells).astype(np.int64)
+        for row, xs, ys, flags in zip(
+            rows.tolist(),
+            cells[..., 0].tolist(),
+            cells[..., 1].tolist(),
+            present,
+        ):
+            anchor = anchors[row]
+            self.remove(anchor)
+            self._insert(
+                anchor,
+                [(x, y) for x, y, flag in zip(xs, ys, flags) if flag],
+            )
+
+    def rebuild(self, anchors: Iterable[Anchor]) -> None:
+        self.cells.clear()
+        self.anchor_cells.clear()
+        for anchor in anchors:
+            self.insert(anchor)
+
+    def query(
+        self, left: float, top: float, right: float, bottom: float
+    ) -> Iterator[Anchor]:
+        # Anchors with at least one position in a cell touching the box
+        left_cell, top_cell = self.cell(left, top)
+        right_cell, bottom_cell = self.cell(right, bottom)
+        width = right_cell - left_cell + 1
+        height = bottom_cell - top_cell + 1
+        if width * height > len(self.cells):
+            # Zoomed far out; walking the occupied cells is cheaper
+            cells: Iterable[Cell] = [
+                cell
+                for cell in self.cells
+                if left_cell <= cell[0] <= right_cell
+                and top_cell <= cell[1] <= bottom_cell
+            ]
+        else:
+            cells = itertools.product(
+                range(left_cell, right_cell + 1),
+                range(top_cell, bottom_cell + 1),
+            )
+
+        seen = set()
+        for cell in cells:
+            for key, anchor in self.cells.get(cell, {}).items():
+                if key not in seen:
+                    seen.add(key)
+                    yield anchor
+
+    def hit_test(
+        self, mouse: Position, point_radius: float, handle_radius: float
+    ) -> Tuple[Anchor, PointType] | None:
+        radius = max(point_radius, handle_radius)
+        hit = None
+        hit_dist = math.inf
+        for anchor in self.query(
+            mouse.x - radius,
+            mouse.y - radius,
+            mouse.x + radius,
+            mouse.y + radius,
+        ):
+            # Same precedence as before within an anchor; nearest anchor wins
+            for point_type, position in (
+                (PointType.POINT, anchor.point),
+                (PointType.REVERSE_HANDLE, anchor.reverse_handle),
+                (PointType.HANDLE, anchor.handle),
+            ):
+                if position is None:
+                    continue
+                limit = (
+                    point_radius
+                    if point_type == PointType.POINT
+                    else handle_radius
+                )
+                dist = math.dist(mouse.tup, position.tup)
+                if dist <= limit:
+                    if dist < hit_dist:
+                        hit = anchor, point_type
+                        hit_dist = dist
+                    break
+        return hit
@@ -0,0 +1,449 @@
+import math
+import re
+from typing import IO, Callable, Dict, Iterator, List, Tuple
+from xml.etree import ElementTree
+
+import numpy as np
+
+from ..constant import IMPORT_MARGIN, SIZE
+from .history import Snapshot
+
+COMMAND = re.compile(r'([MmLlHhVvCcSsQqTtAaZz])([^MmLlHhVvCcSsQqTtAaZz]*)')
+NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+# Arc arguments, where the two flags may run into what follows them
+ARC_NUMBER = re.compile(r'[\s,]*(' + NUMBER.pattern + ')')
+ARC_FLAG = re.compile(r'[\s,]*([01])')
+ARC_PATTERNS = (ARC_NUMBER,) * 3 + (ARC_FLAG,) * 2 + (ARC_NUMBER,) * 2
+TRANSFORM = re.compile(
+    r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)'
+)
+# Numbers taken by each repeat of a path command
+ARITY = {
+    'm': 2,
+    'l': 2,
+    'h': 1,
+    'v': 1,
+    'c': 6,
+    's': 4,
+    'q': 4,
+    't': 2,
+    'a': 7,
+    'z': 0,
+}
+CODES = {command: code for code, command in enumerate(ARITY)}
+ARITIES = np.array(list(ARITY.values()))
+# Argument columns of the x and y a command ends on; -1 keeps the current
+# coordinate
+END_COLUMNS = np.array(
+    [
+        (0, 1),
+        (0, 1),
+        (0, -1),
+        (-1, 0),
+        (4, 5),
+        (2, 3),
+        (2, 3),
+        (0, 1),
+        (5, 6),
+        (-1, -1),
+    ]
+)
+# Elements whose contents are only drawn when referenced from elsewhere
+HIDDEN_TAGS = {'defs', 'clipPath', 'mask', 'marker', 'pattern', 'symbol'}
+
+
+def numbers(text: str) -> List[str]:
+    return NUMBER.findall(text)
+
+
+def separated_numbers(text: str) -> List[str]:
+    # Same as numbers as long as every number is separated from the next
+    return text.replace(',', ' ').split()
+
+
+def arc_numbers(text: str) -> List[str]:
+    # Arguments of an arc command, 7 per arc; flags are single digits, so
+    # "1 0 01 5 5" is a valid pair of flags followed by 1 5 5
+    values: List[str] = []
+    position = 0
+    while text[position:].strip(' \t\r\n,'):
+        for pattern in ARC_PATTERNS:
+            match = pattern.match(text, position)
+            if match is None:
+                raise ValueError(f'Bad arc in path data: {text.strip()!r}')
+            values.append(match[1])
+            position = match.end()
+    return values
+
+
+def lines(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # Straight (k, 4, 2) segments; handles on the points make sharp anchors
+    return np.stack((starts, starts, ends, ends), axis=1)
+
+
+def quadratics(
+    starts: np.ndarray, controls: np.ndarray, ends: np.ndarray
+) -> np.ndarray:
+    # Quadratic segments raised to the cubics that trace the same curve
+    return np.stack(
+        (
+            starts,
+            starts + 2 / 3 * (controls - starts),
+            ends + 2 / 3 * (controls - ends),
+            ends,
+        ),
+        axis=1,
+    )
+
+
+def arc(
+    start: np.ndarray,
+    radii: Tuple[float, float],
+    angle: float,
+    large: bool,
+    sweep: bool,
+    end: np.ndarray,
+) -> np.ndarray:
+    # Elliptical arc as cubic segments of at most a quarter turn each,
+    # following the endpoint to center conversion of the SVG spec
+    rx, ry = abs(radii[0]), abs(radii[1])
+    if np.array_equal(start, end):
+        return np.empty((0, 4, 2))
+    if rx == 0 or ry == 0:
+        return lines(start[None], end[None])
+    phi = math.radians(angle)
+    cos, sin = math.cos(phi), math.sin(phi)
+    dx, dy = (start - end) / 2
+    x1 = cos * dx + sin * dy
+    y1 = -sin * dx + cos * dy
+    scale = x1**2 / rx**2 + y1**2 / ry**2
+    if scale > 1:
+        rx *= math.sqrt(scale)
+        ry *= math.sqrt(scale)
+    numerator = rx**2 * ry**2 - rx**2 * y1**2 - ry**2 * x1**2
+    denominator = rx**2 * y1**2 + ry**2 * x1**2
+    factor = math.sqrt(max(numerator, 0) / denominator)
+    if large == sweep:
+        factor = -factor
+    cx1 = factor * rx * y1 / ry
+    cy1 = -factor * ry * x1 / rx
+    first = math.atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+    delta = math.atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx) - first
+    if sweep and delta < 0:
+        delta += 2 * math.pi
+    elif not sweep and delta > 0:
+        delta -= 2 * math.pi
+
+    count = max(math.ceil(abs(delta) / (math.pi / 2) - 1e-9), 1)
+    step = delta / count
+    angles = first + step * np.arange(count + 1)
+    circle = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+    tangents = np.stack((-np.sin(angles), np.cos(angles)), axis=1)
+    length = 4 / 3 * math.tan(step / 4)
+    segments = np.stack(
+        (
+            circle[:-1],
+            circle[:-1] + length * tangents[:-1],
+            circle[1:] - length * tangents[1:],
+            circle[1:],
+        ),
+        axis=1,
+    )
+    # Unit circle to the ellipse around its center
+    matrix = np.array([[cos, -sin], [sin, cos]]) * (rx, ry)
+    center = matrix @ (cx1 / rx, cy1 / ry) + (start + end) / 2
+    segments = segments @ matrix.T + center
+    segments[0, 0] = start
+    segments[-1, 3] = end
+    return segments
+
+
+def path_commands(
+    data: str, split: Callable[[str], List[str]] = numbers
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Command code and relative flag of every repeat of every command in
+    # SVG path data, with all of their numbers in one array
+    codes: List[int] = []
+    relatives: List[bool] = []
+    repeats: List[int] = []
+    tokens: List[str] = []
+    for letter, text in COMMAND.findall(data):
+        command = letter.lower()
+        if command == 'z':
+            values: List[str] = []
+            count = 1
+        elif command == 'a':
+            values = arc_numbers(text)
+            count = len(values) // 7
+        else:
+            values = split(text)
+            count = len(values) // ARITY[command]
+            if not count or len(values) % ARITY[command]:
+                raise ValueError(
+                    f'Bad {letter} command in path data: {text.strip()!r}'
+                )
+        tokens += values
+        if command == 'm' and count > 1:
+            # Extra pairs after a move are lines
+            codes += CODES['m'], CODES['l']
+            relatives += [letter.islower()] * 2
+            repeats += 1, count - 1
+        else:
+            codes.append(CODES[command])
+            relatives.append(letter.islower())
+            repeats.append(count)
+    return (
+        np.repeat(np.array(codes, dtype=np.intp), repeats),
+        np.repeat(np.array(relatives, dtype=bool), repeats),
+        np.array(tokens, dtype=np.float64),
+    )
+
+
+def path_segments(data: str) -> List[np.ndarray]:
+    # Absolute (m, 4, 2) cubic segments of each subpath of SVG path data.
+    # The commands are expanded to one row per repeat and the current
+    # point after every row comes from running sums that restart at
+    # absolute coordinates, so the work is array operations over the whole
+    # path. Only closing commands, smooth quadratics and arcs are visited
+    # one at a time.
+    try:
+        # Most files separate every number, which splitting handles fast
+        code, relative, values = path_commands(data, separated_numbers)
+    except ValueError:
+        # Compact forms like "1-2" or ".5.5" need the full grammar
+        code, relative, values = path_commands(data)
+    if not len(code):
+        return []
+
+    rows = np.arange(len(code))
+    arity = ARITIES[code]
+    offsets = np.cumsum(arity) - arity
+    # Arguments of every row padded to 7 columns
+    values = np.concatenate((values, np.zeros(7)))
+    arguments = values[offsets[:, None] + np.arange(7)]
+    arguments[np.arange(7) >= arity[:, None]] = 0
+
+    # Where each row ends: the (x, y) of its last pair, or one coordinate
+    # for H and V with the other unchanged, restarting the sums wherever a
+    # coordinate is absolute. Closing rows restart at the subpath start,
+    # filled in below.
+    columns = END_COLUMNS[code]
+    given = arguments[rows[:, None], columns]
+    given[columns < 0] = 0
+    restart = ~relative[:, None] & (columns >= 0)
+    closing = code == CODES['z']
+    restart[closing] = True
+    steps = np.where(restart, 0, given)
+    sums = np.cumsum(steps, axis=0)
+    last = np.maximum.accumulate(np.where(restart, rows[:, None], -1), axis=0)
+    bases = np.where(restart, given, 0)
+
+    def end_of(row: int) -> np.ndarray:
+        point = sums[row].copy()
+        for axis in (0, 1):
+            restart_row = last[row, axis]
+            if restart_row >= 0:
+                point[axis] += (
+                    bases[restart_row, axis] - sums[restart_row, axis]
+                )
+        return point
+
+    moves = np.flatnonzero(code == CODES['m'])
+    for row in np.flatnonzero(closing).tolist():
+        # Back to the point of the move that started this subpath; earlier
+        # closing rows are already known, so this only looks backwards
+        move = moves[np.searchsorted(moves, row, 'right') - 1]
+        bases[row] = end_of(move) if len(moves) else 0
+
+    safe_last = np.maximum(last, 0)
+    axes = np.arange(2)
+    ends = sums + np.where(
+        last >= 0, bases[safe_last, axes] - sums[safe_last, axes], 0
+    )
+    starts = np.concatenate((np.zeros((1, 2)), ends[:-1]))
+
+    # Control points, made absolute from the start of their row
+    first = arguments[:, 0:2] + np.where(relative[:, None], starts, 0)
+    second = arguments[:, 2:4] + np.where(relative[:, None], starts, 0)
+    segments = lines(starts, ends)
+    cubic = code == CODES['c']
+    segments[cubic, 1] = first[cubic]
+    segments[cubic, 2] = second[cubic]
+    # Second handles, for the reflections of S
+    handles = np.where(cubic[:, None], second, first)
+    smooth = np.flatnonzero(code == CODES['s'])
+    after_cubic = np.isin(code[smooth - 1], (CODES['c'], CODES['s']))
+    after_cubic &= smooth > 0
+    segments[smooth, 1] = np.where(
+        after_cubic[:, None],
+        2 * starts[smooth] - handles[smooth - 1],
+        starts[smooth],
+    )
+    segments[smooth, 2] = first[smooth]
+    quadratic = code == CODES['q']
+    controls = first.copy()
+    for row in np.flatnonzero(code == CODES['t']).tolist():
+        if row and code[row - 1] in (CODES['q'], CODES['t']):
+            controls[row] = 2 * starts[row] - controls[row - 1]
+        else:
+            controls[row] = starts[row]
+    quadratic |= code == CODES['t']
+    segments[quadratic] = quadratics(
+        starts[quadratic], controls[quadratic], ends[quadratic]
+    )
+
+    # Rows give one segment each, except moves, closing rows already at
+    # the start and arcs, which give as many as they need
+    counts = np.ones(len(code), dtype=np.intp)
+    counts[code == CODES['m']] = 0
+    counts[closing & (starts == ends).all(axis=1)] = 0
+    arcs = {}
+    for row in np.flatnonzero(code == CODES['a']).tolist():
+        rx, ry, angle, large, sweep = arguments[row, :5].tolist()
+        arcs[row] = arc(
+            starts[row], (rx, ry), angle, large != 0, sweep != 0, ends[row]
+        )
+        counts[row] = len(arcs[row])
+    output = np.repeat(segments, counts, axis=0)
+    positions = np.cumsum(counts) - counts
+    for row, pieces in arcs.items():
+        output[positions[row] : positions[row] + len(pieces)] = pieces
+
+    # A subpath starts at every move and wherever drawing carries on
+    # after a close without one
+    previous = np.concatenate(([CODES['m']], code[:-1]))
+    starting = (code == CODES['m']) | (previous == CODES['z'])
+    subpath = np.repeat(np.cumsum(starting), counts)
+    breaks = np.flatnonzero(subpath[1:] != subpath[:-1]) + 1
+    return [piece for piece in np.split(output, breaks) if len(piece)]
+
+
+def parse_transform(text: str) -> np.ndarray:
+    # 3x3 matrix of an SVG transform attribute
+    matrix = np.identity(3)
+    for name, arguments in TRANSFORM.findall(text):
+        values = [float(value) for value in numbers(arguments)]
+        step = np.identity(3)
+        if name == 'matrix':
+            step[:2] = np.reshape(values, (3, 2)).T
+        elif name == 'translate':
+            step[:2, 2] = values[0], values[1] if len(values) > 1 else 0
+        elif name == 'scale':
+            step[0, 0] = values[0]
+            step[1, 1] = values[1] if len(values) > 1 else values[0]
+        elif name == 'rotate':
+            radians = math.radians(values[0])
+            cos, sin = math.cos(radians), math.sin(radians)
+            step[:2, :2] = [[cos, -sin], [sin, cos]]
+            if len(values) == 3:
+                # Rotate around (cx, cy)
+                center = np.array(values[1:])
+                step[:2, 2] = center - step[:2, :2] @ center
+        elif name == 'skewX':
+            step[0, 1] = math.tan(math.radians(values[0]))
+        else:
+            step[1, 0] = math.tan(math.radians(values[0]))
+        matrix = matrix @ step
+    return matrix
+
+
+def iter_elements(
+    source: str | IO,
+) -> Iterator[Tuple[str, Dict[str, str], np.ndarray]]:
+    # (tag, attributes, transform) of every drawn element in document
+    # order, the transform taking its coordinates to those of the root.
+    # Elements are dropped as soon as they end, so memory does not grow
+    # with the size of the file.
+    matrices = [np.identity(3)]
+    open_elements: List[ElementTree.Element] = []
+    hidden = 0
+    for event, element in ElementTree.iterparse(source, ('start', 'end')):
+        tag = element.tag.rsplit('}', 1)[-1]
+        if event == 'start':
+            matrices.append(
+                matrices[-1] @ parse_transform(element.get('transform', ''))
+            )
+            hidden += tag in HIDDEN_TAGS
+            if not hidden:
+                yield tag, dict(element.attrib), matrices[-1]
+            open_elements.append(element)
+            continue
+        matrices.pop()
+        hidden -= tag in HIDDEN_TAGS
+        open_elements.pop()
+        element.clear()
+        if open_elements:
+            open_elements[-1].remove(element)
+
+
+def anchors_from_subpaths(subpaths: List[np.ndarray]) -> Snapshot:
+    # Anchor positions and ghost flags joining (m, 4, 2) subpaths into one
+    # curve. A subpath of m segments takes m + 1 anchors, and the segment
+    # leading to the first anchor of every subpath after the first is a
+    # ghost, so separate shapes stay separate.
+    if not subpaths:
+        return np.empty((0, 3, 2)), np.empty(0, dtype=bool)
+    segments = np.concatenate(subpaths)
+    counts = np.array([len(subpath) for subpath in subpaths])
+    firsts = np.cumsum(counts + 1) - (counts + 1)
+    lasts = firsts + counts
+    # Anchor each segment ends on
+    ends = np.arange(len(segments)) + np.repeat(
+        np.arange(len(subpaths)) + 1, counts
+    )
+
+    positions = np.empty((len(segments) + len(subpaths), 3, 2))
+    positions[ends, 0] = segments[:, 2]
+    positions[ends, 1] = segments[:, 3]
+    positions[ends - 1, 2] = segments[:, 1]
+    # The first segment of subpath j comes after j fewer anchors
+    origins = segments[firsts - np.arange(len(subpaths)), 0]
+    positions[firsts, 0] = positions[firsts, 1] = origins
+    positions[lasts, 2] = positions[lasts, 1]
+    ghosts = np.zeros(len(positions), dtype=bool)
+    ghosts[firsts[1:]] = True
+    return positions, ghosts
+
+
+def fit_box(
+    positions: np.ndarray,
+    box: Tuple[float, float, float, float],
+    size: Tuple[int, int] = SIZE,
+    margin: float = IMPORT_MARGIN,
+) -> np.ndarray:
+    # Scales and centers positions so the (left, top, width, height) box
+    # fills the canvas, less margin pixels on every side
+    left, top, width, height = box
+    scale = min(
+        (size[0] - 2 * margin) / max(width, 1e-12),
+        (size[1] - 2 * margin) / max(height, 1e-12),
+    )
+    center = np.array((left + width / 2, top + height / 2))
+    return (positions - center) * scale + (size[0] / 2, size[1] / 2)
+
+
+def read_svg(
+    source: str | IO,
+    size: Tuple[int, int] = SIZE,
+    margin: float = IMPORT_MARGIN,
+) -> Snapshot:
+    # Every path of an SVG file as one curve in canvas coordinates. The
+    # viewBox of the root element is fitted to the canvas, or the bounds of
+    # the paths when there is none.
+    box = None
+    subpaths: List[np.ndarray] = []
+    for tag, attributes, matrix in iter_elements(source):
+        if tag == 'svg' and box is None and 'viewBox' in attributes:
+            box = tuple(map(float, numbers(attributes['viewBox'])))
+        elif tag == 'path' and attributes.get('d'):
+            for subpath in path_segments(attributes['d']):
+                subpaths.append(subpath @ matrix[:2, :2].T + matrix[:2, 2])
+    positions, ghosts = anchors_from_subpaths(subpaths)
+    if not len(positions):
+        return positions, ghosts
+
+    if box is None or len(box) != 4 or box[2] <= 0 or box[3] <= 0:
+        low = positions.reshape(-1, 2).min(axis=0)
+        high = positions.reshape(-1, 2).max(axis=0)
+        box = (low[0], low[1], *(high - low))
+    return fit_box(positions, box, size, margin), ghosts
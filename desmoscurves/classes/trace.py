@@ -0,0 +1,259 @@
+from typing import Tuple
+
+import numpy as np
+
+from ..constant import (
+    IMPORT_MARGIN,
+    SIZE,
+    TRACE_CORNER_ANGLE,
+    TRACE_MIN_POINTS,
+    TRACE_SMOOTHING,
+    TRACE_THRESHOLD,
+    TRACE_TOLERANCE,
+)
+from .history import Snapshot
+from .simplify import simplify, unit
+from .svg import fit_box
+
+# Cell edges, and the crossings marching squares draws in each cell as
+# (from, to) edges with ink always on the same side, so crossings chain
+# into closed loops. Cases are bits of the corners in ink: top left 1, top
+# right 2, bottom right 4, bottom left 8. Cases 16 and 17 are 5 and 10
+# when the ink joins through the middle of the cell.
+TOP, RIGHT, BOTTOM, LEFT = range(4)
+CROSSINGS = (
+    (),
+    ((TOP, LEFT),),
+    ((RIGHT, TOP),),
+    ((RIGHT, LEFT),),
+    ((BOTTOM, RIGHT),),
+    ((TOP, LEFT), (BOTTOM, RIGHT)),
+    ((BOTTOM, TOP),),
+    ((BOTTOM, LEFT),),
+    ((LEFT, BOTTOM),),
+    ((TOP, BOTTOM),),
+    ((RIGHT, TOP), (LEFT, BOTTOM)),
+    ((RIGHT, BOTTOM),),
+    ((LEFT, RIGHT),),
+    ((TOP, RIGHT),),
+    ((LEFT, TOP),),
+    (),
+    ((BOTTOM, LEFT), (TOP, RIGHT)),
+    ((LEFT, TOP), (RIGHT, BOTTOM)),
+)
+# The same as (18, 2) arrays, -1 where a case has fewer crossings
+STARTS, ENDS = (
+    np.array(
+        [
+            [crossing[end] for crossing in crossings]
+            + [-1] * (2 - len(crossings))
+            for crossings in CROSSINGS
+        ]
+    )
+    for end in (0, 1)
+)
+
+
+def load_image(path: str) -> np.ndarray:
+    # (h, w) grayscale values from 0 to 255 of an image file, transparent
+    # parts counted as white. pygame is only needed here, so it is
+    # imported here.
+    import pygame
+
+    surface = pygame.image.load(path)
+    colors = pygame.surfarray.array3d(surface).swapaxes(0, 1)
+    alpha = pygame.surfarray.array_alpha(surface).swapaxes(0, 1) / 255
+    gray = colors @ (0.299, 0.587, 0.114)
+    return gray * alpha + 255 * (1 - alpha)
+
+
+def trace_contours(
+    image: np.ndarray, threshold: float = TRACE_THRESHOLD
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Closed outlines of the parts of a grayscale image darker than
+    # threshold, found with marching squares over every pixel at once.
+    # Returns the (k, 2) points of all outlines one after another, in
+    # pixel coordinates with (0, 0) at the top left corner of the image,
+    # and the index each outline starts at. Outlines cross between pixel
+    # centers where the values, linearly interpolated, reach threshold.
+    # Shorter outlines than TRACE_MIN_POINTS are dropped as specks.
+    # Outside the image counts as background, so every outline closes.
+    values = np.pad(
+        threshold - np.asarray(image, dtype=np.float64),
+        1,
+        constant_values=-1,
+    )
+    # Exactly on the threshold counts as background
+    values[values == 0] = -1e-9
+    ink = values > 0
+    height, width = ink.shape
+    cases = (
+        ink[:-1, :-1] * 1
+        + ink[:-1, 1:] * 2
+        + ink[1:, 1:] * 4
+        + ink[1:, :-1] * 8
+    )
+    rows, columns = np.nonzero((cases != 0) & (cases != 15))
+    cases = cases[rows, columns]
+    # Saddles join through the middle when it is in ink
+    saddle = (cases == 5) | (cases == 10)
+    middle = (
+        values[rows, columns]
+        + values[rows, columns + 1]
+        + values[rows + 1, columns]
+        + values[rows + 1, columns + 1]
+    ) > 0
+    cases[saddle & middle] += np.where(cases[saddle & middle] == 5, 11, 7)
+
+    # Edge ids: horizontal edges between (y, x) and (y, x + 1) first,
+    # then vertical edges between (y, x) and (y + 1, x)
+    vertical = height * (width - 1)
+    cell_edges = np.stack(
+        (
+            rows * (width - 1) + columns,
+            vertical + rows * width + columns + 1,
+            (rows + 1) * (width - 1) + columns,
+            vertical + rows * width + columns,
+        ),
+        axis=1,
+    )
+    crossing = STARTS[cases] >= 0
+    cells = np.nonzero(crossing)[0]
+    starts = cell_edges[cells, STARTS[cases][crossing]]
+    ends = cell_edges[cells, ENDS[cases][crossing]]
+    if not len(starts):
+        return np.empty((0, 2)), np.empty(0, dtype=np.intp)
+
+    # Every edge is crossed once, so the crossing after each one is the one
+    # starting where it ends
+    order = np.argsort(starts)
+    following = order[np.searchsorted(starts[order], ends)]
+    loops, positions = cycles(following)
+    lengths = np.bincount(loops)
+    keep = lengths[loops] >= TRACE_MIN_POINTS
+    order = np.lexsort((positions[keep], loops[keep]))
+    edges = starts[keep][order]
+    lengths = lengths[lengths >= TRACE_MIN_POINTS]
+
+    # Where along its edge each crossing reaches the threshold
+    horizontal = edges < vertical
+    edge_rows = np.where(
+        horizontal, edges // (width - 1), (edges - vertical) // width
+    )
+    edge_columns = np.where(
+        horizontal, edges % (width - 1), (edges - vertical) % width
+    )
+    first = values[edge_rows, edge_columns]
+    second = values[edge_rows + ~horizontal, edge_columns + horizontal]
+    amount = first / (first - second)
+    # Back to image pixels: undo the padding and put pixel centers at .5
+    points = np.stack(
+        (
+            edge_columns + np.where(horizontal, amount, 0) - 0.5,
+            edge_rows + np.where(horizontal, 0, amount) - 0.5,
+        ),
+        axis=1,
+    )
+    return points, np.cumsum(lengths) - lengths
+
+
+def cycles(following: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # For a permutation given by following, the number of the cycle each
+    # element is in, counting from 0 in order of their smallest elements,
+    # and how many steps after the smallest element it comes. Pointer
+    # jumping takes log2 of the longest cycle rounds of array operations.
+    count = len(following)
+    smallest = np.arange(count)
+    jump = following.copy()
+    for _ in range(max(count - 1, 1).bit_length()):
+        np.minimum(smallest, smallest[jump], out=smallest)
+        jump = jump[jump]
+
+    # Distances to the last element of each cycle, once the cycles are cut
+    # open before their smallest element
+    heads = smallest == np.arange(count)
+    jump = np.where(heads[following], np.arange(count), following)
+    remaining = (jump != np.arange(count)).astype(np.intp)
+    for _ in range(max(count - 1, 1).bit_length()):
+        remaining = remaining + remaining[jump]
+        jump = jump[jump]
+    lengths = np.bincount(smallest)
+    numbers = np.cumsum(heads) - 1
+    return numbers[smallest], lengths[smallest] - 1 - remaining
+
+
+def contour_anchors(points: np.ndarray, starts: np.ndarray) -> Snapshot:
+    # Anchors through every point of closed outlines, joined by ghost
+    # segments. Points are smoothed first to take out the pixel steps;
+    # handles follow the outline, mirrored like the editor makes them,
+    # except at corners sharper than TRACE_CORNER_ANGLE, which are sharp
+    # points.
+    lengths = np.diff(np.append(starts, len(points)))
+    outline_starts = np.repeat(starts, lengths)
+    outline_lengths = np.repeat(lengths, lengths)
+    offsets = np.arange(len(points)) - outline_starts
+
+    def neighbours(step: int) -> np.ndarray:
+        return outline_starts + (offsets + step) % outline_lengths
+
+    previous, following = neighbours(-1), neighbours(1)
+    for _ in range(TRACE_SMOOTHING):
+        points = (points[previous] + 2 * points + points[following]) / 4
+
+    # Turning angle over two points either side, which steps over single
+    # pixel jags
+    before = unit(points - points[neighbours(-2)])
+    after = unit(points[neighbours(2)] - points)
+    turns = np.arccos(np.clip((before * after).sum(axis=1), -1, 1))
+    corners = (
+        (turns > np.radians(TRACE_CORNER_ANGLE))
+        & (turns >= turns[previous])
+        & (turns > turns[following])
+    )
+    # Both handles a third of the mean distance to the neighbours
+    incoming = np.linalg.norm(points - points[previous], axis=1)
+    outgoing = np.linalg.norm(points[following] - points, axis=1)
+    handles = unit(points[following] - points[previous]) * (
+        (incoming + outgoing)[:, None] / 6
+    )
+    handles[corners] = 0
+    anchors = np.stack((points - handles, points, points + handles), axis=1)
+
+    # Each outline ends on a copy of its first anchor to close it
+    rows = np.insert(np.arange(len(points)), starts[1:], starts[:-1])
+    rows = np.append(rows, starts[-1])
+    ghosts = np.zeros(len(rows), dtype=bool)
+    ghosts[starts[1:] + np.arange(1, len(starts))] = True
+    return anchors[rows], ghosts
+
+
+def trace_image(
+    image: np.ndarray,
+    threshold: float = TRACE_THRESHOLD,
+    tolerance: float = TRACE_TOLERANCE,
+) -> Snapshot:
+    # Outlines of the dark parts of a grayscale image as one curve in image
+    # pixels, fitted within about tolerance pixels of the outlines
+    points, starts = trace_contours(image, threshold)
+    if not len(points):
+        return np.empty((0, 3, 2)), np.empty(0, dtype=bool)
+    positions, ghosts = contour_anchors(points, starts)
+    # Each pass merges at most SIMPLIFY_MAX_SPAN segments of the last one,
+    # so two passes at half the tolerance reach much longer segments
+    for _ in range(2):
+        positions, ghosts = simplify(positions, ghosts, tolerance / 2)
+    return positions, ghosts
+
+
+def read_image(
+    path: str,
+    threshold: float = TRACE_THRESHOLD,
+    tolerance: float = TRACE_TOLERANCE,
+    size: Tuple[int, int] = SIZE,
+    margin: float = IMPORT_MARGIN,
+) -> Snapshot:
+    # Traced outlines of an image file with the image fitted to the canvas
+    image = load_image(path)
+    positions, ghosts = trace_image(image, threshold, tolerance)
+    height, width = image.shape
+    return fit_box(positions, (0, 0, width, height), size, margin), ghosts
@@ -9,21 +9,67 @@ LINE_PARAMETRIC = '({x_scale}mod({parameter}, {period}), {y_scale}({lines}))'
 BEZIER_EQUATION = 'b\\left(x,p_{1},p_{2},p_{3},p_{4}\\right)=s\\left(x,0,1\\right)\\left(\\left(1-x\\right)^{3}p_{1}+3x\\left(1-x\\right)^{2}p_{2}+3x^{2}\\left(1-x\\right)p_{3}+x^{3}p_{4}\\right)'
 BEZIER_SUM_EQUATION = 'b_{s}\\left(x,p\\right)=\\sum_{n=0}^{\\frac{\\operatorname{count}\\left(p\\right)-4}{3}}b\\left(x-n,p\\left[3n+1\\right],p\\left[3n+2\\right],p\\left[3n+3\\right],p\\left[3n+4\\right]\\right)'
 GHOST_EQUATION = 'g\left(x,p\\right)=\\frac{1}{1-\\sum_{n=1}^{\\operatorname{count}\\left(p\\right)}s\\left(x,p\\left[n\\right]-1,p\\left[n\\right]\\right)}'
+# Parts around the ghosts, x values and y values; each is preceded by the
+# parameter of the curve, {segments}t or a warp (see ARC_LENGTH_EQUATIONS)
 BEZIER_PARAMETRIC = (
     '\\left(g\\left(',
-    't,\\left[',
+    ',\\left[',
     '\\right]\\right)b_{s}\\left(',
-    't,[',
+    ',[',
     ']\\right),b_{s}\\left(',
-    't,[',
+    ',[',
     ']\\right)\\right)',
 )
+SETUP_EQUATIONS = (
+    STEP_EQUATION,
+    BEZIER_EQUATION,
+    BEZIER_SUM_EQUATION,
+    GHOST_EQUATION,
+)
+# Piecewise mode looks up the segment at floor(x) instead of summing every
+# segment, so each sample costs the same however long the curve is
+CUBIC_EQUATION = 'c\\left(x,p_{1},p_{2},p_{3},p_{4}\\right)=\\left(1-x\\right)^{3}p_{1}+3x\\left(1-x\\right)^{2}p_{2}+3x^{2}\\left(1-x\\right)p_{3}+x^{3}p_{4}'
+SEGMENT_EQUATION = 'n_{i}\\left(x,p\\right)=\\min\\left(\\operatorname{floor}\\left(x\\right),\\frac{\\operatorname{count}\\left(p\\right)-4}{3}\\right)'
+BEZIER_LOOKUP_EQUATION = 'b_{i}\\left(x,p\\right)=c\\left(x-n_{i}\\left(x,p\\right),p\\left[3n_{i}\\left(x,p\\right)+1\\right],p\\left[3n_{i}\\left(x,p\\right)+2\\right],p\\left[3n_{i}\\left(x,p\\right)+3\\right],p\\left[3n_{i}\\left(x,p\\right)+4\\right]\\right)'
+GHOST_MASK_EQUATION = 'g_{m}\\left(x,m\\right)=\\frac{1}{m\\left[\\min\\left(\\operatorname{floor}\\left(x\\right),\\operatorname{count}\\left(m\\right)-1\\right)+1\\right]}'
+PIECEWISE_PARAMETRIC = (
+    '\\left(g_{m}\\left(',
+    ',\\left[',
+    '\\right]\\right)b_{i}\\left(',
+    ',[',
+    ']\\right),b_{i}\\left(',
+    ',[',
+    ']\\right)\\right)',
+)
+PIECEWISE_SETUP_EQUATIONS = (
+    CUBIC_EQUATION,
+    SEGMENT_EQUATION,
+    BEZIER_LOOKUP_EQUATION,
+    GHOST_MASK_EQUATION,
+)
+FORMULA_MODES = {
+    'sum': (SETUP_EQUATIONS, BEZIER_PARAMETRIC),
+    'piecewise': (PIECEWISE_SETUP_EQUATIONS, PIECEWISE_PARAMETRIC),
+}
+# Evenly spaced exports warp t in 0..1 through a table u of segment
+# parameters at nearly even distances along the curve, interpolating
+# linearly between entries, so Desmos samples the curve at an even spacing
+# whatever the lengths of its segments. Looking up the entry is constant
+# time, so it suits either mode. Each expression's table is a list of its
+# own, on the line before it, named after a hash of the expression so
+# expressions of other layers and exports in the same graph never clash.
+WARP_INDEX_EQUATION = 'w_{j}\\left(x,u\\right)=\\min\\left(\\operatorname{floor}\\left(x\\left(\\operatorname{count}\\left(u\\right)-1\\right)\\right),\\operatorname{count}\\left(u\\right)-2\\right)'
+WARP_EQUATION = 'w\\left(x,u\\right)=u\\left[w_{j}\\left(x,u\\right)+1\\right]+\\left(x\\left(\\operatorname{count}\\left(u\\right)-1\\right)-w_{j}\\left(x,u\\right)\\right)\\left(u\\left[w_{j}\\left(x,u\\right)+2\\right]-u\\left[w_{j}\\left(x,u\\right)+1\\right]\\right)'
+ARC_LENGTH_EQUATIONS = (WARP_INDEX_EQUATION, WARP_EQUATION)
+WARP_TABLE = ('u_{{{name}}}=\\left[', '\\right]')
+WARP = 'w\\left(t,u_{{{name}}}\\right)'
 
 # pygame_gui.py
 SIZE = (1920, 1080)
 CURVE_COLOR = (255, 255, 255)
 HANDLE_COLOR = (160, 120, 120)
 TENTATIVE_COLOR = (120, 120, 120)
+SELECTED_COLOR = (120, 200, 255)
 GHOST = (50, 50, 100)
 AXES_COLOR = (80, 80, 80)
 DARK = (30, 30, 30)
@@ -31,8 +77,75 @@ AXES_WIDTH = 2
 HANDLE_RADIUS = 8
 POINT_RADIUS = 12
 DRAG_TOLERANCE = 3
-BEZIER_STEPS = 10
+BEZIER_MIN_STEPS = 2
+BEZIER_MAX_STEPS = 100
+BEZIER_STEP_LENGTH = 8
+BEZIER_FLATNESS = 0.5
 UNSHARP_OFFSET = (30, 0)
 NEW_HANDLE_RADIUS = 0.1
 ZOOM_MULTIPLIER = 1.3
+SELECTION_STEP = 10
+SELECTION_SCALE = 1.1
+SELECTION_ROTATION = 15
+# Frames averaged in the profiler overlay
+PROFILE_WINDOW = 30
+OVERLAY_COLOR = (230, 230, 120)
+OVERLAY_BACKGROUND = (0, 0, 0)
+OVERLAY_FONT_SIZE = 20
+# Curves of layers other than the one being edited
+LAYER_COLOR = (130, 150, 170)
 MAX_SAVES = 100
+# Saves of every layer but the first go in <project name>.layers
+LAYERS_SUFFIX = '.layers'
+# Anchor states kept for undo; a selection transform counts every anchor
+UNDO_LIMIT = 100000
+INDEX_CELL_SIZE = 64
+CHECKPOINT_INTERVAL = 20
+DIFF_LIMIT = 1000000
+FORMULA_CHUNK_SIZE = 4096
+# Desmos lists hold at most DESMOS_LIST_LIMIT values; 3 per segment stays
+# well below
+DESMOS_LIST_LIMIT = 10000
+FORMULA_MAX_SEGMENTS = 1000
+# Gauss-Legendre nodes per piece for arc lengths, pieces per segment they
+# start from and may be split into until they agree within the tolerance
+# in pixels, and the fewest entries in the tables of evenly spaced exports,
+# which otherwise have ARC_LENGTH_PIECES entries per segment on average
+ARC_LENGTH_ORDER = 8
+ARC_LENGTH_PIECES = 4
+ARC_LENGTH_MAX_PIECES = 64
+ARC_LENGTH_TOLERANCE = 0.01
+# Segments whose control points all lead along the chord by at least this
+# share of the longest step between them are not split at all
+ARC_LENGTH_TAME = 0.15
+ARC_LENGTH_MIN_TABLE = 64
+# Segments per expression that keep those tables within DESMOS_LIST_LIMIT;
+# evenly spaced exports are split at this length whatever else is asked
+ARC_LENGTH_MAX_SEGMENTS = (DESMOS_LIST_LIMIT - 1) // ARC_LENGTH_PIECES
+# Newton steps finding the curve parameter at each distance in those tables
+ARC_LENGTH_ITERATIONS = 6
+# Simplified segments are checked at points along the original segments,
+# at most SIMPLIFY_SAMPLES per segment and close enough together that the
+# segment strays at most SIMPLIFY_FLATNESS of the tolerance from the lines
+# between them
+SIMPLIFY_SAMPLES = 8
+SIMPLIFY_FLATNESS = 0.1
+SIMPLIFY_ITERATIONS = 6
+SIMPLIFY_MAX_SPAN = 32
+# Anchors either side of a simplified segment out of tolerance whose
+# handles are fit again with it
+SIMPLIFY_REACH = 4
+# Size the export cache is trimmed back to, and a number to bump whenever
+# the text exported for the same anchors and options changes
+EXPORT_CACHE_BYTES = 64 << 20
+EXPORT_CACHE_VERSION = 5
+# Pixels left around imported drawings
+IMPORT_MARGIN = 40
+# Bitmap tracing: gray level between ink and background, fitting error in
+# image pixels, smoothing passes over the outline, turning angle in degrees
+# kept as a corner and shortest outline kept, in points
+TRACE_THRESHOLD = 128
+TRACE_TOLERANCE = 1.0
+TRACE_SMOOTHING = 2
+TRACE_CORNER_ANGLE = 60
+TRACE_MIN_POINTS = 8
@@ -0,0 +1,43 @@
+import argparse
+import os
+
+from .classes.history import HISTORY_FORMATS, convert
+from .constant import LAYERS_SUFFIX
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Convert the save history of a project between formats'
+    )
+    parser.add_argument('name', help='project name (no file suffix)')
+    parser.add_argument('source', choices=HISTORY_FORMATS)
+    parser.add_argument('target', choices=HISTORY_FORMATS)
+    args = parser.parse_args()
+
+    source_format = HISTORY_FORMATS[args.source]
+    target_format = HISTORY_FORMATS[args.target]
+    # The project's own history and those of its other layers
+    names = [args.name]
+    directory = args.name + LAYERS_SUFFIX
+    if os.path.isdir(directory):
+        names += [
+            os.path.join(
+                directory, file_name.removesuffix(source_format.SUFFIX)
+            )
+            for file_name in sorted(os.listdir(directory))
+            if file_name.endswith(source_format.SUFFIX)
+        ]
+    pairs = [(source_format(name), target_format(name)) for name in names]
+    if not pairs[0][0].exists():
+        raise ValueError(f'{pairs[0][0].path} does not exist!')
+    for _, target in pairs:
+        if target.exists():
+            raise ValueError(f'{target.path} already exists!')
+
+    for source, target in pairs:
+        convert(source, target)
+        print(f'Converted {source.path} to {target.path}')
+
+
+if __name__ == '__main__':
+    main()
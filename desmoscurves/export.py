@@ -0,0 +1,437 @@
+import argparse
+import io
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, TextIO, Tuple
+
+from .classes.bezier_curve import BezierCurve
+from .classes.export_cache import (
+    ExportCache,
+    ExportOptions,
+    content_key,
+    open_cache,
+    source_key,
+)
+from .classes.history import HISTORY_FORMATS, find_history
+from .classes.project import Project
+from .constant import (
+    ARC_LENGTH_MAX_SEGMENTS,
+    FORMULA_MAX_SEGMENTS,
+    FORMULA_MODES,
+)
+
+
+def open_project(name: str) -> Project:
+    # A saved project in the format it was last saved in, so nothing is
+    # converted
+    history = find_history(name)
+    if history is None:
+        raise FileNotFoundError(f'No saves found for {name}')
+    save_format = next(
+        key
+        for key, history_format in HISTORY_FORMATS.items()
+        if type(history) is history_format
+    )
+    return Project(name, save_format=save_format)
+
+
+def load_curves(project: Project) -> List[BezierCurve]:
+    # Visible layers of the last save of a project that have a complete
+    # curve
+    snapshot = project.load(1)
+    if snapshot is None:
+        return []
+
+    curves = []
+    for _, _, visible, arrays in snapshot:
+        curve = BezierCurve(project.name, array_backed=True)
+        curve.set_arrays(*arrays)
+        if visible and curve.can_export():
+            curves.append(curve)
+    return curves
+
+
+def lookup(
+    name: str, options: ExportOptions, cache: ExportCache | None
+) -> Tuple[str | None, List[BezierCurve], List[str]]:
+    # The key of a cached export of the project, or its curves and the
+    # keys to cache their export under. A project whose save files have not
+    # changed since an earlier export is not even loaded.
+    project = open_project(name)
+    if cache is None:
+        return None, load_curves(project), []
+    files = [project.history(0).path]
+    if os.path.exists(project.manifest):
+        files.append(project.manifest)
+    source = source_key(files, options)
+    key = cache.resolve(source)
+    if key is not None:
+        return key, [], []
+
+    curves = load_curves(project)
+    if not curves:
+        return None, [], []
+    key = content_key([curve.arrays() for curve in curves], options)
+    if cache.get(key) is not None:
+        cache.link(source, key)
+        return key, [], []
+    return None, curves, [source, key]
+
+
+def simplify_curves(
+    curves: List[BezierCurve],
+    tolerance: float,
+    round_places: int,
+    height: float,
+    mode: str,
+) -> Tuple[List[BezierCurve], str]:
+    # The curves to export and a line for each one simplified
+    if tolerance <= 0:
+        return curves, ''
+    simplified = [curve.simplified(tolerance) for curve in curves]
+    report = '\n'.join(
+        f'Simplified {curve.name}: '
+        + curve.size_report(other, round_places, height, mode)
+        for curve, other in zip(curves, simplified)
+    )
+    return simplified, report
+
+
+def print_report(report: str) -> None:
+    if report:
+        print(report, file=sys.stderr)
+
+
+def write_curves(
+    sink: TextIO,
+    curves: List[BezierCurve],
+    include_setup: bool,
+    round_places: int,
+    height: float,
+    mode: str,
+    max_segments: int,
+    arc_length: bool = False,
+) -> None:
+    # The setup formulae once, then each layer's expressions on new lines
+    for number, curve in enumerate(curves):
+        if number:
+            sink.write('\n')
+        curve.write_formula(
+            sink,
+            include_setup and not number,
+            round_places,
+            height,
+            mode,
+            max_segments,
+            arc_length,
+        )
+
+
+def export_formula(
+    name: str,
+    include_setup: bool = True,
+    round_places: int = 5,
+    height: float = 10.0,
+    tolerance: float = 0.0,
+    mode: str = 'sum',
+    max_segments: int = FORMULA_MAX_SEGMENTS,
+    arc_length: bool = False,
+    cache_dir: str | None = None,
+    evict: bool = True,
+) -> str | None:
+    # cache_dir as for open_cache; evict trims the cache after adding to it
+    options = (
+        include_setup,
+        round_places,
+        height,
+        mode,
+        max_segments,
+        tolerance,
+        arc_length,
+    )
+    cache = open_cache(cache_dir)
+    key, curves, store = lookup(name, options, cache)
+    if key is not None:
+        text = cache.read(key)
+        if text is not None:
+            print_report(cache.report(key))
+            return text
+        # Evicted by another process just now
+        key, curves, store = lookup(name, options, None)
+    curves, report = simplify_curves(
+        curves, tolerance, round_places, height, mode
+    )
+    print_report(report)
+    if not curves:
+        return None
+    sink = io.StringIO()
+    write_curves(
+        sink,
+        curves,
+        include_setup,
+        round_places,
+        height,
+        mode,
+        max_segments,
+        arc_length,
+    )
+    text = sink.getvalue()
+    if store:
+        source, key = store
+        cache.put(key, text, report)
+        cache.link(source, key)
+        if evict:
+            cache.evict()
+    return text
+
+
+def export_file(
+    name: str,
+    file_path: str,
+    include_setup: bool = True,
+    round_places: int = 5,
+    height: float = 10.0,
+    tolerance: float = 0.0,
+    mode: str = 'sum',
+    max_segments: int = FORMULA_MAX_SEGMENTS,
+    arc_length: bool = False,
+    cache_dir: str | None = None,
+    evict: bool = True,
+) -> str | None:
+    # Streams the formula straight to file_path and returns it; cached
+    # formulas are copied file to file
+    options = (
+        include_setup,
+        round_places,
+        height,
+        mode,
+        max_segments,
+        tolerance,
+        arc_length,
+    )
+    cache = open_cache(cache_dir)
+    key, curves, store = lookup(name, options, cache)
+    if key is not None:
+        try:
+            shutil.copyfile(cache.path(key), file_path)
+        except FileNotFoundError:
+            # Evicted by another process just now
+            key, curves, store = lookup(name, options, None)
+        else:
+            print_report(cache.report(key))
+            with open(file_path, 'a') as file:
+                file.write('\n')
+            return file_path
+    curves, report = simplify_curves(
+        curves, tolerance, round_places, height, mode
+    )
+    print_report(report)
+    if not curves:
+        return None
+    with open(file_path, 'w') as file:
+        write_curves(
+            file,
+            curves,
+            include_setup,
+            round_places,
+            height,
+            mode,
+            max_segments,
+            arc_length,
+        )
+    if store:
+        source, key = store
+        cache.put_file(key, file_path, report)
+        cache.link(source, key)
+        if evict:
+            cache.evict()
+    with open(file_path, 'a') as file:
+        file.write('\n')
+    return file_path
+
+
+def _export(
+    arguments: Tuple[
+        str, str | None, bool, int, float, float, str, int, bool, str | None
+    ],
+) -> str | None:
+    # The cache is trimmed once the whole batch is done
+    name, output_dir, *options = arguments
+    if output_dir is None:
+        return export_formula(name, *options, evict=False)
+    file_path = os.path.join(output_dir, os.path.basename(name) + '.txt')
+    return export_file(name, file_path, *options, evict=False)
+
+
+def export_all(
+    names: Iterable[str],
+    include_setup: bool = True,
+    round_places: int = 5,
+    height: float = 10.0,
+    jobs: int | None = None,
+    output_dir: str | None = None,
+    tolerance: float = 0.0,
+    mode: str = 'sum',
+    max_segments: int = FORMULA_MAX_SEGMENTS,
+    arc_length: bool = False,
+    cache_dir: str | None = None,
+) -> Iterator[Tuple[str, str | None]]:
+    # (name, formula) pairs in the order given, computed across a process
+    # pool and yielded as soon as each one is ready. With output_dir the
+    # workers write <name>.txt files themselves and the paths are yielded
+    # instead of the formulas. A positive tolerance simplifies each curve
+    # first (see BezierCurve.simplified) and arc_length spaces samples
+    # evenly along each curve. Projects exported the same way
+    # before come from the export cache in cache_dir (see open_cache).
+    names = list(names)
+    workers = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        results = executor.map(
+            _export,
+            [
+                (
+                    name,
+                    output_dir,
+                    include_setup,
+                    round_places,
+                    height,
+                    tolerance,
+                    mode,
+                    max_segments,
+                    arc_length,
+                    cache_dir,
+                )
+                for name in names
+            ],
+            chunksize=max(len(names) // (4 * workers), 1),
+        )
+        yield from zip(names, results)
+    cache = open_cache(cache_dir)
+    if cache is not None:
+        cache.evict()
+
+
+def project_names(paths: Iterable[str]) -> List[str]:
+    # Directories expand to every project saved in them
+    names: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = {
+                os.path.join(path, file_name.removesuffix(history.SUFFIX))
+                for file_name in os.listdir(path)
+                for history in HISTORY_FORMATS.values()
+                if file_name.endswith(history.SUFFIX)
+            }
+            names += sorted(found)
+        else:
+            for history in HISTORY_FORMATS.values():
+                path = path.removesuffix(history.SUFFIX)
+            names.append(path)
+    return names
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Export saved projects as Desmos formulas'
+    )
+    parser.add_argument(
+        'paths', nargs='+', help='project names or directories of saves'
+    )
+    parser.add_argument(
+        '--round', type=int, default=5, help='decimal places (default 5)'
+    )
+    parser.add_argument(
+        '--height',
+        type=float,
+        default=10.0,
+        help='height of screen in Desmos units (default 10.0)',
+    )
+    parser.add_argument(
+        '--no-setup', action='store_true', help='leave out setup formulae'
+    )
+    parser.add_argument(
+        '--output-dir',
+        help='write <name>.txt files here instead of printing to stdout',
+    )
+    parser.add_argument(
+        '--mode',
+        choices=FORMULA_MODES,
+        default='sum',
+        help='sum adds up every segment for each point; piecewise looks up '
+        'one segment, which Desmos draws faster for long curves '
+        '(default sum)',
+    )
+    parser.add_argument(
+        '--max-segments',
+        type=int,
+        default=FORMULA_MAX_SEGMENTS,
+        help='split longer curves into several expressions, leaving out '
+        'ghost segments; 0 never splits, except with --arc-length beyond '
+        f'{ARC_LENGTH_MAX_SEGMENTS} (default {FORMULA_MAX_SEGMENTS})',
+    )
+    parser.add_argument(
+        '--simplify',
+        type=float,
+        default=0.0,
+        metavar='PIXELS',
+        help='merge anchors while staying within PIXELS of the drawn curve '
+        'and report the size saved (default 0, off)',
+    )
+    parser.add_argument(
+        '--arc-length',
+        action='store_true',
+        help='have Desmos sample each curve evenly along its length '
+        'instead of evenly per segment, so long segments stay smooth',
+    )
+    parser.add_argument(
+        '--jobs', type=int, help='worker processes (default CPU count)'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help='keep exported formulas here and reuse them for projects that '
+        'have not changed (default $DESMOSCURVES_CACHE or '
+        '~/.cache/desmoscurves)',
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='export every project again without using the cache',
+    )
+    args = parser.parse_args()
+
+    names = project_names(args.paths)
+    if args.output_dir is None:
+        # One Desmos graph only needs the setup formulae once
+        if not args.no_setup:
+            setup = BezierCurve.setup_equations(args.mode, args.arc_length)
+            sys.stdout.write(''.join(line + '\n' for line in setup))
+        include_setup = False
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        include_setup = not args.no_setup
+
+    for name, result in export_all(
+        names,
+        include_setup,
+        args.round,
+        args.height,
+        args.jobs,
+        args.output_dir,
+        args.simplify,
+        args.mode,
+        args.max_segments,
+        args.arc_length,
+        '' if args.no_cache else args.cache_dir,
+    ):
+        if result is None:
+            print(f'Skipped {name}: no complete curve', file=sys.stderr)
+        elif args.output_dir is None:
+            sys.stdout.write(result + '\n')
+        else:
+            print(f'Exported {name} to {result}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,46 +1,166 @@
+import abc
+import argparse
 import os
+from typing import Callable, List, Tuple
 
 import pygame
-import pygame.gfxdraw
 
-from .classes.bezier_curve import BezierCurve
+from .classes.background_saver import BackgroundSaver
 from .classes.enums import ClickType
+from .classes.history import HISTORY_FORMATS
 from .classes.position import Position
+from .classes.profiler import CURVE_METHODS, Profiler
+from .classes.project import Project
+from .classes.recording import Recorder
 from .constant import (
-    AXES_COLOR,
-    AXES_WIDTH,
-    BEZIER_STEPS,
-    CURVE_COLOR,
-    DARK,
-    GHOST,
-    HANDLE_COLOR,
-    HANDLE_RADIUS,
-    POINT_RADIUS,
+    SELECTION_ROTATION,
+    SELECTION_SCALE,
+    SELECTION_STEP,
     SIZE,
-    TENTATIVE_COLOR,
     ZOOM_MULTIPLIER,
 )
+from .render import Renderer
+
+SELECTION_MOVES = {
+    pygame.K_LEFT: (-1, 0),
+    pygame.K_RIGHT: (1, 0),
+    pygame.K_UP: (0, -1),
+    pygame.K_DOWN: (0, 1),
+}
+# Ctrl+Z undoes; Ctrl+Y and Ctrl+Shift+Z redo
+UNDO_KEYS = (pygame.K_z, pygame.K_y)
+# Previous and next layer
+LAYER_KEYS = {pygame.K_LEFTBRACKET: -1, pygame.K_RIGHTBRACKET: 1}
+
+# What the editor reads each frame: the mouse, the events, the modifier
+# keys held and whether backspace is held
+Frame = Tuple[Position, List[pygame.event.Event], int, bool]
+
+
+class EditorInput(abc.ABC):
+    @abc.abstractmethod
+    def next_frame(self) -> Frame | None:
+        # None once there are no more frames
+        ...
+
+
+class LiveInput(EditorInput):
+    # Frames read from pygame, also handed to a recorder if there is one
+    def __init__(self, recorder: Recorder | None = None) -> None:
+        self.recorder = recorder
+
+    def next_frame(self) -> Frame | None:
+        mouse = pygame.mouse.get_pos()
+        events = pygame.event.get()
+        mods = pygame.key.get_mods()
+        backspace = bool(pygame.key.get_pressed()[pygame.K_BACKSPACE])
+        if self.recorder is not None:
+            self.recorder.add(
+                mouse,
+                [
+                    (
+                        event.type,
+                        event.dict.get('button', event.dict.get('key', 0)),
+                    )
+                    for event in events
+                ],
+                mods,
+                backspace,
+            )
+        return Position(*mouse), events, mods, backspace
+
+
+def export_formula(project: Project) -> None:
+    formula = project.curve_to_formula()
+    if formula is not None:
+        formula.save()
 
 
 def gui() -> None:
+    parser = argparse.ArgumentParser(description='Bezier curve editor')
+    parser.add_argument(
+        '--save-format',
+        choices=HISTORY_FORMATS,
+        default='journal',
+        help='file format for saves of the project (default journal)',
+    )
+    parser.add_argument(
+        '--profile-trace',
+        metavar='FILE',
+        help='write the time of every phase of every frame to FILE as '
+        'JSON lines',
+    )
+    parser.add_argument(
+        '--record',
+        metavar='FILE',
+        help='record the session to FILE for desmoscurves-replay',
+    )
+    args = parser.parse_args()
+
     print('\nAvailable saves:')
-    for file_name in os.listdir():
-        if file_name.endswith('.json') and not os.path.isdir(file_name):
-            print('  - ' + file_name.removesuffix('.json'))
+    saves = {
+        file_name.removesuffix(history.SUFFIX)
+        for file_name in os.listdir()
+        for history in HISTORY_FORMATS.values()
+        if file_name.endswith(history.SUFFIX) and not os.path.isdir(file_name)
+    }
+    for save in sorted(saves):
+        print('  - ' + save)
     print()
 
     name = input('Project name (new or existing): ').strip().lower()
     if name == '':
         raise ValueError('Name cannot be empty!')
 
-    pygame.init()
+    pygame.display.init()
     display = pygame.display.set_mode(SIZE)
     clock = pygame.time.Clock()
+    profiler = Profiler(
+        None if args.profile_trace is None else open(args.profile_trace, 'w')
+    )
+    renderer = Renderer(display, profiler)
     print('Opened pygame')
     print('SEE README FOR INSTRUCTIONS')
 
-    curve = BezierCurve(name)
-    curve.load_drawing(1)
+    project = Project(name, save_format=args.save_format)
+    saver = BackgroundSaver(project)
+    saver.load(1)
+    recorder = (
+        None
+        if args.record is None
+        else Recorder(args.record, project.arrays())
+    )
+    try:
+        edit(
+            project,
+            saver,
+            renderer,
+            LiveInput(recorder),
+            lambda: clock.tick(30),
+            export_formula,
+        )
+    finally:
+        saver.close()
+        profiler.close()
+        if recorder is not None:
+            recorder.close()
+    pygame.quit()
+
+
+def edit(
+    project: Project,
+    saver: BackgroundSaver,
+    renderer: Renderer,
+    source: EditorInput,
+    tick: Callable[[], object],
+    export: Callable[[Project], object],
+) -> None:
+    # The editor loop: handles and draws a frame from source, then waits
+    # with tick, until the window is closed or source has no more frames.
+    # Edits go to the active layer of the project.
+    profiler = renderer.profiler
+    curve = project.curve
+    profiler.watch(curve, CURVE_METHODS)
     show_anchors = True
     lookbehind = 0
     scrolling = False
@@ -50,17 +170,26 @@ def gui() -> None:
     zoom = 1
 
     while True:
-        mouse = Position(*pygame.mouse.get_pos())
+        profiler.start_frame()
+        frame = source.next_frame()
+        if frame is None:
+            return
+        mouse, events, mods, backspace = frame
 
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
-                curve.save_progress()
-                pygame.quit()
-                quit()
+                saver.save()
+                return
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
                     if curve.dragging is not None:
                         continue
+                    if mods & (pygame.KMOD_SHIFT | pygame.KMOD_CTRL):
+                        curve.selection.start(
+                            mouse.centered(center, zoom, True),
+                            lasso=bool(mods & pygame.KMOD_CTRL),
+                        )
+                        continue
                     curve.interact(
                         mouse.centered(center, zoom, True),
                         ClickType.MOUSE,
@@ -80,35 +209,44 @@ def gui() -> None:
                     zoom = ZOOM_MULTIPLIER**zoom_times
             elif event.type == pygame.MOUSEMOTION:
                 curve.motion(mouse.centered(center, zoom, True))
+                curve.selection.extend(mouse.centered(center, zoom, True))
                 if scrolling:
                     center.x += (mouse.x - last_mouse.x) // zoom
                     center.y += (mouse.y - last_mouse.y) // zoom
                     last_mouse = mouse.copy()
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:
-                    curve.dragging = None
+                    curve.end_drag()
+                    curve.selection.finish(curve.index)
                     lookbehind = 0
                 elif event.button == 3:
                     scrolling = False
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_l:
                     lookbehind += 1
-                    if curve.load_drawing(lookbehind):
+                    if saver.load(lookbehind):
                         print('Resetting lookbehind')
                         lookbehind = 0
+                    curve = project.curve
+                    profiler.watch(curve, CURVE_METHODS)
                     continue
                 lookbehind = 0
 
-                if event.key == pygame.K_SPACE:
+                redo = event.key == pygame.K_y or mods & pygame.KMOD_SHIFT
+                if event.key in UNDO_KEYS and mods & pygame.KMOD_CTRL:
+                    if redo and not curve.redo():
+                        print('Nothing to redo')
+                    elif not redo and not curve.undo():
+                        print('Nothing to undo')
+                elif event.key == pygame.K_F3:
+                    profiler.toggle_overlay()
+                elif event.key == pygame.K_SPACE:
                     show_anchors = not show_anchors
                 elif event.key == pygame.K_RETURN:
-                    formula = curve.curve_to_formula()
-                    if formula is not None:
-                        formula.save()
+                    export(project)
                 elif event.key == pygame.K_c:
-                    curve.save_progress()
-                    curve.dragging = None
-                    curve.anchors.clear()
+                    saver.save()
+                    curve.clear()
                     print('Cleared board; load last save to revert chagnes')
                 elif event.key == pygame.K_g:
                     curve.interact(
@@ -123,7 +261,7 @@ def gui() -> None:
                         zoom,
                     )
                 elif event.key == pygame.K_s:
-                    curve.save_progress()
+                    saver.save()
                 elif event.key == pygame.K_a:
                     curve.interact(
                         mouse.centered(center, zoom, True), ClickType.ADD, zoom
@@ -132,97 +270,52 @@ def gui() -> None:
                     center.x = 0
                     center.y = 0
                     zoom = 1
+                elif event.key == pygame.K_ESCAPE:
+                    curve.selection.clear()
+                elif event.key in SELECTION_MOVES:
+                    x_move, y_move = SELECTION_MOVES[event.key]
+                    curve.translate_selection(
+                        x_move * SELECTION_STEP / zoom,
+                        y_move * SELECTION_STEP / zoom,
+                    )
+                elif event.key in (pygame.K_EQUALS, pygame.K_MINUS):
+                    curve.scale_selection(
+                        SELECTION_SCALE
+                        if event.key == pygame.K_EQUALS
+                        else 1 / SELECTION_SCALE
+                    )
+                elif event.key in (pygame.K_COMMA, pygame.K_PERIOD):
+                    curve.rotate_selection(
+                        SELECTION_ROTATION
+                        if event.key == pygame.K_PERIOD
+                        else -SELECTION_ROTATION
+                    )
+                elif event.key in (pygame.K_h, pygame.K_v):
+                    curve.mirror_selection(event.key == pygame.K_h)
+                elif event.key in (pygame.K_n, *LAYER_KEYS):
+                    if event.key == pygame.K_n:
+                        project.add_layer()
+                    else:
+                        project.select(project.active + LAYER_KEYS[event.key])
+                    curve = project.curve
+                    profiler.watch(curve, CURVE_METHODS)
+                    print(f'Layers: {project.status()}')
+                elif event.key == pygame.K_o:
+                    project.layer.visible = not project.layer.visible
+                    print(f'Layers: {project.status()}')
 
-            keys = pygame.key.get_pressed()
-            if keys[pygame.K_BACKSPACE]:
+            if backspace:
                 curve.interact(
                     mouse.centered(center, zoom, True), ClickType.REMOVE, zoom
                 )
 
-        display.fill(DARK)
-
-        if show_anchors:
-            border = pygame.Rect(
-                *Position(0, 0).centered(center, zoom).tup,
-                SIZE[0] * zoom,
-                SIZE[1] * zoom
-            )
-            pygame.draw.rect(display, AXES_COLOR, border, AXES_WIDTH)
-            pygame.draw.line(
-                display,
-                AXES_COLOR,
-                Position(0, SIZE[1] // 2).centered(center, zoom).tup,
-                Position(SIZE[0], SIZE[1] // 2).centered(center, zoom).tup,
-                AXES_WIDTH,
-            )
-            pygame.draw.line(
-                display,
-                AXES_COLOR,
-                Position(SIZE[0] // 2, 0).centered(center, zoom).tup,
-                Position(SIZE[0] // 2, SIZE[1]).centered(center, zoom).tup,
-                AXES_WIDTH,
-            )
-
-            for anchor in curve.anchors:
-                if anchor.point is None:
-                    continue
-                complete = (
-                    anchor.reverse_handle is not None
-                    and anchor.handle is not None
-                )
-
-                reverse_handle = (
-                    anchor.reverse_handle.centered(center, zoom).tup
-                    if complete
-                    else anchor.point.centered(center, zoom).flip(mouse).tup
-                )
-                handle = (
-                    anchor.handle.centered(center, zoom).tup
-                    if complete
-                    else mouse.tup
-                )
-
-                pygame.draw.circle(
-                    display,
-                    CURVE_COLOR if complete else TENTATIVE_COLOR,
-                    anchor.point.centered(center, zoom).tup,
-                    POINT_RADIUS,
-                )
-                pygame.draw.circle(
-                    display,
-                    HANDLE_COLOR if complete else TENTATIVE_COLOR,
-                    reverse_handle,
-                    HANDLE_RADIUS,
-                )
-                pygame.draw.circle(
-                    display,
-                    HANDLE_COLOR if complete else TENTATIVE_COLOR,
-                    handle,
-                    HANDLE_RADIUS,
-                )
-                pygame.draw.line(
-                    display,
-                    HANDLE_COLOR if complete else TENTATIVE_COLOR,
-                    reverse_handle,
-                    handle,
-                )
-
-        for quadruplet, ghost, incomplete in curve.quadruplets(
-            mouse.centered(center, zoom, True), center, zoom
-        ):
-            pygame.gfxdraw.bezier(
-                display,
-                quadruplet,
-                BEZIER_STEPS,
-                TENTATIVE_COLOR
-                if incomplete
-                else GHOST
-                if ghost
-                else CURVE_COLOR,
-            )
-
-        clock.tick(30)
-        pygame.display.update()
+        profiler.lap('events')
+        renderer.render(
+            curve, center, zoom, mouse, show_anchors, project.others()
+        )
+        tick()
+        profiler.lap('wait')
+        profiler.end_frame()
 
 
 if __name__ == '__main__':
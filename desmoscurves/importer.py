@@ -0,0 +1,77 @@
+import argparse
+import os
+
+from .classes.history import HISTORY_FORMATS
+from .classes.project import Project
+from .classes.svg import read_svg
+from .classes.trace import read_image
+from .constant import IMPORT_MARGIN, TRACE_THRESHOLD, TRACE_TOLERANCE
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Import the paths of an SVG file, or the traced '
+        'outlines of an image, as a new save of a project'
+    )
+    parser.add_argument('name', help='project name (no file suffix)')
+    parser.add_argument('source', help='SVG or image file to import')
+    parser.add_argument(
+        '--save-format',
+        choices=HISTORY_FORMATS,
+        default='journal',
+        help='file format for saves of the project (default journal)',
+    )
+    parser.add_argument(
+        '--margin',
+        type=float,
+        default=IMPORT_MARGIN,
+        help='pixels left around the drawing on the canvas '
+        f'(default {IMPORT_MARGIN})',
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=TRACE_THRESHOLD,
+        help='images: gray level from 0 to 255 below which pixels are '
+        f'traced as ink (default {TRACE_THRESHOLD})',
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=TRACE_TOLERANCE,
+        help='images: how far in image pixels the curves may stray from '
+        f'the traced outlines (default {TRACE_TOLERANCE})',
+    )
+    args = parser.parse_args()
+
+    if os.path.splitext(args.source)[1].lower() == '.svg':
+        positions, ghosts = read_svg(args.source, margin=args.margin)
+    else:
+        positions, ghosts = read_image(
+            args.source,
+            args.threshold,
+            args.tolerance,
+            margin=args.margin,
+        )
+    if not len(positions):
+        raise ValueError(f'Nothing to import found in {args.source}!')
+
+    # Saved through the project, so its other layers and the manifest
+    # stay in step with the first layer's history
+    project = Project(
+        args.name, array_backed=True, save_format=args.save_format
+    )
+    layers = project.load(1) or project.arrays()
+    number, name, visible, _ = layers[0]
+    project.set_layers(
+        [(number, name, visible, (positions, ghosts)), *layers[1:]]
+    )
+    project.write(project.capture())
+    print(
+        f'Imported {len(positions)} anchors from {args.source} into '
+        + project.history(number).path
+    )
+
+
+if __name__ == '__main__':
+    main()
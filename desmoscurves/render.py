@@ -0,0 +1,380 @@
+from typing import Any, List, Sequence, Tuple
+
+import numpy as np
+import pygame
+
+from .classes.bezier_curve import BezierCurve
+from .classes.position import Position
+from .classes.profiler import Profiler
+from .classes.project import Layer
+from .classes.sampling import sample_segments
+from .constant import (
+    AXES_COLOR,
+    AXES_WIDTH,
+    BEZIER_MAX_STEPS,
+    BEZIER_MIN_STEPS,
+    BEZIER_STEP_LENGTH,
+    CURVE_COLOR,
+    DARK,
+    GHOST,
+    HANDLE_COLOR,
+    HANDLE_RADIUS,
+    LAYER_COLOR,
+    OVERLAY_BACKGROUND,
+    OVERLAY_COLOR,
+    OVERLAY_FONT_SIZE,
+    POINT_RADIUS,
+    SELECTED_COLOR,
+    SIZE,
+    TENTATIVE_COLOR,
+)
+
+
+def visible(values: np.ndarray, margin: float = 0) -> np.ndarray:
+    # Mask of the rows of (k, p, 2) screen positions whose bounding box
+    # overlaps the window grown by margin
+    low = values.min(axis=1)
+    high = values.max(axis=1)
+    return (
+        (high[:, 0] >= -margin)
+        & (low[:, 0] <= SIZE[0] + margin)
+        & (high[:, 1] >= -margin)
+        & (low[:, 1] <= SIZE[1] + margin)
+    )
+
+
+def bounding_rects(values: np.ndarray, margin: float) -> List[pygame.Rect]:
+    # On-screen rects covering each row of (k, p, 2) screen positions
+    low = np.floor(values.min(axis=1) - margin)
+    high = np.ceil(values.max(axis=1) + margin)
+    low = np.clip(low, 0, SIZE).astype(int)
+    high = np.clip(high, 0, SIZE).astype(int)
+    return [
+        pygame.Rect(left, top, right - left, bottom - top)
+        for (left, top), (right, bottom) in zip(low.tolist(), high.tolist())
+        if right > left and bottom > top
+    ]
+
+
+def bezier_steps(segments: np.ndarray) -> np.ndarray:
+    # The control polygon is never shorter than the curve, so its on-screen
+    # length gives a step count that keeps steps about BEZIER_STEP_LENGTH
+    # pixels long
+    lengths = np.linalg.norm(np.diff(segments, axis=1), axis=2).sum(axis=1)
+    steps = np.ceil(lengths / BEZIER_STEP_LENGTH)
+    return np.clip(steps, BEZIER_MIN_STEPS, BEZIER_MAX_STEPS).astype(int)
+
+
+def draw_axes(
+    display: pygame.Surface, center: Position, zoom: float | int
+) -> None:
+    border = pygame.Rect(
+        *Position(0, 0).centered(center, zoom).tup,
+        SIZE[0] * zoom,
+        SIZE[1] * zoom
+    )
+    pygame.draw.rect(display, AXES_COLOR, border, AXES_WIDTH)
+    pygame.draw.line(
+        display,
+        AXES_COLOR,
+        Position(0, SIZE[1] // 2).centered(center, zoom).tup,
+        Position(SIZE[0], SIZE[1] // 2).centered(center, zoom).tup,
+        AXES_WIDTH,
+    )
+    pygame.draw.line(
+        display,
+        AXES_COLOR,
+        Position(SIZE[0] // 2, 0).centered(center, zoom).tup,
+        Position(SIZE[0] // 2, SIZE[1]).centered(center, zoom).tup,
+        AXES_WIDTH,
+    )
+
+
+def draw_anchors(
+    display: pygame.Surface,
+    positions: np.ndarray,
+    incomplete: np.ndarray,
+    selected: np.ndarray,
+) -> None:
+    shown = visible(positions, POINT_RADIUS)
+    for (reverse_handle, point, handle), tentative, chosen in zip(
+        positions[shown].tolist(),
+        incomplete[shown].tolist(),
+        selected[shown].tolist(),
+    ):
+        pygame.draw.circle(
+            display,
+            (
+                TENTATIVE_COLOR
+                if tentative
+                else SELECTED_COLOR if chosen else CURVE_COLOR
+            ),
+            point,
+            POINT_RADIUS,
+        )
+        pygame.draw.circle(
+            display,
+            TENTATIVE_COLOR if tentative else HANDLE_COLOR,
+            reverse_handle,
+            HANDLE_RADIUS,
+        )
+        pygame.draw.circle(
+            display,
+            TENTATIVE_COLOR if tentative else HANDLE_COLOR,
+            handle,
+            HANDLE_RADIUS,
+        )
+        pygame.draw.line(
+            display,
+            TENTATIVE_COLOR if tentative else HANDLE_COLOR,
+            reverse_handle,
+            handle,
+        )
+
+
+def draw_segments(
+    display: pygame.Surface,
+    segments: np.ndarray,
+    ghosts: np.ndarray,
+    tentative: np.ndarray,
+    color: Tuple[int, int, int] = CURVE_COLOR,
+) -> None:
+    shown = visible(segments)
+    segments = segments[shown]
+    if len(segments) == 0:
+        return
+    colors = np.where(tentative[shown], 2, np.where(ghosts[shown], 1, 0))
+    polyline = sample_segments(segments, bezier_steps(segments))
+    offsets = np.searchsorted(polyline.segments, np.arange(len(segments) + 1))
+
+    # Touching segments of one color are drawn as a single polyline
+    breaks = (
+        np.flatnonzero(
+            (colors[1:] != colors[:-1])
+            | (segments[1:, 0] != segments[:-1, 3]).any(axis=1)
+        )
+        + 1
+    ).tolist()
+    for first, last in zip([0] + breaks, breaks + [len(segments)]):
+        pygame.draw.lines(
+            display,
+            (color, GHOST, TENTATIVE_COLOR)[colors[first]],
+            False,
+            polyline.points[offsets[first] : offsets[last]].tolist(),
+        )
+
+
+def draw_selection(
+    display: pygame.Surface, path: np.ndarray, lasso: bool
+) -> List[pygame.Rect]:
+    # Outline of a rectangle or lasso selection in progress, given its
+    # (p, 2) screen path, and the rects it covers
+    if lasso:
+        pygame.draw.lines(display, SELECTED_COLOR, True, path.tolist())
+    else:
+        (left, top), (right, bottom) = np.sort(path[[0, -1]], axis=0)
+        pygame.draw.rect(
+            display,
+            SELECTED_COLOR,
+            pygame.Rect(left, top, right - left + 1, bottom - top + 1),
+            1,
+        )
+    return bounding_rects(path[None], 2)
+
+
+def draw_overlay(
+    display: pygame.Surface, font: pygame.font.Font, lines: List[str]
+) -> pygame.Rect:
+    # Text lines in a box at the top left corner, returning the box
+    texts = [font.render(line, True, OVERLAY_COLOR) for line in lines]
+    rect = pygame.Rect(
+        0,
+        0,
+        max(text.get_width() for text in texts) + 8,
+        sum(text.get_height() for text in texts) + 8,
+    )
+    display.fill(OVERLAY_BACKGROUND, rect)
+    top = 4
+    for text in texts:
+        display.blit(text, (4, top))
+        top += text.get_height()
+    return rect
+
+
+class Renderer:
+    # Keeps the axes and every anchor and segment that is not being edited
+    # on a cached background surface. Each frame only the dragged or
+    # tentative anchors and their segments are read and drawn over it, and
+    # only their rects are pushed to the display. The curves of other
+    # visible layers are drawn on the background from their cached
+    # segments. The background is redrawn when the view, the revision of the
+    # curve or of its selection, the dragged anchor or any of those layers
+    # changes. The profiler overlay, when shown, is drawn last and cleared
+    # like the active anchors.
+    def __init__(
+        self, display: pygame.Surface, profiler: Profiler | None = None
+    ) -> None:
+        self.display = display
+        self.profiler = profiler or Profiler()
+        self.font: pygame.font.Font | None = None
+        self.background = pygame.Surface(display.get_size())
+        self.show_anchors: bool | None = None
+        self.view: Tuple[float, float, float] | None = None
+        self.layers: List[Tuple[int, int]] = []
+        # Curve, revisions and dragged anchor the background was drawn for
+        self.state: Tuple[Any, ...] | None = None
+        # As of the background: indexes of the active anchors, the number
+        # of anchors and of complete segments, and the selected anchors
+        self.active = np.zeros(0, dtype=np.intp)
+        self.size = 0
+        self.count = 0
+        self.selected = np.zeros(0, dtype=bool)
+        self.dirty: List[pygame.Rect] = []
+
+    def render(
+        self,
+        curve: BezierCurve,
+        center: Position,
+        zoom: float | int,
+        mouse: Position,
+        show_anchors: bool,
+        others: Sequence[Layer] = (),
+    ) -> None:
+        # others are the visible layers besides curve's; hidden layers are
+        # never passed in, so they cost nothing
+        mouse = mouse.centered(center, zoom, True)
+        dragged = curve.drag_index
+        state = curve, curve.revision, curve.selection.revision, dragged
+        view = center.x, center.y, zoom
+        layers = [(layer.number, layer.revision) for layer in others]
+        redraw = (
+            show_anchors != self.show_anchors
+            or view != self.view
+            or layers != self.layers
+            or state != self.state
+        )
+        if redraw:
+            # Screen positions already account for scrolling and zooming
+            positions, ghosts, incomplete = curve.screen_arrays(
+                center, zoom, mouse
+            )
+            active = incomplete.copy()
+            if dragged is not None:
+                active[dragged] = True
+            segments, segment_ghosts = curve.segments(positions, ghosts)
+            count = len(segments)
+            active_segments = active[:count] | active[1 : count + 1]
+            self.show_anchors = show_anchors
+            self.view = view
+            self.layers = layers
+            self.state = state
+            self.active = np.flatnonzero(active)
+            self.size = len(positions)
+            self.count = count
+            self.selected = curve.selected_mask()
+        self.profiler.lap('arrays')
+
+        if redraw:
+            self.background.fill(DARK)
+            if show_anchors:
+                draw_axes(self.background, center, zoom)
+            for layer in others:
+                layer_segments, layer_ghosts = layer.segments()
+                draw_segments(
+                    self.background,
+                    Position.centered_array(layer_segments, center, zoom),
+                    layer_ghosts,
+                    np.zeros(len(layer_ghosts), dtype=bool),
+                    LAYER_COLOR,
+                )
+            if show_anchors:
+                draw_anchors(
+                    self.background,
+                    positions[~active],
+                    incomplete[~active],
+                    self.selected[~active],
+                )
+            draw_segments(
+                self.background,
+                segments[~active_segments],
+                segment_ghosts[~active_segments],
+                incomplete[1 : count + 1][~active_segments],
+            )
+            self.display.blit(self.background, (0, 0))
+        else:
+            for rect in self.dirty:
+                self.display.blit(self.background, rect, rect)
+        self.profiler.lap('background')
+
+        selection = curve.selection
+        if (
+            not len(self.active)
+            and not selection.selecting
+            and not self.dirty
+            and not redraw
+            and not self.profiler.overlay
+        ):
+            return
+
+        # Only the active anchors and their neighbours are read; segment
+        # rows[i] joins the anchors at rows[i] and rows[i + 1]
+        rows = np.unique(
+            np.clip(self.active[:, None] + (-1, 0, 1), 0, self.size - 1)
+        )
+        positions, ghosts, incomplete = curve.screen_arrays(
+            center, zoom, mouse, rows
+        )
+        active = np.isin(rows, self.active)
+        starts = np.flatnonzero(
+            (rows[1:] == rows[:-1] + 1)
+            & (rows[:-1] < self.count)
+            & (active[1:] | active[:-1])
+        )
+        segments = np.stack(
+            (
+                positions[starts, 1],
+                positions[starts, 2],
+                positions[starts + 1, 0],
+                positions[starts + 1, 1],
+            ),
+            axis=1,
+        )
+        rects = bounding_rects(segments, 2)
+        if show_anchors:
+            draw_anchors(
+                self.display,
+                positions[active],
+                incomplete[active],
+                self.selected[rows[active]],
+            )
+            rects += bounding_rects(positions[active], POINT_RADIUS + 2)
+        draw_segments(
+            self.display,
+            segments,
+            ghosts[starts + 1],
+            incomplete[starts + 1],
+        )
+        if selection.selecting:
+            path = Position.centered_array(
+                np.array([position.tup for position in selection.path]),
+                center,
+                zoom,
+            )
+            rects += draw_selection(self.display, path, selection.lasso)
+        self.profiler.lap('active')
+
+        if self.profiler.overlay:
+            if self.font is None:
+                pygame.font.init()
+                self.font = pygame.font.Font(None, OVERLAY_FONT_SIZE)
+            rects.append(
+                draw_overlay(self.display, self.font, self.profiler.report())
+            )
+            self.profiler.lap('overlay')
+
+        if redraw:
+            pygame.display.update()
+        else:
+            pygame.display.update(self.dirty + rects)
+        self.dirty = rects
+        self.profiler.lap('update')
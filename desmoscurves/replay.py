@@ -0,0 +1,136 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pygame
+
+from .classes.background_saver import BackgroundSaver
+from .classes.history import HISTORY_FORMATS, to_rows
+from .classes.position import Position
+from .classes.profiler import Profiler
+from .classes.project import Project, ProjectSnapshot
+from .classes.recording import Recording
+from .constant import SIZE
+from .gui import EditorInput, Frame, edit
+from .render import Renderer
+
+
+class ReplayInput(EditorInput):
+    # The frames of a recording, one after another
+    def __init__(self, recording: Recording) -> None:
+        self.frames = recording.frames.tolist()
+        self.events = [events.tolist() for events in recording.frame_events()]
+        self.index = 0
+
+    def next_frame(self) -> Frame | None:
+        if self.index == len(self.frames):
+            return None
+        x, y, mods, backspace = self.frames[self.index]
+        events = [
+            pygame.event.Event(event_type, button=value, key=value)
+            for event_type, value in self.events[self.index]
+        ]
+        self.index += 1
+        return Position(x, y), events, mods, bool(backspace)
+
+
+def digest(layers: ProjectSnapshot) -> str:
+    # Short fingerprint of a drawing, for checking a replay ended the same
+    hashed = hashlib.sha256()
+    for _, name, visible, arrays in layers:
+        rows = np.nan_to_num(to_rows(*arrays), nan=-1.0)
+        hashed.update(rows.tobytes())
+        hashed.update(f'{len(rows)} {name} {visible}'.encode())
+    return hashed.hexdigest()[:16]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Replay a session recorded with desmoscurves --record '
+        'without a display, as fast as possible'
+    )
+    parser.add_argument('recording', help='file written by --record')
+    parser.add_argument(
+        '--save-format',
+        choices=HISTORY_FORMATS,
+        default='journal',
+        help='file format for saves made during the replay (default '
+        'journal)',
+    )
+    parser.add_argument(
+        '--profile-trace',
+        metavar='FILE',
+        help='write the time of every phase of every frame to FILE as '
+        'JSON lines',
+    )
+    parser.add_argument(
+        '--expect',
+        metavar='DIGEST',
+        help='exit with an error unless the final drawing has this digest',
+    )
+    args = parser.parse_args()
+
+    recording = Recording.load(args.recording)
+    # Draw offscreen unless another video driver was asked for
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    display = pygame.display.set_mode(SIZE)
+    profiler = Profiler(
+        None if args.profile_trace is None else open(args.profile_trace, 'w')
+    )
+    renderer = Renderer(display, profiler)
+
+    # Saves go to a scratch project whose first save is the drawing the
+    # session started from, so loading saves made during the session works
+    with tempfile.TemporaryDirectory() as directory:
+        project = Project(
+            os.path.join(directory, 'replay'), save_format=args.save_format
+        )
+        project.set_layers(recording.layers())
+        saver = BackgroundSaver(project)
+        # The session's own printing is not part of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            saver.save().result()
+            start = time.perf_counter()
+            try:
+                edit(
+                    project,
+                    saver,
+                    renderer,
+                    ReplayInput(recording),
+                    lambda: None,
+                    lambda project: project.to_formula(),
+                )
+            finally:
+                saver.close()
+            elapsed = time.perf_counter() - start
+        profiler.close()
+        pygame.quit()
+        layers = project.arrays()
+
+    frames = max(len(recording), 1)
+    recorded = recording.times[-1] if len(recording) else 0
+    print(
+        f'Replayed {len(recording)} frames and {len(recording.events)} '
+        f'events recorded over {recorded:.1f}s in {elapsed:.2f}s '
+        f'({elapsed * 1000 / frames:.2f} ms/frame)'
+    )
+    final = digest(layers)
+    anchors = sum(len(arrays[1]) for *_, arrays in layers)
+    print(
+        f'Final drawing: {anchors} anchors in {len(layers)} layers, '
+        f'digest {final}'
+    )
+    if args.expect is not None and args.expect != final:
+        print(f'Expected digest {args.expect}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -21,7 +21,15 @@ setup(
     description='Bezier curve editor and conversion to Desmos graph',
     python_requires='>=3.10',
     packages=find_packages(),
-    entry_points={'console_scripts': ['desmoscurves = desmoscurves.gui:gui']},
+    entry_points={
+        'console_scripts': [
+            'desmoscurves = desmoscurves.gui:gui',
+            'desmoscurves-convert = desmoscurves.convert:main',
+            'desmoscurves-export = desmoscurves.export:main',
+            'desmoscurves-import = desmoscurves.importer:main',
+            'desmoscurves-replay = desmoscurves.replay:main',
+        ]
+    },
     classifiers=[],
     install_requires=requirements,
     long_description=long_description,
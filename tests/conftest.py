@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from desmoscurves.classes.history import Snapshot
+
+
+def wave(count: int = 40, seed: int = 0) -> Snapshot:
+    # A smooth curve of count anchors with mirrored handles, a sharp point
+    # and a ghost segment, like one drawn in the editor
+    rng = np.random.default_rng(seed)
+    x = np.linspace(100, 1800, count)
+    y = 540 + 300 * np.sin(x / 200) + rng.normal(0, 2, count)
+    points = np.stack((x, y), axis=1)
+    handles = np.gradient(points, axis=0) / 3
+    handles[count // 3] = 0
+    positions = np.stack((points - handles, points, points + handles), axis=1)
+    ghosts = np.zeros(count, dtype=bool)
+    ghosts[count // 2] = True
+    return positions, ghosts
+
+
+@pytest.fixture
+def drawing() -> Snapshot:
+    return wave()
+
+
+@pytest.fixture
+def name(tmp_path) -> str:
+    # Project name inside a temporary directory, for the saves of a test
+    return str(tmp_path / 'drawing')
@@ -0,0 +1,35 @@
+from desmoscurves.classes.background_saver import BackgroundSaver
+from desmoscurves.classes.project import Project, same_arrays
+
+from .conftest import wave
+
+
+def test_failed_save_is_reported_and_retried(name, capsys, monkeypatch):
+    project = Project(name)
+    project.curve.set_arrays(*wave())
+    saver = BackgroundSaver(project)
+    write = project.write
+
+    def fail(state):
+        monkeypatch.setattr(project, 'write', write)
+        raise OSError('disk full')
+
+    monkeypatch.setattr(project, 'write', fail)
+    try:
+        saver.save()
+        assert not saver.finish()
+        assert 'Could not save progress: disk full' in capsys.readouterr().out
+        assert project.layer.dirty
+        assert saver.save().result()
+    finally:
+        saver.close()
+    assert not project.layer.dirty
+    assert same_arrays(Project(name).load(1)[0][3], wave())
+
+
+def test_load_without_saves(name):
+    saver = BackgroundSaver(Project(name))
+    try:
+        assert saver.load(1) is False
+    finally:
+        saver.close()
@@ -0,0 +1,174 @@
+import numpy as np
+import pytest
+
+from desmoscurves.classes.bezier_curve import BezierCurve
+from desmoscurves.classes.enums import ClickType, PointType
+from desmoscurves.classes.position import Position
+from desmoscurves.classes.project import same_arrays
+
+
+@pytest.fixture(params=[False, True], ids=['list', 'array'])
+def curve(request) -> BezierCurve:
+    # Three anchors drawn by clicking a point and then its handle, with
+    # nothing to undo yet
+    curve = BezierCurve('drawing', array_backed=request.param)
+    for x, y in ((100.0, 100.0), (300.0, 200.0), (500.0, 100.0)):
+        curve.add_anchor(Position(x, y))
+        curve.add_anchor(Position(x + 40, y))
+    curve.commands.clear()
+    return curve
+
+
+def test_anchor_index_follows_inserts_and_deletes(curve):
+    curve.interact(Position(100.0, 100.0), ClickType.ADD)
+    curve.interact(Position(500.0, 100.0), ClickType.REMOVE)
+    curve.undo()
+    curve.undo()
+    curve.redo()
+    curve.add_anchor(Position(700.0, 300.0))
+    for row, anchor in enumerate(curve.anchors):
+        assert curve.anchor_index(anchor) == row
+    curve.interact(Position(100.0, 100.0), ClickType.REMOVE)
+    for row, anchor in enumerate(curve.anchors):
+        assert curve.anchor_index(anchor) == row
+
+
+def test_hit_test_follows_edits(curve):
+    anchor, point_type = curve.index.hit_test(Position(341.0, 200.0), 5, 5)
+    assert curve.anchor_index(anchor) == 1
+    assert point_type == PointType.HANDLE
+    curve.interact(Position(300.0, 200.0), ClickType.REMOVE)
+    assert curve.index.hit_test(Position(300.0, 200.0), 5, 5) is None
+    curve.undo()
+    anchor, point_type = curve.index.hit_test(Position(300.0, 200.0), 5, 5)
+    assert curve.anchor_index(anchor) == 1
+    assert point_type == PointType.POINT
+
+
+def test_transforms_move_only_the_selection(curve):
+    positions, _ = curve.arrays()
+    curve.selection.start(Position(0.0, 0.0))
+    curve.selection.extend(Position(1000.0, 150.0))
+    curve.selection.finish(curve.index)
+    selected = curve.selected_mask()
+    assert selected.tolist() == [True, False, True]
+    curve.translate_selection(10, -5)
+    moved, _ = curve.arrays()
+    assert np.allclose(moved[selected], positions[selected] + (10, -5))
+    assert np.array_equal(moved[~selected], positions[~selected])
+    # About the middle of the selected points, (310, 95)
+    curve.scale_selection(2)
+    scaled, _ = curve.arrays()
+    assert np.allclose(scaled[0, 1], (-90, 95))
+    curve.mirror_selection()
+    curve.mirror_selection(horizontal=False)
+    curve.rotate_selection(180)
+    assert np.allclose(curve.arrays()[0], scaled)
+    anchor, _ = curve.index.hit_test(Position(-90.0, 95.0), 5, 5)
+    assert curve.anchor_index(anchor) == 0
+
+
+def test_undo_and_redo_every_edit(curve):
+    states = [curve.arrays()]
+
+    def edited() -> None:
+        states.append(curve.arrays())
+
+    curve.interact(Position(300.0, 200.0), ClickType.GHOST)
+    edited()
+    curve.interact(Position(500.0, 100.0), ClickType.SHARP)
+    edited()
+    curve.interact(Position(100.0, 100.0), ClickType.ADD)
+    edited()
+    curve.interact(Position(300.0, 200.0), ClickType.MOUSE)
+    for step in range(1, 6):
+        curve.motion(Position(300.0 + 10 * step, 200.0 - 5 * step))
+    curve.end_drag()
+    edited()
+    curve.selection.start(Position(0.0, 0.0))
+    curve.selection.extend(Position(1000.0, 150.0))
+    curve.selection.finish(curve.index)
+    curve.rotate_selection(30)
+    edited()
+    curve.interact(Position(350.0, 175.0), ClickType.REMOVE)
+    edited()
+    assert len(curve.anchors) == 3
+
+    for state in reversed(states[:-1]):
+        assert curve.undo()
+        assert same_arrays(curve.arrays(), state)
+    assert not curve.undo()
+    for state in states[1:]:
+        assert curve.redo()
+        assert same_arrays(curve.arrays(), state)
+    assert not curve.redo()
+
+
+def test_drag_is_one_edit(curve):
+    before = curve.arrays()
+    curve.interact(Position(340.0, 200.0), ClickType.MOUSE)
+    for step in range(10):
+        curve.motion(Position(340.0 + step, 200.0 + step))
+    curve.end_drag()
+    assert curve.undo()
+    assert same_arrays(curve.arrays(), before)
+    assert not curve.undo()
+
+
+def test_drag_index_follows_the_dragged_anchor(curve):
+    curve.interact(Position(340.0, 200.0), ClickType.MOUSE)
+    assert curve.drag_index == 1
+    curve.interact(Position(100.0, 100.0), ClickType.ADD)
+    assert curve.drag_index == 2
+    curve.interact(Position(100.0, 100.0), ClickType.REMOVE)
+    assert curve.drag_index == 1
+    curve.motion(Position(350.0, 210.0))
+    curve.end_drag()
+    assert curve.drag_index is None
+    assert curve.anchors[1].handle.x == 350.0
+
+
+def test_revision_counts_edits_but_not_drag_motions(curve):
+    revision = curve.revision
+    curve.interact(Position(300.0, 200.0), ClickType.MOUSE)
+    curve.motion(Position(310.0, 210.0))
+    curve.motion(Position(320.0, 220.0))
+    assert curve.revision == revision
+    curve.end_drag()
+    assert curve.revision > revision
+    curve.selection.start(Position(0.0, 0.0))
+    curve.selection.extend(Position(1000.0, 1000.0))
+    for edit in (
+        lambda: curve.interact(Position(320.0, 220.0), ClickType.GHOST),
+        lambda: curve.selection.finish(curve.index),
+        lambda: curve.translate_selection(5, 5),
+        curve.undo,
+        curve.redo,
+        lambda: curve.add_anchor(Position(700.0, 300.0)),
+        lambda: curve.set_arrays(*curve.arrays()),
+        curve.clear,
+    ):
+        revision = curve.revision
+        selection = curve.selection.revision
+        edit()
+        assert curve.revision > revision or (
+            curve.selection.revision > selection
+        )
+
+
+def test_selection_revision(curve):
+    revision = curve.selection.revision
+    curve.selection.start(Position(0.0, 0.0))
+    curve.selection.extend(Position(1000.0, 1000.0))
+    assert curve.selection.revision == revision
+    curve.selection.finish(curve.index)
+    assert len(curve.selection) == 3
+    assert curve.selection.revision > revision
+
+
+def test_rows_match_full_arrays(curve):
+    positions, ghosts = curve.arrays()
+    rows = np.array([0, 2])
+    some_positions, some_ghosts = curve.arrays(rows)
+    assert np.array_equal(some_positions, positions[rows], equal_nan=True)
+    assert np.array_equal(some_ghosts, ghosts[rows])
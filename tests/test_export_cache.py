@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import pytest
+
+from desmoscurves import export
+from desmoscurves.classes.bezier_curve import BezierCurve
+from desmoscurves.classes.export_cache import (
+    ExportCache,
+    content_key,
+    open_cache,
+)
+from desmoscurves.classes.history import open_history
+
+OPTIONS = (True, 5, 10.0, 'sum', 1000, 0.0, False)
+
+
+@pytest.fixture
+def cache_dir(tmp_path) -> str:
+    return str(tmp_path / 'cache')
+
+
+@pytest.fixture
+def saved(name, drawing) -> str:
+    open_history(name).append(*drawing)
+    return name
+
+
+def fresh_formula(name: str, **options) -> str:
+    # The export made from scratch, with caching off
+    return export.export_formula(name, cache_dir='', **options)
+
+
+def test_second_export_is_read_from_the_cache(saved, cache_dir, monkeypatch):
+    first = export.export_formula(saved, cache_dir=cache_dir)
+    assert first == fresh_formula(saved)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('made the formula again')
+
+    monkeypatch.setattr(export, 'write_curves', fail)
+    monkeypatch.setattr(export, 'load_curves', fail)
+    assert export.export_formula(saved, cache_dir=cache_dir) == first
+
+
+def test_new_save_invalidates(saved, drawing, cache_dir):
+    first = export.export_formula(saved, cache_dir=cache_dir)
+    positions, ghosts = drawing
+    positions = positions.copy()
+    positions[5] += 40
+    open_history(saved).append(positions, ghosts)
+    second = export.export_formula(saved, cache_dir=cache_dir)
+    assert second != first
+    assert second == fresh_formula(saved)
+
+
+def test_options_are_part_of_the_key(saved, cache_dir):
+    export.export_formula(saved, cache_dir=cache_dir)
+    for options in (
+        {'round_places': 3},
+        {'mode': 'piecewise'},
+        {'tolerance': 1.0},
+        {'arc_length': True},
+    ):
+        assert export.export_formula(
+            saved, cache_dir=cache_dir, **options
+        ) == fresh_formula(saved, **options)
+
+
+def test_unchanged_project_reuses_content_key(saved, drawing, cache_dir):
+    # Saving the same anchors again under another project finds the text
+    # by content without making it
+    text = export.export_formula(saved, cache_dir=cache_dir)
+    other = saved + '-copy'
+    open_history(other).append(*drawing)
+    key, curves, store = export.lookup(other, OPTIONS, ExportCache(cache_dir))
+    assert key is not None and not curves and not store
+    assert ExportCache(cache_dir).read(key) == text
+
+
+def test_content_key_ignores_nan_bits(drawing):
+    positions, ghosts = drawing
+    positions = positions.copy()
+    positions[-1, 2] = np.nan
+    other = positions.copy()
+    other.view(np.uint64)[-1, 2] |= 1
+    assert np.isnan(other[-1, 2]).all()
+    assert content_key([(positions, ghosts)], OPTIONS) == content_key(
+        [(other, ghosts)], OPTIONS
+    )
+    moved = positions.copy()
+    moved[0, 1, 0] += 1e-9
+    assert content_key([(positions, ghosts)], OPTIONS) != content_key(
+        [(moved, ghosts)], OPTIONS
+    )
+
+
+def test_evict_keeps_the_most_recently_used(cache_dir):
+    cache = ExportCache(cache_dir, max_bytes=2500)
+    for number in range(5):
+        cache.put(f'key{number}', 'x' * 1000)
+        stamp = 10**9 * (number + 1)
+        os.utime(cache.path(f'key{number}'), ns=(stamp, stamp))
+    assert cache.read('key0') is not None
+    cache.evict()
+    kept = sorted(name for name in os.listdir(cache_dir))
+    assert kept == ['key0.txt', 'key4.txt']
+
+
+def test_environment_turns_caching_off(monkeypatch, drawing, capsys):
+    monkeypatch.setenv('DESMOSCURVES_CACHE', '')
+    assert open_cache() is None
+    curve = BezierCurve('drawing', array_backed=True)
+    curve.set_arrays(*drawing)
+    monkeypatch.setattr(
+        'desmoscurves.classes.bezier_curve.export_options', lambda: OPTIONS
+    )
+    assert curve.curve_to_formula() is not None
+    assert 'cache' not in capsys.readouterr().out.lower()
+
+
+def test_editor_export_says_where_it_is_cached(
+    monkeypatch, drawing, cache_dir, capsys
+):
+    monkeypatch.setenv('DESMOSCURVES_CACHE', cache_dir)
+    monkeypatch.setattr(
+        'desmoscurves.classes.bezier_curve.export_options', lambda: OPTIONS
+    )
+    curve = BezierCurve('drawing', array_backed=True)
+    curve.set_arrays(*drawing)
+    first = curve.curve_to_formula()
+    assert f'Cached the export in {cache_dir}' in capsys.readouterr().out
+    assert curve.curve_to_formula().formula == first.formula
+    out = capsys.readouterr().out
+    assert f'Reused the export cached in {cache_dir}' in out
@@ -0,0 +1,100 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from desmoscurves.classes.history import (
+    HISTORY_FORMATS,
+    convert,
+    find_history,
+    open_history,
+)
+from desmoscurves.classes.project import same_arrays
+
+from .conftest import wave
+
+
+def edits(count: int = 5):
+    # Saves of a curve being drawn: anchors moved, added and removed, and
+    # the last one left incomplete
+    positions, ghosts = wave()
+    saves = []
+    for step in range(count):
+        positions = positions.copy()
+        positions[step * 3] += step + 1
+        saves.append((positions[: 30 + step], ghosts[: 30 + step]))
+    positions = saves[-1][0].copy()
+    positions[-1, [0, 2]] = np.nan
+    saves.append((positions, saves[-1][1]))
+    return saves
+
+
+@pytest.mark.parametrize('save_format', HISTORY_FORMATS)
+def test_round_trip(name, save_format):
+    history = HISTORY_FORMATS[save_format](name)
+    saves = edits()
+    for save in saves:
+        assert history.append(*save)
+    assert not history.append(*saves[-1])
+
+    reopened = HISTORY_FORMATS[save_format](name)
+    for lookbehind, save in enumerate(reversed(saves), 1):
+        assert same_arrays(reopened.load(lookbehind), save)
+    assert reopened.load(len(saves) + 1) is None
+    versions = list(reopened.versions())
+    assert len(versions) == len(saves)
+    assert all(map(same_arrays, versions, saves))
+
+
+@pytest.mark.parametrize('save_format', ['journal', 'binary'])
+def test_torn_append_is_repaired(name, save_format):
+    history = HISTORY_FORMATS[save_format](name)
+    saves = edits()
+    for save in saves[:-1]:
+        history.append(*save)
+    # A save interrupted halfway leaves part of a record at the end
+    with open(history.path, 'ab') as file:
+        file.write(b'{"ops": [[0, 1' if save_format == 'journal' else b'DCRV')
+
+    reopened = HISTORY_FORMATS[save_format](name)
+    assert len(list(reopened.versions())) == len(saves) - 1
+    assert reopened.append(*saves[-1])
+    assert same_arrays(reopened.load(1), saves[-1])
+    assert same_arrays(reopened.load(2), saves[-2])
+    assert len(list(HISTORY_FORMATS[save_format](name).versions())) == len(
+        saves
+    )
+
+
+@pytest.mark.parametrize(
+    'source, target', list(itertools.permutations(HISTORY_FORMATS, 2))
+)
+def test_convert_appends_only_new_saves(name, source, target):
+    saves = edits()
+    old = HISTORY_FORMATS[source](name)
+    for save in saves[:3]:
+        old.append(*save)
+    new = HISTORY_FORMATS[target](name + '-new')
+    convert(old, new)
+    for save in saves[3:]:
+        old.append(*save)
+    convert(old, new)
+    versions = list(new.versions())
+    assert len(versions) == len(saves)
+    assert all(map(same_arrays, versions, saves))
+
+
+def test_open_history_catches_up_with_another_format(name):
+    saves = edits()
+    journal = open_history(name, 'journal')
+    for save in saves[:2]:
+        journal.append(*save)
+    # Saved since with an older version that only writes .json
+    json_history = HISTORY_FORMATS['json'](name)
+    for save in saves:
+        json_history.append(*save)
+    assert type(find_history(name)) is HISTORY_FORMATS['json']
+
+    history = open_history(name, 'journal')
+    assert same_arrays(history.load(1), saves[-1])
+    assert len(list(history.versions())) == len(saves)
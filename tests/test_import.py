@@ -0,0 +1,84 @@
+import io
+from typing import List
+
+import numpy as np
+
+from desmoscurves.classes.bezier_curve import BezierCurve
+from desmoscurves.classes.svg import read_svg
+from desmoscurves.classes.trace import (
+    contour_anchors,
+    trace_contours,
+    trace_image,
+)
+
+SVG = '''<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">
+<path d="M10 10 L90 10 L90 90 Z"/>
+<g transform="translate(5 0)"><path d="M20 20 C30 20 40 30 40 40"/></g>
+<path d="M50 50 A 20 20 0 0 1 90 50"/>
+</svg>'''
+
+
+def curve_of(positions: np.ndarray, ghosts: np.ndarray) -> BezierCurve:
+    curve = BezierCurve('import', array_backed=True)
+    curve.set_arrays(positions, ghosts)
+    return curve
+
+
+def canvas(x: float, y: float) -> List[float]:
+    # The viewBox fills the 1920 by 1080 canvas less a 40 pixel margin, so
+    # a unit is 10 canvas pixels around (960, 540)
+    return [960 + 10 * (x - 50), 540 + 10 * (y - 50)]
+
+
+def test_svg_paths_become_one_curve():
+    positions, ghosts = read_svg(io.StringIO(SVG))
+    assert np.allclose(
+        positions[:6, 1],
+        [canvas(10, 10), canvas(90, 10), canvas(90, 90), canvas(10, 10)]
+        + [canvas(25, 20), canvas(45, 40)],
+    )
+    assert np.allclose(positions[4, 2], canvas(35, 20))
+    assert np.allclose(positions[5, 0], canvas(45, 30))
+    # Each path after the first starts after a ghost segment
+    assert ghosts.tolist()[:7] == [False] * 4 + [True, False, True]
+
+    # The arc is a half circle of radius 20 about (70, 50)
+    curve = curve_of(positions[6:], ghosts[6:])
+    polyline = curve.sample(64)
+    center = np.array(canvas(70, 50))
+    assert np.allclose(
+        np.linalg.norm(polyline.points - center, axis=1), 200, atol=0.5
+    )
+    assert abs(curve.length() - 200 * np.pi) < 1
+
+
+def test_trace_follows_outlines():
+    # A dark ring: outlines at radius 30 and 60 around (100, 80)
+    yy, xx = np.mgrid[0:160, 0:200]
+    radius = np.hypot(xx - 100, yy - 80)
+    image = np.where((radius > 30) & (radius < 60), 0.0, 255.0)
+    positions, ghosts = trace_image(image)
+    assert ghosts.sum() == 1
+    points = curve_of(positions, ghosts).sample()
+    distances = np.hypot(*(points.points[~points.ghosts] - (100, 80)).T)
+    outside = distances > 45
+    assert np.abs(distances[outside] - 60).max() < 1.5
+    assert np.abs(distances[~outside] - 30).max() < 1.5
+    # Far fewer anchors than outline points
+    assert len(positions) < 100
+
+
+def test_traced_corners_are_sharp_and_the_rest_mirrored():
+    # A dark triangle with two acute corners, at (100, 20) and (20, 60)
+    yy, xx = np.mgrid[0:80, 0:120]
+    image = np.where((xx > 20) & (yy > 20) & (xx + 2 * yy < 140), 0.0, 255.0)
+    positions, ghosts = contour_anchors(*trace_contours(image))
+    points = positions[:, 1]
+    sharp = (positions[:, [0, 2]] == points[:, None]).all(axis=(1, 2))
+    corners = np.unique(points[sharp], axis=0)
+    assert len(corners) == 2
+    assert np.allclose(corners, [[20, 60], [100, 20]], atol=3)
+    assert np.allclose(
+        positions[~sharp, 0] - points[~sharp],
+        points[~sharp] - positions[~sharp, 2],
+    )
@@ -0,0 +1,71 @@
+import json
+
+import numpy as np
+
+from desmoscurves.classes.project import Project, same_arrays
+
+from .conftest import wave
+
+
+def save(project: Project) -> bool:
+    return project.write(project.capture())
+
+
+def test_layers_save_and_load(name):
+    project = Project(name)
+    first, second = wave(30, seed=1), wave(20, seed=2)
+    project.curve.set_arrays(*first)
+    assert save(project)
+    project.add_layer()
+    project.curve.set_arrays(*second)
+    assert save(project)
+    project.layers[0].visible = False
+    assert save(project)
+    assert not save(project)
+
+    reopened = Project(name)
+    last = reopened.load(1)
+    assert [(number, visible) for number, _, visible, _ in last] == [
+        (0, False),
+        (1, True),
+    ]
+    assert same_arrays(last[0][3], first)
+    assert same_arrays(last[1][3], second)
+    # The first save was from before the second layer
+    oldest = reopened.load(3)
+    assert len(oldest) == 1 and same_arrays(oldest[0][3], first)
+    assert reopened.load(4) is None
+
+    reopened.restore(1, last)
+    assert [layer.name for layer in reopened.layers] == ['layer 1', 'layer 2']
+    assert same_arrays(reopened.layers[1].curve.arrays(), second)
+
+
+def test_saves_only_changed_layers(name):
+    project = Project(name)
+    project.curve.set_arrays(*wave(30, seed=1))
+    project.add_layer()
+    project.curve.set_arrays(*wave(20, seed=2))
+    save(project)
+    positions, ghosts = wave(20, seed=3)
+    project.curve.set_arrays(positions, ghosts)
+    save(project)
+
+    assert len(list(project.history(0).versions())) == 1
+    assert len(list(project.history(1).versions())) == 2
+    with open(project.manifest) as file:
+        lines = [json.loads(line) for line in file]
+    assert [
+        [layer['version'] for layer in line['layers']] for line in lines
+    ] == [[1, 1], [1, 2]]
+    assert same_arrays(Project(name).load(2)[1][3], wave(20, seed=2))
+
+
+def test_project_from_before_layers_opens_as_one_layer(name):
+    positions, ghosts = wave()
+    Project(name).history(0).append(positions, ghosts)
+    project = Project(name)
+    assert project.exists()
+    snapshot = project.load(1)
+    assert len(snapshot) == 1
+    assert np.array_equal(snapshot[0][3][0], positions)
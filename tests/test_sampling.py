@@ -0,0 +1,131 @@
+import numpy as np
+
+from desmoscurves.classes.bezier_curve import BezierCurve
+from desmoscurves.classes.sampling import (
+    arc_lengths,
+    bernstein,
+    flatness_steps,
+    sample_segments,
+    segment_arc_lengths,
+    tame,
+)
+from desmoscurves.constant import ARC_LENGTH_TOLERANCE
+
+from .conftest import wave
+
+# Handle length that makes a cubic a close quarter circle
+KAPPA = 4 * (np.sqrt(2) - 1) / 3
+
+
+def reference(segments: np.ndarray) -> np.ndarray:
+    return arc_lengths(segments, 1024).sum(axis=1)
+
+
+def test_fixed_steps_hit_every_control_point():
+    rng = np.random.default_rng(0)
+    segments = rng.normal(0, 200, (50, 4, 2))
+    ghosts = np.arange(50) % 7 == 0
+    polyline = sample_segments(segments, 8, ghosts)
+    assert len(polyline) == 50 * 9
+    assert np.array_equal(polyline.segments, np.repeat(np.arange(50), 9))
+    assert np.array_equal(polyline.ghosts, np.repeat(ghosts, 9))
+    assert np.allclose(polyline.points[::9], segments[:, 0])
+    assert np.allclose(polyline.points[8::9], segments[:, 3])
+    assert polyline.lines().sum() == 50 * 8
+
+
+def test_mixed_counts_match_one_segment_at_a_time():
+    rng = np.random.default_rng(1)
+    segments = rng.normal(0, 200, (30, 4, 2))
+    steps = rng.integers(1, 12, 30)
+    polyline = sample_segments(segments, steps)
+    for number, (segment, step) in enumerate(zip(segments, steps)):
+        t = np.linspace(0, 1, step + 1)
+        rows = polyline.segments == number
+        assert np.allclose(polyline.points[rows], bernstein(t) @ segment)
+        assert np.allclose(polyline.parameters[rows], t)
+
+
+def test_flatness_keeps_chords_close_to_the_curve():
+    curve = BezierCurve('drawing', array_backed=True)
+    curve.set_arrays(*wave())
+    segments, _ = curve.segments()
+    flatness = 0.25
+    polyline = curve.sample(flatness=flatness)
+    assert np.array_equal(
+        np.bincount(polyline.segments) - 1, flatness_steps(segments, flatness)
+    )
+    # Points of the curve between each pair of samples, against the chord
+    # joining them
+    lines = np.flatnonzero(polyline.lines())
+    start, end = polyline.points[lines - 1], polyline.points[lines]
+    owners = polyline.segments[lines]
+    fractions = np.linspace(0, 1, 9)[1:-1, None]
+    t = (1 - fractions) * polyline.parameters[lines - 1] + (
+        fractions * polyline.parameters[lines]
+    )
+    between = np.einsum('fkj,kjc->fkc', bernstein(t), segments[owners])
+    chord = end - start
+    offset = between - start
+    across = chord[:, 0] * offset[..., 1] - chord[:, 1] * offset[..., 0]
+    assert np.abs(across / np.linalg.norm(chord, axis=1)).max() <= flatness
+
+
+def test_straight_and_circular_segments():
+    line = np.array([[[0, 0], [100, 0], [200, 0], [300, 0]]], dtype=float)
+    assert np.isclose(segment_arc_lengths(line)[0], 300)
+    quarter = np.array(
+        [[[100, 0], [100, 100 * KAPPA], [100 * KAPPA, 100], [0, 100]]]
+    )
+    # The cubic is within 0.03% of the circle
+    assert abs(segment_arc_lengths(quarter)[0] - 50 * np.pi) < 0.05
+
+
+def test_cusps_and_loops_are_accurate():
+    rng = np.random.default_rng(0)
+    segments = rng.normal(0, 200, (2000, 4, 2))
+    # Cusps: handles crossing over so the speed drops to zero
+    segments[:100, 1] = segments[:100, 3]
+    segments[:100, 2] = segments[:100, 0]
+    assert (~tame(segments)).sum() > 1000
+    error = np.abs(segment_arc_lengths(segments) - reference(segments))
+    assert error.max() < 5 * ARC_LENGTH_TOLERANCE
+
+
+def test_tame_segments_skip_splitting_but_stay_accurate():
+    positions, _ = wave(400)
+    segments = np.stack(
+        (
+            positions[:-1, 1],
+            positions[:-1, 2],
+            positions[1:, 0],
+            positions[1:, 1],
+        ),
+        axis=1,
+    )
+    assert tame(segments).mean() > 0.9
+    error = np.abs(segment_arc_lengths(segments) - reference(segments))
+    assert error.max() < ARC_LENGTH_TOLERANCE
+
+
+def test_curve_lengths_follow_edits():
+    # Lengths kept from before an edit match measuring from scratch
+    positions, ghosts = wave(100)
+    curve = BezierCurve('drawing', array_backed=True)
+    curve.set_arrays(positions, ghosts)
+    segments, drawn = curve.segments()
+    assert np.isclose(
+        curve.length(), segment_arc_lengths(segments)[~drawn].sum()
+    )
+    moved = positions.copy()
+    moved[10] += 25
+    inserted = np.insert(moved, 50, moved[50] + 10, axis=0)
+    removed = np.delete(inserted, [3, 4], axis=0)
+    for edited in (moved, inserted, removed, removed + 1):
+        edited_ghosts = np.zeros(len(edited), dtype=bool)
+        edited_ghosts[40] = True
+        curve.set_arrays(edited, edited_ghosts)
+        fresh = BezierCurve('fresh', array_backed=True)
+        fresh.set_arrays(edited, edited_ghosts)
+        assert np.array_equal(curve.segment_lengths(), fresh.segment_lengths())
+        assert curve.length() == fresh.length()
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from desmoscurves.classes.sampling import flatness_steps, sample_segments
+from desmoscurves.classes.simplify import simplify, smooth_anchors
+from desmoscurves.classes.trace import contour_anchors, trace_contours
+
+from .conftest import wave
+
+
+def segments(positions: np.ndarray) -> np.ndarray:
+    return np.stack(
+        (
+            positions[:-1, 1],
+            positions[:-1, 2],
+            positions[1:, 0],
+            positions[1:, 1],
+        ),
+        axis=1,
+    )
+
+
+def deviation(before, after) -> float:
+    # Furthest any drawn point of before is from the drawn part of after,
+    # measured to a polyline within a hundredth of a pixel of after
+    old = sample_segments(segments(before[0]), 16, before[1][1:])
+    lines = segments(after[0])
+    new = sample_segments(lines, flatness_steps(lines, 0.01), after[1][1:])
+    ends = new.lines() & ~new.ghosts
+    starts = new.points[np.flatnonzero(ends) - 1]
+    steps = new.points[ends] - starts
+    furthest = 0.0
+    for points in np.array_split(
+        old.points[~old.ghosts], max(len(old) // 200, 1)
+    ):
+        offsets = points[:, None] - starts
+        along = np.clip(
+            (offsets * steps).sum(axis=2)
+            / np.maximum((steps * steps).sum(axis=1), 1e-12),
+            0,
+            1,
+        )
+        distances = np.linalg.norm(
+            offsets - along[..., None] * steps, axis=2
+        ).min(axis=1)
+        furthest = max(furthest, distances.max())
+    return furthest
+
+
+def blobs() -> tuple:
+    # Anchors traced around a few ellipses, as an image import makes them
+    yy, xx = np.mgrid[0:150, 0:200]
+    image = np.full((150, 200), 255.0)
+    for cx, cy, rx, ry in (
+        (60, 70, 40, 25),
+        (150, 50, 20, 30),
+        (140, 120, 30, 15),
+    ):
+        image[((xx - cx) / rx) ** 2 + ((yy - cy) / ry) ** 2 < 1] = 0
+    return contour_anchors(*trace_contours(image))
+
+
+@pytest.mark.parametrize('tolerance', [0.25, 1.0, 4.0])
+@pytest.mark.parametrize('curve', [wave(200), blobs()], ids=['wave', 'trace'])
+def test_stays_within_tolerance(curve, tolerance):
+    positions, ghosts = simplify(*curve, tolerance)
+    assert len(positions) < len(curve[0])
+    assert deviation(curve, (positions, ghosts)) <= tolerance
+
+
+@pytest.mark.parametrize('curve', [wave(200), blobs()], ids=['wave', 'trace'])
+def test_keeps_mirrored_handles(curve):
+    positions, ghosts = simplify(*curve, 1.0)
+    smooth = smooth_anchors(positions)
+    assert smooth.sum() > len(positions) // 2
+    assert np.allclose(
+        positions[smooth, 0] - positions[smooth, 1],
+        positions[smooth, 1] - positions[smooth, 2],
+    )
+
+
+def test_keeps_ghosts_sharp_points_and_ends():
+    before, ghosts_before = wave(200)
+    positions, ghosts = simplify(before, ghosts_before, 4.0)
+    assert ghosts.sum() == ghosts_before.sum()
+    # Kept anchors keep their points; only handle lengths are refit
+    for index in (0, -1, 200 // 3):
+        assert (positions[:, 1] == before[index, 1]).all(axis=1).any()
+    assert np.array_equal(positions[ghosts, 1], before[ghosts_before, 1])
+    assert (positions[:, 0] == positions[:, 1]).all(axis=1).sum() >= 1
+
+
+def test_no_tolerance_changes_nothing():
+    before, ghosts_before = wave()
+    positions, ghosts = simplify(before, ghosts_before, 0)
+    assert np.array_equal(positions, before)
+    assert np.array_equal(ghosts, ghosts_before)